@@ -0,0 +1,320 @@
+"""
+Benchmark de punta a punta de /api/v1/payment/checkout.
+
+Levanta el simulador local de PayU y el servicio de pagos bajo gunicorn (una
+corrida por combinación de clase de worker y cantidad de workers; la clase
+"asyncio" levanta server/app_async.py bajo hypercorn), dispara
+checkouts CC y/o PSE con concurrencia configurable y reporta latencia
+p50/p95/p99, solicitudes por segundo y tasa de error. Los resultados se guardan
+en JSON (con el commit actual) para comparar regresiones entre commits.
+
+Uso (desde microservices/payment_service):
+    python benchmarks/bench_checkout.py --worker-class sync,gthread --workers 2,4 \\
+        --concurrency 32 --duration 30 --method mix
+    python benchmarks/bench_checkout.py --worker-class gthread,asyncio --workers 1 --concurrency 256
+    python benchmarks/bench_checkout.py --compare results/a.json results/b.json
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(SERVICE_DIR, 'src')
+RESULTS_DIR = os.path.join(SERVICE_DIR, 'benchmarks', 'results')
+CHECKOUT_PATH = '/api/v1/payment/checkout'
+
+USER = {
+    "fullName": "APPROVED",
+    "email": "bench@example.com",
+    "contactPhone": "3001234567",
+    "dniNumber": "1020304050",
+    "dniType": "CC",
+    "shippingAddress": {"street1": "Calle 10 # 43-25", "city": "Medellín", "state": "Antioquia",
+                        "country": "CO", "postalCode": "050021", "phone": "3001234567"}
+}
+CARD = {"number": "4097440000000004", "securityCode": "321", "expirationDate": "2030/12",
+        "cardHolderName": "APPROVED", "paymentMethod": "VISA"}
+PSE = {"bankCode": "1022", "userType": "N"}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_http(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timeout esperando {url}")
+
+
+def git_revision():
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR, text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--', '.'], cwd=SERVICE_DIR) != 0
+        return sha + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def start_simulator(args, port):
+    cmd = [
+        sys.executable, '-m', 'simulator.payu_simulator', '--host', '127.0.0.1', '--port', str(port),
+        '--latency', args.gateway_latency, '--decline-rate', str(args.gateway_decline_rate),
+        '--error-rate', str(args.gateway_error_rate), '--timeout-rate', str(args.gateway_timeout_rate),
+        '--reset-rate', str(args.gateway_reset_rate), '--timeout-seconds', str(args.gateway_timeout_seconds),
+        '--seed', '1'
+    ]
+    process = subprocess.Popen(cmd, cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_http(f"http://127.0.0.1:{port}/stats")
+    return process
+
+
+def start_service(args, worker_class, workers, port, gateway_port):
+    env = dict(os.environ)
+    env.update({
+        'PAYU_API_URL': f"http://127.0.0.1:{gateway_port}/payments-api/4.0/service.cgi",
+        'PAYU_READ_TIMEOUT': str(args.read_timeout),
+        'MONGO_URI': args.mongo_uri or env.get('MONGO_URI', 'mongodb://localhost:27017/'),
+        # Sin MongoDB la idempotencia cae a memoria; que el intento falle rápido
+        'MONGO_SERVER_SELECTION_TIMEOUT_MS': env.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '200'),
+        # Toda la carga sale de un usuario y una IP: sin control de admisión salvo que se pida
+        'ADMISSION_ENABLED': env.get('ADMISSION_ENABLED', 'false'),
+    })
+    if worker_class == 'asyncio':
+        # Modo asyncio (server/app_async.py) bajo hypercorn
+        cmd = [
+            sys.executable, '-m', 'hypercorn', 'server.app_async:app',
+            '--bind', f"127.0.0.1:{port}", '--workers', str(workers), '--log-level', 'warning'
+        ]
+        process = subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL)
+        wait_for_http(f"http://127.0.0.1:{port}/")
+        return process
+    cmd = [
+        sys.executable, '-m', 'gunicorn', 'server.app:app',
+        '--bind', f"127.0.0.1:{port}", '--worker-class', worker_class, '--workers', str(workers),
+        '--timeout', str(int(args.read_timeout * 2 + 10)), '--log-level', 'warning'
+    ]
+    if worker_class == 'gthread':
+        cmd += ['--threads', str(args.threads)]
+    elif worker_class in ('gevent', 'eventlet'):
+        cmd += ['--worker-connections', str(args.worker_connections)]
+    process = subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL)
+    wait_for_http(f"http://127.0.0.1:{port}/")
+    return process
+
+
+def stop(process):
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def checkout_body(method, run_id, sequence):
+    order = {"orderId": f"{run_id}-{sequence}", "amount": 125900}
+    if method == 'CC':
+        return {"paymentMethod": "CC", "order": order, "user": USER, "card": CARD}
+    order["responseUrl"] = "http://localhost/payment/result"
+    return {"paymentMethod": "PSE", "order": order, "user": USER, "pse": PSE}
+
+
+def run_load(base_url, methods, concurrency, duration, warmup, request_timeout):
+    """Carga de lazo cerrado: cada hilo envía el siguiente checkout al recibir la respuesta."""
+    run_id = uuid.uuid4().hex[:8]
+    sequence = itertools.count()
+    samples = []
+    samples_lock = threading.Lock()
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+
+    def worker(index):
+        session = requests.Session()
+        local = []
+        method_cycle = itertools.cycle(methods[index % len(methods):] + methods[:index % len(methods)])
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            method = next(method_cycle)
+            body = checkout_body(method, run_id, next(sequence))
+            started = time.perf_counter()
+            try:
+                response = session.post(base_url + CHECKOUT_PATH, json=body, timeout=request_timeout)
+                status = response.status_code
+            except requests.exceptions.RequestException:
+                status = None
+            elapsed = time.perf_counter() - started
+            if now >= start_at:
+                local.append((method, status, elapsed))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(samples, duration):
+    def stats(rows):
+        latencies = sorted(row[2] for row in rows)
+        total = len(rows)
+        ok = sum(1 for row in rows if row[1] == 200)
+        declined = sum(1 for row in rows if row[1] == 400)
+        errors = total - ok - declined
+        return {
+            "requests": total,
+            "rps": round(total / duration, 2),
+            "ok": ok,
+            "declined": declined,
+            "errors": errors,
+            "errorRate": round(errors / total, 4) if total else None,
+            "p50Ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            "p95Ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            "p99Ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            "maxMs": round(latencies[-1] * 1000, 2) if latencies else None
+        }
+
+    summary = {"all": stats(samples)}
+    for method in sorted({row[0] for row in samples}):
+        summary[method] = stats([row for row in samples if row[0] == method])
+    return summary
+
+
+def run_matrix(args):
+    methods = {'cc': ['CC'], 'pse': ['PSE'], 'mix': ['CC', 'PSE']}[args.method]
+    gateway_port = free_port()
+    simulator = start_simulator(args, gateway_port)
+    runs = []
+    try:
+        for worker_class in args.worker_class.split(','):
+            for workers in [int(w) for w in args.workers.split(',')]:
+                port = free_port()
+                service = start_service(args, worker_class, workers, port, gateway_port)
+                try:
+                    samples = run_load(f"http://127.0.0.1:{port}", methods, args.concurrency,
+                                       args.duration, args.warmup, args.read_timeout * 2 + 5)
+                finally:
+                    stop(service)
+                summary = summarize(samples, args.duration)
+                runs.append({"workerClass": worker_class, "workers": workers, "summary": summary})
+                overall = summary["all"]
+                print(f"{worker_class:>8} x{workers:<3} rps={overall['rps']:<9} p50={overall['p50Ms']}ms "
+                      f"p95={overall['p95Ms']}ms p99={overall['p99Ms']}ms errors={overall['errorRate']}")
+    finally:
+        stop(simulator)
+
+    result = {
+        "benchmark": "checkout",
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "parameters": {
+            "method": args.method,
+            "concurrency": args.concurrency,
+            "durationSeconds": args.duration,
+            "warmupSeconds": args.warmup,
+            "threads": args.threads,
+            "gatewayLatency": args.gateway_latency,
+            "gatewayDeclineRate": args.gateway_decline_rate,
+            "gatewayErrorRate": args.gateway_error_rate,
+            "gatewayTimeoutRate": args.gateway_timeout_rate,
+            "gatewayResetRate": args.gateway_reset_rate
+        },
+        "runs": runs
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        output = os.path.join(RESULTS_DIR, f"checkout-{result['revision']}-{stamp}.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+
+def compare(baseline_path, candidate_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    def index(result):
+        return {(run["workerClass"], run["workers"]): run["summary"]["all"] for run in result["runs"]}
+
+    base_runs, cand_runs = index(baseline), index(candidate)
+    print(f"base {baseline['revision']}  vs  candidato {candidate['revision']}")
+    print(f"{'config':<14}{'rps':>28}{'p50 ms':>28}{'p95 ms':>28}{'p99 ms':>28}{'errores':>18}")
+    for key in sorted(set(base_runs) & set(cand_runs)):
+        b, c = base_runs[key], cand_runs[key]
+
+        def cell(field):
+            if b[field] is None or c[field] is None:
+                return f"{b[field]} -> {c[field]}"
+            delta = (c[field] - b[field]) / b[field] * 100 if b[field] else 0.0
+            return f"{b[field]} -> {c[field]} ({delta:+.1f}%)"
+
+        label = f"{key[0]} x{key[1]}"
+        print(f"{label:<14}{cell('rps'):>28}{cell('p50Ms'):>28}{cell('p95Ms'):>28}{cell('p99Ms'):>28}"
+              f"{str(b['errorRate']) + ' -> ' + str(c['errorRate']):>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-class', default='sync,gthread', help='Clases de worker de gunicorn separadas por coma (asyncio usa hypercorn)')
+    parser.add_argument('--workers', default='2,4', help='Cantidades de workers separadas por coma')
+    parser.add_argument('--threads', type=int, default=8, help='Hilos por worker para gthread')
+    parser.add_argument('--worker-connections', type=int, default=200, help='Conexiones por worker para gevent/eventlet')
+    parser.add_argument('--method', choices=['cc', 'pse', 'mix'], default='mix')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--read-timeout', type=float, default=10, help='PAYU_READ_TIMEOUT del servicio')
+    parser.add_argument('--gateway-latency', default='lognormal:0.25,0.4', help='Distribución de latencia del simulador')
+    parser.add_argument('--gateway-decline-rate', type=float, default=0.1)
+    parser.add_argument('--gateway-error-rate', type=float, default=0.0)
+    parser.add_argument('--gateway-timeout-rate', type=float, default=0.0)
+    parser.add_argument('--gateway-reset-rate', type=float, default=0.0)
+    parser.add_argument('--gateway-timeout-seconds', type=float, default=30)
+    parser.add_argument('--mongo-uri', default=None)
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto benchmarks/results/)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CANDIDATO'), help='Compara dos resultados JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run_matrix(args)
+
+
+if __name__ == '__main__':
+    main()
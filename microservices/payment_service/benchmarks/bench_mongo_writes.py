@@ -0,0 +1,130 @@
+"""
+Benchmark: escrituras de pagos en MongoDB, una por llamada vs. PaymentWriteBuffer.
+
+Simula una ráfaga del consumidor: cada pago se crea y luego pasa a PROCESSING y a
+APPROVED/DECLINED, desde varios hilos concurrentes. Compara el camino directo
+(insert_one / update_one por operación) contra el buffer de bulk_write y reporta
+operaciones por segundo y latencia por operación vista por el llamador.
+
+Requiere un mongod local (no usa mongomock: los números deben salir de un servidor
+real). Escribe en una base desechable que se elimina al terminar. El repositorio no
+registra resultados: el buffer sigue desactivado por defecto (PAYMENT_WRITE_BUFFER)
+hasta medirlo contra el mongod de producción.
+
+Uso (desde microservices/payment_service):
+    MONGO_URI=mongodb://localhost:27017/ python benchmarks/bench_mongo_writes.py \\
+        [--payments 5000] [--threads 16] [--batch-size 500] [--max-delay-ms 50]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from pymongo import MongoClient  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+import repository.payment_repository as payment_repository  # noqa: E402
+from repository.payment_repository import PaymentRepository  # noqa: E402
+
+BENCH_DB = 'payment_bench'
+
+
+def make_payment(run, i):
+    return {
+        'payment_id': f'BENCH-{run}-{i}',
+        'order_id': f'ORDER-{i}',
+        'user_id': f'user{i % 500}@example.com',
+        'amount': 10000 + i,
+        'payment_method': 'CC' if i % 3 else 'PSE',
+        'status': 'PENDING',
+        'created_at': datetime.utcnow()
+    }
+
+
+def run_mode(name, buffered, args):
+    payment_repository.Config.MONGO_DB = BENCH_DB
+    payment_repository.Config.PAYMENT_WRITE_BATCH_SIZE = args.batch_size
+    payment_repository.Config.PAYMENT_WRITE_MAX_DELAY_MS = args.max_delay_ms
+    repo = PaymentRepository(buffered=buffered)
+    repo.payments.delete_many({})
+
+    latencies = []
+    lock = threading.Lock()
+    per_thread = args.payments // args.threads
+
+    def worker(t):
+        local = []
+        for i in range(t * per_thread, (t + 1) * per_thread):
+            started = time.perf_counter()
+            repo.create_payment(make_payment(name, i))
+            local.append(time.perf_counter() - started)
+            for status in ('PROCESSING', 'APPROVED' if i % 7 else 'DECLINED'):
+                started = time.perf_counter()
+                repo.update_payment_status(f'BENCH-{name}-{i}', status)
+                local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    repo.flush()
+    elapsed = time.perf_counter() - started
+
+    written = repo.payments.count_documents({'status': {'$in': ['APPROVED', 'DECLINED']}})
+    buffer_stats = repo.write_buffer.stats() if repo.write_buffer else None
+    repo.close()
+
+    latencies.sort()
+    return {
+        'mode': name,
+        'operations': len(latencies),
+        'paymentsFinalized': written,
+        'seconds': round(elapsed, 3),
+        'opsPerSecond': round(len(latencies) / elapsed, 1),
+        'p50Ms': round(statistics.median(latencies) * 1000, 2),
+        'p99Ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        'buffer': buffer_stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-delay-ms', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help='Imprime los resultados como JSON')
+    args = parser.parse_args()
+
+    uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+    try:
+        MongoClient(uri, serverSelectionTimeoutMS=2000).admin.command('ping')
+    except PyMongoError as e:
+        sys.exit(f"No hay un mongod disponible en {uri}: {e}")
+
+    results = [run_mode('direct', False, args), run_mode('buffered', True, args)]
+    MongoClient(uri).drop_database(BENCH_DB)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.payments} pagos x 3 operaciones, {args.threads} hilos, lote {args.batch_size}, "
+          f"espera máx. {args.max_delay_ms} ms")
+    for r in results:
+        print(f"{r['mode']:9s} {r['opsPerSecond']:10.1f} ops/s  p50 {r['p50Ms']:7.2f} ms  "
+              f"p99 {r['p99Ms']:7.2f} ms  finalizados {r['paymentsFinalized']}")
+    print(f"aceleración x{results[1]['opsPerSecond'] / results[0]['opsPerSecond']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: cálculo de impuestos y firmas PayU por lote vs. escalar.
+
+Verifica que las variantes por lote produzcan exactamente los mismos valores que
+calculate_tax_values / generate_payu_signature y mide el tiempo de ambas para un
+volumen de conciliación nocturna.
+
+Uso (desde microservices/payment_service):
+    python benchmarks/bench_payu_batch.py [--count 200000] [--workers 4]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.payu_utils import (  # noqa: E402
+    calculate_tax_values, generate_payu_signature,
+    calculate_tax_values_batch, generate_payu_signatures_batch
+)
+
+MERCHANT_ID = "508029"
+MD5_KEY = "4Vj8eK4rloUO70w0KzSXXXX"
+CURRENCY = "COP"
+
+
+def make_dataset(count, seed):
+    rng = random.Random(seed)
+    amounts = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            amounts.append(rng.randint(1000, 2000000))               # pesos enteros
+        elif kind == 1:
+            amounts.append(rng.randint(100, 200000000) / 100)        # con centavos
+        elif kind == 2:
+            amounts.append(rng.randint(1, 99999) + 0.005)            # casos de medio centavo
+        else:
+            amounts.append(rng.uniform(1, 5000000))
+    references = [f"ORDER-CC-{100000 + i}" for i in range(count)]
+    return amounts, references
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Imprime los resultados como JSON')
+    args = parser.parse_args()
+
+    amounts, references = make_dataset(args.count, args.seed)
+
+    scalar_taxes, t_scalar_tax = timed(lambda: [calculate_tax_values(a) for a in amounts])
+    batch_taxes, t_batch_tax = timed(lambda: calculate_tax_values_batch(amounts))
+
+    tx_values = batch_taxes["TX_VALUE"]
+    scalar_sigs, t_scalar_sig = timed(lambda: [
+        generate_payu_signature(MERCHANT_ID, v, CURRENCY, r, MD5_KEY) for v, r in zip(tx_values, references)
+    ])
+    batch_sigs, t_batch_sig = timed(lambda: generate_payu_signatures_batch(
+        MERCHANT_ID, tx_values, CURRENCY, references, MD5_KEY
+    ))
+    pool_sigs, t_pool_sig = None, None
+    if args.workers > 1:
+        pool_sigs, t_pool_sig = timed(lambda: generate_payu_signatures_batch(
+            MERCHANT_ID, tx_values, CURRENCY, references, MD5_KEY,
+            workers=args.workers, chunk_size=max(1, args.count // (args.workers * 4))
+        ))
+
+    # Paridad exacta con las funciones escalares
+    for i, expected in enumerate(scalar_taxes):
+        for key in ("TX_VALUE", "TX_TAX", "TX_TAX_RETURN_BASE"):
+            assert batch_taxes[key][i] == expected[key], (i, key, amounts[i])
+    assert batch_sigs == scalar_sigs
+    assert pool_sigs is None or pool_sigs == scalar_sigs
+
+    results = {
+        "count": args.count,
+        "workers": args.workers,
+        "taxScalarSeconds": round(t_scalar_tax, 4),
+        "taxBatchSeconds": round(t_batch_tax, 4),
+        "taxSpeedup": round(t_scalar_tax / t_batch_tax, 2),
+        "signatureScalarSeconds": round(t_scalar_sig, 4),
+        "signatureBatchSeconds": round(t_batch_sig, 4),
+        "signatureBatchSpeedup": round(t_scalar_sig / t_batch_sig, 2)
+    }
+    if t_pool_sig is not None:
+        results["signaturePoolSeconds"] = round(t_pool_sig, 4)
+        results["signaturePoolSpeedup"] = round(t_scalar_sig / t_pool_sig, 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.count} transacciones, paridad exacta verificada")
+    print(f"impuestos  escalar {t_scalar_tax:8.3f}s  lote {t_batch_tax:8.3f}s  x{results['taxSpeedup']}")
+    print(f"firmas     escalar {t_scalar_sig:8.3f}s  lote {t_batch_sig:8.3f}s  x{results['signatureBatchSpeedup']}")
+    if t_pool_sig is not None:
+        print(f"firmas     escalar {t_scalar_sig:8.3f}s  pool({args.workers}) {t_pool_sig:8.3f}s  x{results['signaturePoolSpeedup']}")
+
+
+if __name__ == '__main__':
+    main()
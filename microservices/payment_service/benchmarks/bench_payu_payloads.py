@@ -0,0 +1,218 @@
+"""
+Micro-benchmark: construcción y serialización de payloads SUBMIT_TRANSACTION.
+
+Compara el camino anterior (dict anidado completo por transacción + json estándar,
+como hacía requests con json=payload) contra PayUPayloadBuilder (plantillas
+precompiladas + orjson directo a bytes). Reporta CPU por checkout y asignaciones
+de memoria por checkout (pico transitorio medido con tracemalloc).
+
+Uso (desde microservices/payment_service):
+    python benchmarks/bench_payu_payloads.py [--iterations 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.payu_payloads import PayUPayloadBuilder, loads, orjson  # noqa: E402
+from utils.payu_utils import generate_payu_signature, calculate_tax_values  # noqa: E402
+
+API_KEY = "4Vj8eK4rloUO70w0KzSXXXX"
+MERCHANT_ID = "508029"
+ACCOUNT_ID = "512321"
+MD5_KEY = "4Vj8eK4rloUO70w0KzSXXXX"
+CURRENCY = "COP"
+
+ORDER = {"orderId": "184512", "amount": 125900, "responseUrl": "http://localhost/payment/result"}
+USER = {
+    "fullName": "Ana María Restrepo",
+    "email": "ana.restrepo@example.com",
+    "contactPhone": "3001234567",
+    "dniNumber": "1020304050",
+    "shippingAddress": {
+        "street1": "Calle 10 # 43-25", "city": "Medellín", "state": "Antioquia",
+        "country": "CO", "postalCode": "050021", "phone": "3001234567"
+    }
+}
+CARD = {"number": "4097440000000004", "securityCode": "321", "expirationDate": "2030/12",
+        "cardHolderName": "APPROVED", "paymentMethod": "VISA"}
+PSE = {"bankCode": "1022", "userType": "N"}
+CLIENT = {"ipAddress": "10.0.0.15", "userAgent": "Mozilla/5.0 (X11; Linux x86_64)",
+          "deviceSessionId": "vghs6tvkcle931686k1900o6e1", "cookie": "pt1t38347bs6jc9ruv2ecpv7o2"}
+
+
+def legacy_cc(order_data, user_data, card_data, client_data):
+    """Réplica del build_cc_payload anterior, incluida la serialización de requests."""
+    amount = order_data['amount']
+    reference_code = f"ORDER-CC-{order_data['orderId']}"
+    calculated_values = calculate_tax_values(amount)
+    signature = generate_payu_signature(
+        MERCHANT_ID, calculated_values['TX_VALUE'], CURRENCY, reference_code, MD5_KEY
+    )
+    payload = {
+        "test": True,
+        "language": "es",
+        "command": "SUBMIT_TRANSACTION",
+        "merchant": {"apiKey": API_KEY, "apiLogin": API_KEY},
+        "transaction": {
+            "type": "AUTHORIZATION_AND_CAPTURE",
+            "paymentMethod": card_data.get('paymentMethod', 'VISA'),
+            "paymentCountry": "CO",
+            "deviceSessionId": client_data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
+            "ipAddress": client_data.get('ipAddress', '127.0.0.1'),
+            "cookie": client_data.get('cookie', 'SIMULATED_COOKIE'),
+            "userAgent": client_data.get('userAgent', 'SIMULATED_USER_AGENT'),
+            "order": {
+                "accountId": ACCOUNT_ID,
+                "referenceCode": reference_code,
+                "description": f"Bookstore purchase - CC Order #{order_data['orderId']}",
+                "language": "es",
+                "signature": signature,
+                "additionalValues": {
+                    "TX_VALUE": {"value": calculated_values['TX_VALUE'], "currency": CURRENCY},
+                    "TX_TAX": {"value": calculated_values['TX_TAX'], "currency": CURRENCY},
+                    "TX_TAX_RETURN_BASE": {"value": calculated_values['TX_TAX_RETURN_BASE'], "currency": CURRENCY}
+                },
+                "buyer": {
+                    "fullName": user_data['fullName'],
+                    "emailAddress": user_data['email'],
+                    "contactPhone": user_data['contactPhone'],
+                    "dniNumber": user_data['dniNumber'],
+                    "shippingAddress": user_data['shippingAddress']
+                }
+            },
+            "creditCard": {
+                "number": card_data['number'],
+                "securityCode": card_data['securityCode'],
+                "expirationDate": card_data['expirationDate'],
+                "name": card_data['cardHolderName']
+            },
+            "payer": {
+                "fullName": card_data['cardHolderName'],
+                "emailAddress": user_data['email'],
+                "contactPhone": user_data['contactPhone'],
+                "dniNumber": user_data['dniNumber'],
+                "billingAddress": user_data['shippingAddress']
+            }
+        }
+    }
+    # requests.post(json=...) usa complexjson.dumps(payload, allow_nan=False) y luego encode
+    return json.dumps(payload, allow_nan=False).encode('utf-8')
+
+
+def legacy_pse(order_data, user_data, pse_data, client_data):
+    """Réplica del build_pse_payload anterior, incluida la serialización de requests."""
+    amount = order_data['amount']
+    reference_code = f"ORDER-PSE-{order_data['orderId']}"
+    calculated_values = calculate_tax_values(amount)
+    signature = generate_payu_signature(
+        MERCHANT_ID, calculated_values['TX_VALUE'], CURRENCY, reference_code, MD5_KEY
+    )
+    payload = {
+        "test": True,
+        "language": "es",
+        "command": "SUBMIT_TRANSACTION",
+        "merchant": {"apiKey": API_KEY, "apiLogin": API_KEY},
+        "transaction": {
+            "type": "AUTHORIZATION_AND_CAPTURE",
+            "paymentMethod": "PSE",
+            "paymentCountry": "CO",
+            "deviceSessionId": client_data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
+            "ipAddress": client_data.get('ipAddress', '127.0.0.1'),
+            "cookie": client_data.get('cookie', 'SIMULATED_COOKIE'),
+            "userAgent": client_data.get('userAgent', 'SIMULATED_USER_AGENT'),
+            "order": {
+                "accountId": ACCOUNT_ID,
+                "referenceCode": reference_code,
+                "description": f"Bookstore purchase - PSE Order #{order_data['orderId']}",
+                "language": "es",
+                "signature": signature,
+                "notifyUrl": order_data.get('notifyUrl', 'http://yourdomain.com/payu/notify'),
+                "additionalValues": {
+                    "TX_VALUE": {"value": calculated_values['TX_VALUE'], "currency": CURRENCY},
+                    "TX_TAX": {"value": calculated_values['TX_TAX'], "currency": CURRENCY},
+                    "TX_TAX_RETURN_BASE": {"value": calculated_values['TX_TAX_RETURN_BASE'], "currency": CURRENCY}
+                },
+                "buyer": {
+                    "fullName": user_data['fullName'],
+                    "emailAddress": user_data['email'],
+                    "contactPhone": user_data['contactPhone'],
+                    "dniNumber": user_data['dniNumber'],
+                    "shippingAddress": user_data['shippingAddress']
+                }
+            },
+            "payer": {
+                "fullName": user_data['fullName'],
+                "emailAddress": user_data['email'],
+                "contactPhone": user_data['contactPhone'],
+                "dniNumber": user_data['dniNumber'],
+                "dniType": user_data.get('dniType', 'CC'),
+                "billingAddress": user_data['shippingAddress']
+            },
+            "extraParameters": {
+                "RESPONSE_URL": order_data['responseUrl'],
+                "FINANCIAL_INSTITUTION_CODE": pse_data['bankCode'],
+                "USER_TYPE": pse_data['userType']
+            }
+        }
+    }
+    return json.dumps(payload, allow_nan=False).encode('utf-8')
+
+
+def measure(label, fn, args, iterations):
+    fn(*args)  # calentamiento
+    seconds = min(timeit.repeat(lambda: fn(*args), number=iterations, repeat=5))
+    us_per_call = seconds / iterations * 1e6
+
+    # Pico de memoria transitoria por llamada (dicts intermedios + buffer serializado)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(200):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+        del result
+    tracemalloc.stop()
+    peaks.sort()
+
+    return {"name": label, "usPerCall": round(us_per_call, 2),
+            "peakBytesPerCall": peaks[len(peaks) // 2]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--json', action='store_true', help='Imprime los resultados como JSON')
+    args = parser.parse_args()
+
+    builder = PayUPayloadBuilder(API_KEY, MERCHANT_ID, ACCOUNT_ID, MD5_KEY, CURRENCY)
+
+    # Ambos caminos deben producir el mismo documento
+    assert loads(builder.build_cc(ORDER, USER, CARD, CLIENT)) == json.loads(legacy_cc(ORDER, USER, CARD, CLIENT))
+    assert loads(builder.build_pse(ORDER, USER, PSE, CLIENT)) == json.loads(legacy_pse(ORDER, USER, PSE, CLIENT))
+
+    results = [
+        measure("cc/legacy", legacy_cc, (ORDER, USER, CARD, CLIENT), args.iterations),
+        measure("cc/builder", builder.build_cc, (ORDER, USER, CARD, CLIENT), args.iterations),
+        measure("pse/legacy", legacy_pse, (ORDER, USER, PSE, CLIENT), args.iterations),
+        measure("pse/builder", builder.build_pse, (ORDER, USER, PSE, CLIENT), args.iterations),
+    ]
+
+    if args.json:
+        print(json.dumps({"encoder": "orjson" if orjson else "json", "results": results}, indent=2))
+        return
+
+    print(f"encoder: {'orjson' if orjson else 'json (orjson no instalado)'}")
+    print(f"{'caso':<14}{'us/checkout':>14}{'pico bytes/checkout':>22}")
+    for row in results:
+        print(f"{row['name']:<14}{row['usPerCall']:>14}{row['peakBytesPerCall']:>22}")
+
+
+if __name__ == '__main__':
+    main()
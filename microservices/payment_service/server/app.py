@@ -1,6 +1,16 @@
 import os
-from flask import Flask, jsonify
-from src.routes.payment_routes import payment_bp 
+import sys
+from flask import Flask, Response, jsonify
+
+# Los módulos del servicio se importan desde src/ (igual que en la imagen Docker,
+# donde src/ se copia en /app)
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if os.path.isdir(SRC_DIR) and SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from routes.payment_routes import payment_bp 
+from events.cache_invalidation import start_cache_invalidation
+from utils.metrics import metrics_payload
 
 # Las credenciales se definen como variables de entorno
 # Usar credenciales de Sandbox de PayU para pruebas
@@ -21,10 +31,18 @@ def health_check():
     """Endpoint de verificación de salud."""
     return jsonify({"status": "Payment Service Operational"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas Prometheus agregadas de todos los workers."""
+    body, content_type = metrics_payload()
+    return Response(body, mimetype=content_type)
+
 if __name__ == '__main__':
     # Usar un try-except simple para garantizar que la app inicia
     try:
         print(f"Starting Payment Service on port {SERVICE_PORT}...")
+        # Con gunicorn lo arranca post_worker_init (gunicorn_conf.py)
+        start_cache_invalidation()
         app.run(host='0.0.0.0', port=SERVICE_PORT, debug=True)
     except Exception as e:
         print(f"Failed to start server: {e}")
\ No newline at end of file
@@ -0,0 +1,57 @@
+import os
+import sys
+from quart import Quart, Response, jsonify
+
+# Modo asyncio del servicio: mismas rutas y respuestas que server/app.py, pero
+# cada checkout es una corrutina (aiohttp para PayU, motor para MongoDB), así que
+# un proceso sostiene cientos de llamadas al gateway en curso.
+# Ejecutar con: hypercorn server.app_async:app --bind 0.0.0.0:8084
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if os.path.isdir(SRC_DIR) and SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from routes.payment_routes_async import payment_bp
+from events.cache_invalidation import start_cache_invalidation, stop_cache_invalidation
+from utils.metrics import metrics_payload
+
+# Las credenciales se definen como variables de entorno
+# Usar credenciales de Sandbox de PayU para pruebas
+os.environ['PAYU_API_KEY'] = "4Vj8eK4rloUO70w0KzSXXXX"
+os.environ['PAYU_MD5_KEY'] = "4Vj8eK4rloUO70w0KzSXXXX"
+os.environ['PAYU_MERCHANT_ID'] = "508029"
+os.environ['PAYU_ACCOUNT_ID'] = "512321"
+
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8084))
+
+app = Quart(__name__)
+
+# Registrar el Blueprint para incluir las rutas bajo /api/v1/payment
+app.register_blueprint(payment_bp, url_prefix='/api/v1/payment')
+
+@app.before_serving
+async def start_background():
+    # Listener de invalidación del cache de pagos de este proceso
+    start_cache_invalidation()
+
+@app.after_serving
+async def stop_background():
+    stop_cache_invalidation()
+
+@app.route('/', methods=['GET'])
+async def health_check():
+    """Endpoint de verificación de salud."""
+    return jsonify({"status": "Payment Service Operational"}), 200
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Métricas Prometheus agregadas de todos los workers."""
+    body, content_type = metrics_payload()
+    return Response(body, mimetype=content_type)
+
+if __name__ == '__main__':
+    try:
+        print(f"Starting Payment Service (asyncio) on port {SERVICE_PORT}...")
+        app.run(host='0.0.0.0', port=SERVICE_PORT)
+    except Exception as e:
+        print(f"Failed to start server: {e}")
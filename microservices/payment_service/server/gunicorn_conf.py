@@ -0,0 +1,27 @@
+import os
+import shutil
+
+# Configuración de gunicorn para el servicio de pagos.
+# Las métricas Prometheus de todos los workers se agregan desde archivos en
+# PROMETHEUS_MULTIPROC_DIR; el directorio se limpia al arrancar el master y los
+# valores de un worker que termina se marcan como muertos.
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+
+def on_starting(server):
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Los hilos de fondo se arrancan en cada worker ya creado: uno arrancado al
+    # importar la app en el master (preload_app) no sobrevive al fork
+    from events.cache_invalidation import start_cache_invalidation
+    start_cache_invalidation()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
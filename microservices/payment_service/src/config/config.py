@@ -22,9 +22,93 @@ class Config:
     ORDER_QUEUE = 'order_events'
     PAYMENT_EXCHANGE = 'payment_exchange'
     
+    # Shared publisher connection (utils.rabbitmq_manager): confirm channels per process,
+    # seconds to wait for a broker confirm, unconfirmed publishes allowed per process
+    RABBITMQ_PUBLISH_CHANNELS = int(os.getenv('RABBITMQ_PUBLISH_CHANNELS', 4))
+    RABBITMQ_PUBLISH_CONFIRM_TIMEOUT = float(os.getenv('RABBITMQ_PUBLISH_CONFIRM_TIMEOUT', 5))
+    RABBITMQ_PUBLISH_MAX_PENDING = int(os.getenv('RABBITMQ_PUBLISH_MAX_PENDING', 10000))
+    RABBITMQ_RECONNECT_MAX_DELAY = int(os.getenv('RABBITMQ_RECONNECT_MAX_DELAY', 30))
+    
+    # Priority lanes for payment requests (events.payment_lanes): payment.request.<lane> is
+    # routed to PAYMENT_QUEUE.<lane>; the legacy payment.request key still feeds PAYMENT_QUEUE,
+    # consumed as lane "default". The consumer declares the lane queues, so start it before
+    # enabling PAYMENT_LANE_ROUTING in publishers (off by default; requests are published
+    # mandatory, so a lane key with no bound queue fails the publish instead of being dropped).
+    # Weights share the consumer workers; prefetch and concurrency entries override
+    # PAYMENT_CONSUMER_PREFETCH and the pool size
+    PAYMENT_LANES = os.getenv('PAYMENT_LANES', 'cc,pse,refund')
+    PAYMENT_LANE_ROUTING = os.getenv('PAYMENT_LANE_ROUTING', 'false').lower() == 'true'
+    PAYMENT_LANE_WEIGHTS = os.getenv('PAYMENT_LANE_WEIGHTS', 'cc:6,pse:2,refund:1,default:3')
+    PAYMENT_LANE_PREFETCH = os.getenv('PAYMENT_LANE_PREFETCH', '')
+    PAYMENT_LANE_CONCURRENCY = os.getenv('PAYMENT_LANE_CONCURRENCY', '')
+    PAYMENT_LANE_DEPTH_INTERVAL = int(os.getenv('PAYMENT_LANE_DEPTH_INTERVAL', 15))  # seconds, 0 disables
+    
+    # Retry lanes for failed payment requests (events.retry_lanes): one TTL queue per delay
+    # tier and request queue, dead-lettering back into that queue, then the dead-letter queue once
+    # PAYMENT_RETRY_MAX_ATTEMPTS deliveries have failed (python -m events.dead_letter_replay)
+    PAYMENT_RETRY_EXCHANGE = 'payment_retry'
+    PAYMENT_DEAD_LETTER_QUEUE = 'payment_requests.dlq'
+    PAYMENT_RETRY_DELAYS_MS = [
+        int(delay) for delay in os.getenv('PAYMENT_RETRY_DELAYS_MS', '5000,30000,120000,600000').split(',')
+        if delay.strip()
+    ]
+    PAYMENT_RETRY_MAX_ATTEMPTS = int(os.getenv('PAYMENT_RETRY_MAX_ATTEMPTS', 5))
+    
+    # Payment consumer concurrency (0 workers = process messages inline on the connection thread)
+    PAYMENT_CONSUMER_PREFETCH = int(os.getenv('PAYMENT_CONSUMER_PREFETCH', 1))
+    PAYMENT_CONSUMER_WORKERS = int(os.getenv('PAYMENT_CONSUMER_WORKERS', 0))
+    PAYMENT_CONSUMER_DRAIN_TIMEOUT = int(os.getenv('PAYMENT_CONSUMER_DRAIN_TIMEOUT', 30))
+    # Port for the consumer's own /metrics endpoint (0 disables it)
+    PAYMENT_CONSUMER_METRICS_PORT = int(os.getenv('PAYMENT_CONSUMER_METRICS_PORT', 0))
+    
     # MongoDB Configuration
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
     MONGO_DB = os.getenv('MONGO_DB', 'payment_db')
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    
+    # Buffered payment writes (bulk_write batches flushed by size or deadline)
+    PAYMENT_WRITE_BUFFER = os.getenv('PAYMENT_WRITE_BUFFER', 'false').lower() == 'true'
+    PAYMENT_WRITE_BATCH_SIZE = int(os.getenv('PAYMENT_WRITE_BATCH_SIZE', 500))
+    PAYMENT_WRITE_MAX_DELAY_MS = int(os.getenv('PAYMENT_WRITE_MAX_DELAY_MS', 50))
+    PAYMENT_WRITE_MAX_PENDING = int(os.getenv('PAYMENT_WRITE_MAX_PENDING', 5000))
+    # Seconds a caller waits for its buffered write before giving up (the write may still land)
+    PAYMENT_WRITE_TIMEOUT = float(os.getenv('PAYMENT_WRITE_TIMEOUT', 10))
+    
+    # Payment read cache (0 entries disables it; negative TTL 0 disables caching unknown ids)
+    PAYMENT_CACHE_SIZE = int(os.getenv('PAYMENT_CACHE_SIZE', 10000))
+    PAYMENT_CACHE_TTL = float(os.getenv('PAYMENT_CACHE_TTL', 5))
+    PAYMENT_CACHE_NEGATIVE_TTL = float(os.getenv('PAYMENT_CACHE_NEGATIVE_TTL', 1))
+    PAYMENT_CACHE_EVENTS = os.getenv('PAYMENT_CACHE_EVENTS', 'false').lower() == 'true'
+    PAYMENT_CACHE_EVENT_KEYS = os.getenv(
+        'PAYMENT_CACHE_EVENT_KEYS', 'payment.response,payment.completed,payment.failed,payment.refunded'
+    )
+    
+    # Materialized payment rollups (per hour, status and payment method)
+    PAYMENT_ROLLUPS = os.getenv('PAYMENT_ROLLUPS', 'true').lower() == 'true'
+    
+    # Transactional outbox for payment events (needs a MongoDB replica set) and its relay
+    PAYMENT_OUTBOX = os.getenv('PAYMENT_OUTBOX', 'false').lower() == 'true'
+    PAYMENT_OUTBOX_BATCH_SIZE = int(os.getenv('PAYMENT_OUTBOX_BATCH_SIZE', 500))
+    PAYMENT_OUTBOX_POLL_INTERVAL_MS = int(os.getenv('PAYMENT_OUTBOX_POLL_INTERVAL_MS', 200))
+    PAYMENT_OUTBOX_LEASE_SECONDS = int(os.getenv('PAYMENT_OUTBOX_LEASE_SECONDS', 30))
+    
+    # Reconciliation of PENDING payments against PayU (python -m workers.reconciliation)
+    RECONCILIATION_BATCH_SIZE = int(os.getenv('RECONCILIATION_BATCH_SIZE', 500))
+    RECONCILIATION_CONCURRENCY = int(os.getenv('RECONCILIATION_CONCURRENCY', 8))
+    RECONCILIATION_RATE_LIMIT = float(os.getenv('RECONCILIATION_RATE_LIMIT', 20))  # PayU queries per second
+    RECONCILIATION_MIN_AGE_SECONDS = int(os.getenv('RECONCILIATION_MIN_AGE_SECONDS', 300))
+    RECONCILIATION_INTERVAL_SECONDS = int(os.getenv('RECONCILIATION_INTERVAL_SECONDS', 60))
+    RECONCILIATION_METRICS_PORT = int(os.getenv('RECONCILIATION_METRICS_PORT', 0))
+    
+    # PayU confirmations: webhook queue (group-committed inserts) and python -m workers.confirmations
+    PAYMENT_CONFIRMATION_BATCH_SIZE = int(os.getenv('PAYMENT_CONFIRMATION_BATCH_SIZE', 500))
+    PAYMENT_CONFIRMATION_WRITE_MAX_DELAY_MS = int(os.getenv('PAYMENT_CONFIRMATION_WRITE_MAX_DELAY_MS', 5))
+    PAYMENT_CONFIRMATION_WRITE_MAX_PENDING = int(os.getenv('PAYMENT_CONFIRMATION_WRITE_MAX_PENDING', 10000))
+    PAYMENT_CONFIRMATION_WRITE_TIMEOUT = float(os.getenv('PAYMENT_CONFIRMATION_WRITE_TIMEOUT', 5))
+    PAYMENT_CONFIRMATION_POLL_INTERVAL_MS = int(os.getenv('PAYMENT_CONFIRMATION_POLL_INTERVAL_MS', 200))
+    PAYMENT_CONFIRMATION_RETRY_SECONDS = int(os.getenv('PAYMENT_CONFIRMATION_RETRY_SECONDS', 30))
+    PAYMENT_CONFIRMATION_MAX_ATTEMPTS = int(os.getenv('PAYMENT_CONFIRMATION_MAX_ATTEMPTS', 10))
+    PAYMENT_CONFIRMATION_METRICS_PORT = int(os.getenv('PAYMENT_CONFIRMATION_METRICS_PORT', 0))
     
     # Security
     JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
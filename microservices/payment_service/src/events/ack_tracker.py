@@ -0,0 +1,69 @@
+"""
+Ordered acknowledgement tracking for concurrent consumers
+Messages can finish out of order when processed by a worker pool; acks are
+released in delivery order so a single multiple=True ack covers a whole run.
+A consumer reading several queues on one channel can also settle the finished
+deliveries stuck behind a slow one individually (settle_waiting), so one queue's
+slow message does not hold the prefetch window of the others.
+"""
+from collections import deque
+
+
+class AckTracker:
+    """Tracks delivery tags on one channel and computes contiguous ack ranges"""
+
+    ACK = 'ack'
+    NACK = 'nack'
+    SETTLED = 'settled'
+
+    def __init__(self):
+        self._order = deque()
+        self._state = {}
+
+    def __len__(self):
+        return len(self._state)
+
+    def delivered(self, delivery_tag):
+        """Register a delivery (tags arrive in increasing order on a channel)"""
+        self._order.append(delivery_tag)
+        self._state[delivery_tag] = None
+
+    def complete(self, delivery_tag, outcome=ACK):
+        """
+        Mark a delivery as finished
+
+        Args:
+            delivery_tag: Tag of the finished delivery
+            outcome: AckTracker.ACK, or AckTracker.NACK if it was already nacked individually
+
+        Returns:
+            Highest delivery tag that can now be acked with multiple=True, or None
+        """
+        if delivery_tag not in self._state:
+            return None
+        self._state[delivery_tag] = outcome
+
+        ack_upto = None
+        while self._order and self._state[self._order[0]] is not None:
+            tag = self._order.popleft()
+            if self._state.pop(tag) == self.ACK:
+                # multiple=True must reference an outstanding tag, never a nacked one
+                ack_upto = tag
+        return ack_upto
+
+    def settle_waiting(self):
+        """
+        Finished deliveries waiting behind an unfinished earlier one
+
+        Returns:
+            Their delivery tags, now marked settled: the caller acks each one individually
+        """
+        waiting = [tag for tag, state in self._state.items() if state == self.ACK]
+        for tag in waiting:
+            self._state[tag] = self.SETTLED
+        return waiting
+
+    def reset(self):
+        """Forget all deliveries (channel closed: the broker requeues them)"""
+        self._order.clear()
+        self._state.clear()
@@ -0,0 +1,138 @@
+"""
+Payment cache invalidation from RabbitMQ events
+Each process binds its own exclusive queue to the payment exchange so status changes
+made by other workers or services evict the local PaymentCache entries.
+"""
+import pika
+import json
+import logging
+import threading
+from config.config import Config
+from repository.payment_cache import get_payment_cache
+
+logger = logging.getLogger(__name__)
+
+_invalidator = None
+_invalidator_lock = threading.Lock()
+
+
+def _payment_ids(body):
+    """Extract (payment_id, order_id) from a flat or {'data': {...}} wrapped event"""
+    message = json.loads(body)
+    if isinstance(message.get('data'), dict):
+        message = message['data']
+    return message.get('payment_id'), message.get('order_id')
+
+
+class PaymentCacheInvalidator:
+    """Background listener that evicts cache entries named by payment events"""
+
+    def __init__(self, cache, routing_keys=None):
+        """
+        Args:
+            cache: PaymentCache to invalidate
+            routing_keys: Routing keys to bind (defaults to PAYMENT_CACHE_EVENT_KEYS)
+        """
+        self.config = Config()
+        self.cache = cache
+        keys = self.config.PAYMENT_CACHE_EVENT_KEYS if routing_keys is None else routing_keys
+        self.routing_keys = [k.strip() for k in keys.split(',') if k.strip()] if isinstance(keys, str) else list(keys)
+        self._stop = threading.Event()
+        self._thread = None
+        self.received = 0
+
+    def start(self):
+        """Start the listener thread (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='payment-cache-invalidator', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                self._consume()
+                delay = 1
+            except Exception as e:
+                # Entries still expire by TTL while the listener is down
+                logger.warning(f"Cache invalidation listener disconnected: {str(e)}; retrying in {delay}s")
+                self.cache.clear()
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30)
+
+    def _consume(self):
+        credentials = pika.PlainCredentials(self.config.RABBITMQ_USER, self.config.RABBITMQ_PASS)
+        parameters = pika.ConnectionParameters(
+            host=self.config.RABBITMQ_HOST,
+            port=self.config.RABBITMQ_PORT,
+            virtual_host=self.config.RABBITMQ_VHOST,
+            credentials=credentials,
+            heartbeat=60
+        )
+        connection = pika.BlockingConnection(parameters)
+        try:
+            channel = connection.channel()
+            channel.exchange_declare(
+                exchange=self.config.PAYMENT_EXCHANGE,
+                exchange_type='topic',
+                durable=True
+            )
+            queue = channel.queue_declare(queue='', exclusive=True, auto_delete=True).method.queue
+            for routing_key in self.routing_keys:
+                channel.queue_bind(exchange=self.config.PAYMENT_EXCHANGE, queue=queue, routing_key=routing_key)
+            # Events may have been missed while disconnected
+            self.cache.clear()
+            logger.info(f"Cache invalidation listener bound to {self.routing_keys}")
+
+            for method, properties, body in channel.consume(queue, auto_ack=True, inactivity_timeout=1):
+                if self._stop.is_set():
+                    break
+                if method is None:
+                    continue
+                self._handle(body)
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def _handle(self, body):
+        try:
+            payment_id, order_id = _payment_ids(body)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable payment event: {str(e)}")
+            return
+        self.received += 1
+        if payment_id:
+            self.cache.invalidate_payment(payment_id, order_id)
+        elif order_id:
+            self.cache.invalidate_order(order_id)
+
+
+def start_cache_invalidation():
+    """
+    Start this process's listener for the shared PaymentCache (idempotent)
+
+    The server calls it once the worker process exists (gunicorn post_worker_init,
+    Quart before_serving), never at import: a thread started while a preloaded
+    gunicorn master imports the app does not survive the fork into the workers.
+
+    Returns:
+        The running PaymentCacheInvalidator, or None when caching or cache events are off
+    """
+    global _invalidator
+    cache = get_payment_cache()
+    if cache is None or not Config.PAYMENT_CACHE_EVENTS:
+        return None
+    with _invalidator_lock:
+        if _invalidator is None:
+            _invalidator = PaymentCacheInvalidator(cache)
+        return _invalidator.start()
+
+
+def stop_cache_invalidation():
+    with _invalidator_lock:
+        if _invalidator is not None:
+            _invalidator.stop()
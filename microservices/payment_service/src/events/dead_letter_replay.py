@@ -0,0 +1,207 @@
+"""
+Replay of dead-lettered payment requests
+Moves requests parked in PAYMENT_DEAD_LETTER_QUEUE back to the request queue they
+failed in (x-payment-queue: a priority lane, or PAYMENT_QUEUE) in batches.
+Each batch is read without acking, re-published through RabbitMQManager with
+publisher confirms, and only the confirmed messages are acked off the dead-letter
+queue, so a replay interrupted at any point loses nothing. A replayed request
+starts over with a fresh attempt budget (x-payment-replays counts the replays).
+
+At most the messages queued when the replay starts are moved, so requests that
+fail again and come back through the retry lanes are not replayed twice in one run.
+
+Run from src/ once the cause of the failures is fixed:
+    python -m events.dead_letter_replay [--batch-size 100] [--limit N] [--dry-run]
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from collections import Counter
+import pika
+from config.config import Config
+from events.payment_lanes import declare_lane_topology, load_lanes
+from events.retry_lanes import ERROR_HEADER, QUEUE_HEADER, declare_retry_topology, replay_properties
+from utils.rabbitmq_manager import RabbitMQManager
+
+logger = logging.getLogger(__name__)
+
+
+class DeadLetterReplayer:
+    """Batched, confirmed move of dead-lettered payment requests back to their request queues"""
+
+    def __init__(self, batch_size=100, limit=None, manager=None):
+        """
+        Args:
+            batch_size: Messages read, re-published and acked per batch
+            limit: Maximum messages to replay (defaults to the dead-letter queue depth)
+            manager: RabbitMQManager used to re-publish with confirms
+        """
+        self.config = Config()
+        self.batch_size = max(1, batch_size)
+        self.limit = limit
+        self.manager = manager or RabbitMQManager(self.config, max_pending=self.batch_size)
+        self.lanes = load_lanes(self.config, prefetch=1, concurrency=1)
+        self.queues = [lane.queue for lane in self.lanes]
+        self.connection = None
+        self.channel = None
+
+        self._stop = threading.Event()
+        self.replayed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def connect(self):
+        credentials = pika.PlainCredentials(self.config.RABBITMQ_USER, self.config.RABBITMQ_PASS)
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(
+            host=self.config.RABBITMQ_HOST,
+            port=self.config.RABBITMQ_PORT,
+            virtual_host=self.config.RABBITMQ_VHOST,
+            credentials=credentials
+        ))
+        self.channel = self.connection.channel()
+        # A request published to a missing queue through the default exchange would be confirmed and lost
+        declare_lane_topology(self.channel, self.config, self.lanes)
+        declare_retry_topology(self.channel, self.config, queues=self.queues)
+
+    def depth(self):
+        """Messages currently in the dead-letter queue"""
+        return self.channel.queue_declare(
+            queue=self.config.PAYMENT_DEAD_LETTER_QUEUE, durable=True, passive=True
+        ).method.message_count
+
+    def _get_batch(self, size):
+        """Up to size unacked (delivery_tag, properties, body) from the dead-letter queue"""
+        batch = []
+        while len(batch) < size:
+            method, properties, body = self.channel.basic_get(
+                queue=self.config.PAYMENT_DEAD_LETTER_QUEUE, auto_ack=False
+            )
+            if method is None:
+                break
+            batch.append((method.delivery_tag, properties, body))
+        return batch
+
+    def _target_queue(self, properties):
+        queue = (properties.headers or {}).get(QUEUE_HEADER)
+        if isinstance(queue, bytes):
+            queue = queue.decode()
+        # Requests from a lane that is no longer configured go to PAYMENT_QUEUE
+        return queue if queue in self.queues else self.config.PAYMENT_QUEUE
+
+    def replay_batch(self, size):
+        """
+        Replay one batch
+
+        Returns:
+            (messages read, messages the broker did not confirm)
+        """
+        batch = self._get_batch(size)
+        if not batch:
+            return 0, 0
+
+        futures = [
+            self.manager.publish_message(
+                exchange='',
+                routing_key=self._target_queue(properties),
+                message=body,
+                wait=False,
+                properties=replay_properties(properties)
+            )
+            for _, properties, body in batch
+        ]
+        confirmed, failed = [], []
+        deadline = time.monotonic() + self.manager.confirm_timeout
+        for (delivery_tag, _, _), future in zip(batch, futures):
+            try:
+                ok = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception:
+                ok = False
+            (confirmed if ok else failed).append(delivery_tag)
+
+        if not failed:
+            self.channel.basic_ack(delivery_tag=confirmed[-1], multiple=True)
+        else:
+            for delivery_tag in confirmed:
+                self.channel.basic_ack(delivery_tag=delivery_tag)
+            for delivery_tag in failed:
+                # Left in the dead-letter queue for the next replay
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+        self.batches += 1
+        self.replayed += len(batch) - len(failed)
+        self.failed += len(failed)
+        return len(batch), len(failed)
+
+    def inspect(self, sample_size):
+        """Summarize the dead-letter queue by failure without moving anything"""
+        batch = self._get_batch(sample_size)
+        errors = Counter(
+            str((properties.headers or {}).get(ERROR_HEADER, 'unknown')).split(':')[0] for _, properties, _ in batch
+        )
+        if batch:
+            self.channel.basic_nack(delivery_tag=batch[-1][0], multiple=True, requeue=True)
+        return errors
+
+    def run(self):
+        """Replay until the queue depth seen at start (or the limit) is moved, or stop() is called"""
+        total = self.depth()
+        if self.limit is not None:
+            total = min(total, self.limit)
+        if not total:
+            logger.info("Dead-letter queue is empty; nothing to replay")
+            return
+        if not self.manager.connect():
+            raise RuntimeError("RabbitMQ publisher connection not available")
+
+        logger.info(f"Replaying {total} dead-lettered payment request(s) in batches of {self.batch_size}")
+        started = time.monotonic()
+        while not self._stop.is_set() and self.replayed < total:
+            read, failed = self.replay_batch(min(self.batch_size, total - self.replayed))
+            if not read:
+                break
+            if failed:
+                # The broker is refusing publishes: stop instead of spinning on the same messages
+                logger.error(f"{failed} message(s) not confirmed by the broker; stopping the replay")
+                break
+            logger.info(f"Replayed {self.replayed}/{total}")
+        logger.info(
+            f"Dead-letter replay done: replayed={self.replayed} failed={self.failed} batches={self.batches} "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.manager.close()
+        if self.connection is not None and self.connection.is_open:
+            self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-inject dead-lettered payment requests into the payment queue")
+    parser.add_argument('--batch-size', type=int, default=100, help='Messages re-published per confirmed batch')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum messages to replay')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the queue depth and failure causes')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    replayer = DeadLetterReplayer(batch_size=args.batch_size, limit=args.limit)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: replayer.stop())
+    try:
+        replayer.connect()
+        if args.dry_run:
+            depth = replayer.depth()
+            errors = replayer.inspect(min(depth, args.limit or depth))
+            logger.info(f"Dead-letter queue depth: {depth}; failures in sample: {dict(errors)}")
+        else:
+            replayer.run()
+    finally:
+        replayer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Outbox relay for payment events
+Drains payment_outbox to payment_exchange in batches: every batch is published with
+publisher confirms and the confirmed events are checkpointed (marked published) with
+a single update. Delivery is at-least-once; each message carries the outbox _id as
+message_id so consumers can drop duplicates.
+
+Run from src/ (one active relay at a time; extra replicas wait on the lease):
+    python -m events.outbox_relay
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import pika
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config.config import Config
+from repository.outbox import OUTBOX_COLLECTION
+from utils.rabbitmq_manager import RabbitMQManager
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = 'payment_outbox_leases'
+LEASE_ID = 'outbox-relay'
+
+
+class OutboxRelay:
+    """Batched, confirmed publisher for the payment_outbox collection"""
+
+    def __init__(self, batch_size=None, poll_interval=None, lease_seconds=None, manager=None):
+        """
+        Args:
+            batch_size: Events read and published per round (defaults to PAYMENT_OUTBOX_BATCH_SIZE)
+            poll_interval: Seconds to sleep when the outbox is drained
+                           (defaults to PAYMENT_OUTBOX_POLL_INTERVAL_MS)
+            lease_seconds: Lease length that keeps a second relay from publishing concurrently
+            manager: RabbitMQManager to publish with (a new one by default)
+        """
+        self.config = Config()
+        self.batch_size = batch_size or self.config.PAYMENT_OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            self.config.PAYMENT_OUTBOX_POLL_INTERVAL_MS / 1000
+        self.lease_seconds = lease_seconds or self.config.PAYMENT_OUTBOX_LEASE_SECONDS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.client = MongoClient(
+            self.config.MONGO_URI,
+            serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS
+        )
+        db = self.client[self.config.MONGO_DB]
+        self.outbox = db[OUTBOX_COLLECTION]
+        self.leases = db[LEASE_COLLECTION]
+        self.manager = manager or RabbitMQManager(self.config, max_pending=max(self.batch_size, 1))
+
+        self._stop = threading.Event()
+        self.published = 0
+        self.failed = 0
+        self.batches = 0
+
+    def acquire_lease(self):
+        """Take or renew the relay lease; False while another relay holds it"""
+        now = datetime.utcnow()
+        try:
+            lease = self.leases.find_one_and_update(
+                {'_id': LEASE_ID, '$or': [{'owner': self.owner}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'owner': self.owner, 'expires_at': now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The lease document exists and belongs to a live relay
+            return False
+        return lease is not None and lease.get('owner') == self.owner
+
+    def release_lease(self):
+        self.leases.delete_one({'_id': LEASE_ID, 'owner': self.owner})
+
+    def relay_batch(self):
+        """
+        Publish the oldest pending events and checkpoint the confirmed ones
+
+        Returns:
+            Number of events read (a full batch means more may be waiting)
+        """
+        events = list(self.outbox.find({'pending': True}, sort=[('_id', 1)], limit=self.batch_size))
+        if not events:
+            return 0
+
+        # Publish the whole batch before waiting, so confirms come back in multiple=True acks
+        futures = [
+            (event['_id'], self.manager.publish_message(
+                exchange=self.config.PAYMENT_EXCHANGE,
+                routing_key=event['routing_key'],
+                message=event['message'],
+                wait=False,
+                properties=pika.BasicProperties(
+                    content_type='application/json',
+                    delivery_mode=2,
+                    message_id=str(event['_id']),
+                    timestamp=int(event['created_at'].replace(tzinfo=timezone.utc).timestamp())
+                )
+            ))
+            for event in events
+        ]
+        confirmed, failed = [], []
+        deadline = time.monotonic() + self.manager.confirm_timeout
+        for event_id, future in futures:
+            try:
+                ok = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception:
+                ok = False
+            (confirmed if ok else failed).append(event_id)
+
+        now = datetime.utcnow()
+        if confirmed:
+            self.outbox.update_many(
+                {'_id': {'$in': confirmed}},
+                {'$set': {'published_at': now}, '$unset': {'pending': ''}}
+            )
+        if failed:
+            # Left pending for the next round
+            self.outbox.update_many(
+                {'_id': {'$in': failed}},
+                {'$inc': {'attempts': 1}, '$set': {'last_attempt_at': now}}
+            )
+            logger.warning(f"{len(failed)} outbox event(s) not confirmed by the broker; will retry")
+
+        self.batches += 1
+        self.published += len(confirmed)
+        self.failed += len(failed)
+        return len(events)
+
+    def run(self):
+        """Relay until stop() is called"""
+        if not self.manager.connect():
+            logger.warning("RabbitMQ not reachable yet; the relay keeps retrying")
+        logger.info(f"Outbox relay {self.owner} started (batch={self.batch_size})")
+        holding = False
+        try:
+            while not self._stop.is_set():
+                try:
+                    leased = self.acquire_lease()
+                    if leased != holding:
+                        logger.info(f"Outbox relay lease {'acquired' if leased else 'lost'}")
+                        holding = leased
+                    if not leased or not self.manager.is_connected():
+                        self._stop.wait(max(self.poll_interval, 1))
+                        continue
+                    if self.relay_batch() < self.batch_size:
+                        self._stop.wait(self.poll_interval)
+                except Exception as e:
+                    logger.error(f"Outbox relay error: {str(e)}")
+                    self._stop.wait(max(self.poll_interval, 1))
+        finally:
+            if holding:
+                self.release_lease()
+            logger.info(
+                f"Outbox relay stopped: published={self.published} failed={self.failed} batches={self.batches}"
+            )
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.manager.close()
+        self.client.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    relay = OutboxRelay()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: relay.stop())
+    try:
+        relay.run()
+    finally:
+        relay.close()
+
+
+if __name__ == '__main__':
+    main()
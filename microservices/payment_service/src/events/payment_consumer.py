@@ -1,25 +1,195 @@
 """
 RabbitMQ Consumer for Payment Service
-Listens for payment requests from other services
+Listens for payment requests from other services on one queue per priority lane
+(events.payment_lanes), shared among the workers by lane weight; failed requests
+go to the delayed-retry lanes and finally the dead-letter queue (events.retry_lanes)
 """
 import pika
 import json
 import logging
+import random
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from config.config import Config
+from utils.constants import LogMessages
 from services.payment_service import PaymentService
+from events.ack_tracker import AckTracker
+from events.payment_lanes import LaneScheduler, declare_lane_topology, load_lanes
+from events.retry_lanes import (
+    DEAD_LETTER_ROUTING_KEY, declare_retry_topology, failed_attempts, failure_properties, retry_route
+)
+from utils.metrics import (
+    CONSUMER_DISPATCH_WAIT_SECONDS, CONSUMER_LANE_DEPTH, CONSUMER_MESSAGES, CONSUMER_PROCESSING_SECONDS,
+    CONSUMER_QUEUE_LAG_SECONDS, CONSUMER_RETRIES, start_metrics_server
+)
 
 logger = logging.getLogger(__name__)
 
-class PaymentConsumer:
+
+class ConsumerStats:
+    """Per-message processing time counters for the consumer"""
+
     def __init__(self):
-        """Initialize RabbitMQ consumer"""
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.confirms = 0
+        self.confirm_batches = 0
+        self.broker_nacks = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        # lane -> [processed, failed]
+        self.lanes = {}
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self, seconds, success, lane):
+        outcome = 'success' if success else 'failed'
+        CONSUMER_PROCESSING_SECONDS.labels(lane, outcome).observe(seconds)
+        CONSUMER_MESSAGES.labels(lane, outcome).inc()
+        with self._lock:
+            self.in_flight -= 1
+            counts = self.lanes.setdefault(lane, [0, 0])
+            if success:
+                self.processed += 1
+                counts[0] += 1
+            else:
+                self.failed += 1
+                counts[1] += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def abandoned(self, count):
+        """Deliveries dropped with their channel before finishing (the broker redelivers them)"""
+        with self._lock:
+            self.in_flight -= count
+
+    def rerouted(self, tier):
+        CONSUMER_RETRIES.labels(tier).inc()
+        with self._lock:
+            if tier == DEAD_LETTER_ROUTING_KEY:
+                self.dead_lettered += 1
+            else:
+                self.retried += 1
+
+    def confirmed(self, count):
+        with self._lock:
+            self.confirms += count
+            self.confirm_batches += 1
+
+    def snapshot(self):
+        with self._lock:
+            handled = self.processed + self.failed
+            return {
+                'processed': self.processed,
+                'failed': self.failed,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'avg_processing_ms': round(self.total_seconds / handled * 1000, 2) if handled else None,
+                'max_processing_ms': round(self.max_seconds * 1000, 2),
+                'confirms': self.confirms,
+                'avg_confirms_per_batch': round(self.confirms / self.confirm_batches, 2) if self.confirm_batches else None,
+                'broker_nacks': self.broker_nacks,
+                'retried': self.retried,
+                'dead_lettered': self.dead_lettered,
+                'lanes': {
+                    lane: {'processed': processed, 'failed': failed}
+                    for lane, (processed, failed) in self.lanes.items()
+                }
+            }
+
+
+class PendingResponse:
+    """A published payment.response waiting for its publisher confirm"""
+
+    __slots__ = ('lane', 'delivery_tag', 'properties', 'body', 'response_message', 'elapsed', 'attempts')
+
+    def __init__(self, lane, delivery_tag, properties, body, response_message, elapsed):
+        self.lane = lane
+        self.delivery_tag = delivery_tag
+        self.properties = properties
+        self.body = body
+        self.response_message = response_message
+        self.elapsed = elapsed
+        self.attempts = 0
+
+
+class PendingRetry:
+    """A failed payment.request re-published to a retry tier, waiting for its publisher confirm"""
+
+    __slots__ = ('lane', 'delivery_tag', 'properties', 'body', 'routing_key', 'tier', 'elapsed', 'attempts')
+
+    def __init__(self, lane, delivery_tag, properties, body, routing_key, tier, elapsed):
+        self.lane = lane
+        self.delivery_tag = delivery_tag
+        self.properties = properties
+        self.body = body
+        self.routing_key = routing_key
+        self.tier = tier
+        self.elapsed = elapsed
+        self.attempts = 0
+
+
+class PaymentConsumer:
+    # Re-publish attempts for a response or retry the broker nacks before requeueing the request
+    MAX_PUBLISH_ATTEMPTS = 3
+
+    def __init__(self, workers=None, prefetch_count=None):
+        """
+        Initialize RabbitMQ consumer
+
+        Args:
+            workers: Size of the processing pool; 0 processes messages inline
+                     on the connection thread (defaults to PAYMENT_CONSUMER_WORKERS)
+            prefetch_count: Unacked messages the broker may push per lane without its own
+                            PAYMENT_LANE_PREFETCH (defaults to PAYMENT_CONSUMER_PREFETCH)
+        """
         self.config = Config()
         self.payment_service = PaymentService()
         self.connection = None
         self.channel = None
-        
+        self.consumer_tags = []
+
+        self.workers = self.config.PAYMENT_CONSUMER_WORKERS if workers is None else workers
+        prefetch = self.config.PAYMENT_CONSUMER_PREFETCH if prefetch_count is None else prefetch_count
+        # A pool needs at least one message per worker to stay busy
+        self.prefetch_count = max(prefetch, self.workers, 1)
+        self.executor = None
+
+        # Priority lanes: deliveries wait per lane until the scheduler hands them to a worker
+        self.lanes = load_lanes(self.config, prefetch=self.prefetch_count, concurrency=max(self.workers, 1))
+        self.default_lane = self.lanes[-1]
+        self.scheduler = LaneScheduler()
+        self._buffers = {lane.name: deque() for lane in self.lanes}
+        self._lane_in_flight = {lane.name: 0 for lane in self.lanes}
+        self._running = 0
+        self.ack_tracker = AckTracker()
+        self.stats = ConsumerStats()
+
+        # Publisher confirms: publish sequence number -> PendingResponse
+        self._publish_seq = 0
+        self._unconfirmed = OrderedDict()
+
+        self._stopping = False
+        self._stop_requested = threading.Event()
+        self._drain_deadline = None
+        # Incremented whenever a channel closes: work dispatched on an older channel is stale
+        self._channel_epoch = 0
+        self.reconnects = 0
+
     def connect(self):
-        """Establish connection to RabbitMQ"""
+        """Open an asynchronous connection; the channel is set up from its callbacks"""
         credentials = pika.PlainCredentials(
             self.config.RABBITMQ_USER,
             self.config.RABBITMQ_PASS
@@ -32,79 +202,430 @@ class PaymentConsumer:
             heartbeat=600,
             blocked_connection_timeout=300
         )
-        
-        self.connection = pika.BlockingConnection(parameters)
-        self.channel = self.connection.channel()
-        
-        # Declare exchange
-        self.channel.exchange_declare(
-            exchange=self.config.PAYMENT_EXCHANGE,
-            exchange_type='topic',
-            durable=True
+
+        self.connection = pika.SelectConnection(
+            parameters,
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_open_error,
+            on_close_callback=self._on_connection_closed
+        )
+
+    # --- Connection and channel setup ---
+
+    def _on_connection_open(self, connection):
+        if self._stopping:
+            # stop() arrived while connecting
+            connection.close()
+            return
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error(f"Error connecting to RabbitMQ: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self.channel = None
+        self._reset_dispatch()
+        if not self._stopping:
+            logger.error(f"RabbitMQ connection closed unexpectedly: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        self.consumer_tags = []
+        channel.add_on_close_callback(self._on_channel_closed)
+
+        # Declare exchange and one queue per lane
+        declare_lane_topology(channel, self.config, self.lanes, callback=self._on_lanes_declared)
+
+    def _on_channel_closed(self, channel, reason):
+        self._reset_dispatch()
+        if not self._stopping:
+            logger.error(f"RabbitMQ channel closed: {reason}")
+        if self.connection and self.connection.is_open:
+            self.connection.close()
+
+    def _reset_dispatch(self):
+        """
+        Forget every delivery of the closed channel and free its dispatch slots
+
+        Unacked deliveries go back to the queue; unconfirmed responses are
+        published again when the requests are redelivered. Worker results still
+        in flight belong to the old channel and are only counted (see _complete).
+        """
+        abandoned = len(self._unconfirmed) + sum(len(buffer) for buffer in self._buffers.values())
+        if self.executor is None:
+            # Inline jobs still queued on the I/O loop are skipped by _process_inline
+            abandoned += self._running
+        self.stats.abandoned(abandoned)
+        self._channel_epoch += 1
+        self.ack_tracker.reset()
+        self._unconfirmed.clear()
+        # Publisher confirm sequence numbers restart with every channel
+        self._publish_seq = 0
+        for buffer in self._buffers.values():
+            buffer.clear()
+        for name in self._lane_in_flight:
+            self._lane_in_flight[name] = 0
+        self._running = 0
+
+    def _on_lanes_declared(self, frame):
+        declare_retry_topology(
+            self.channel, self.config, callback=self._on_retry_lanes_declared,
+            queues=[lane.queue for lane in self.lanes]
+        )
+
+    def _on_retry_lanes_declared(self, frame):
+        # Responses and retries are confirmed asynchronously; the broker batches confirms with multiple=True
+        self.channel.confirm_delivery(
+            ack_nack_callback=self._on_delivery_confirmation,
+            callback=self._on_confirm_selected
         )
-        
-        # Declare queues
-        self.channel.queue_declare(queue=self.config.PAYMENT_QUEUE, durable=True)
-        self.channel.queue_bind(
-            exchange=self.config.PAYMENT_EXCHANGE,
-            queue=self.config.PAYMENT_QUEUE,
-            routing_key='payment.request'
+
+    def _on_confirm_selected(self, frame):
+        self._consume_lane(0)
+
+    def _consume_lane(self, index):
+        """Start the consumers one lane at a time: basic_qos applies to the consumers started after it"""
+        if index == len(self.lanes):
+            logger.info("Connected to RabbitMQ successfully")
+            lanes = ', '.join(
+                f"{lane.name}(weight={lane.weight}, prefetch={lane.prefetch}, concurrency={lane.concurrency})"
+                for lane in self.lanes
+            )
+            logger.info(f"Waiting for payment requests (workers={self.workers}, lanes: {lanes})...")
+            if self.config.PAYMENT_LANE_DEPTH_INTERVAL > 0:
+                self._poll_lane_depth()
+            return
+        lane = self.lanes[index]
+        self.channel.basic_qos(
+            prefetch_count=lane.prefetch,
+            callback=lambda frame: self._on_lane_qos_ok(index)
         )
-        
-        logger.info("Connected to RabbitMQ successfully")
-        
-    def callback(self, ch, method, properties, body):
+
+    def _on_lane_qos_ok(self, index):
+        lane = self.lanes[index]
+        self.consumer_tags.append(self.channel.basic_consume(
+            queue=lane.queue,
+            on_message_callback=partial(self.callback, lane=lane)
+        ))
+        self._consume_lane(index + 1)
+
+    def _poll_lane_depth(self):
+        """Refresh the per-lane depth gauges; the broker depth comes from a passive queue_declare"""
+        if self._stopping or self.channel is None or not self.channel.is_open:
+            return
+        for lane in self.lanes:
+            CONSUMER_LANE_DEPTH.labels(lane.name, 'buffered').set(len(self._buffers[lane.name]))
+            CONSUMER_LANE_DEPTH.labels(lane.name, 'in_flight').set(self._lane_in_flight[lane.name])
+            self.channel.queue_declare(
+                queue=lane.queue, passive=True, callback=partial(self._on_lane_depth, lane)
+            )
+        self.connection.ioloop.call_later(self.config.PAYMENT_LANE_DEPTH_INTERVAL, self._poll_lane_depth)
+
+    def _on_lane_depth(self, lane, frame):
+        CONSUMER_LANE_DEPTH.labels(lane.name, 'broker').set(frame.method.message_count)
+
+    # --- Message handling ---
+
+    def callback(self, ch, method, properties, body, lane=None):
         """Process incoming payment requests"""
+        lane = lane or self.default_lane
+        delivery_tag = method.delivery_tag
+        self.ack_tracker.delivered(delivery_tag)
+        self.stats.started()
+        if properties.timestamp:
+            # AMQP timestamps have one-second resolution
+            CONSUMER_QUEUE_LAG_SECONDS.labels(lane.name).observe(max(0.0, time.time() - properties.timestamp))
+
+        self._buffers[lane.name].append((delivery_tag, properties, body, time.monotonic()))
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand buffered requests to free workers, picking lanes by weight (connection thread only)"""
+        capacity = max(self.workers, 1)
+        while self._running < capacity:
+            lane = self.scheduler.pick([
+                lane for lane in self.lanes
+                if self._buffers[lane.name] and self._lane_in_flight[lane.name] < lane.concurrency
+            ])
+            if lane is None:
+                return
+            delivery_tag, properties, body, received = self._buffers[lane.name].popleft()
+            CONSUMER_DISPATCH_WAIT_SECONDS.labels(lane.name).observe(time.monotonic() - received)
+            self._lane_in_flight[lane.name] += 1
+            self._running += 1
+
+            if self.executor is None:
+                # Inline mode: process on the connection thread after the pending frames are read,
+                # so the next pick sees every delivery that arrived meanwhile
+                self.connection.ioloop.add_callback_threadsafe(
+                    partial(self._process_inline, self._channel_epoch, lane, delivery_tag, properties, body)
+                )
+            else:
+                self.executor.submit(
+                    self._process_in_worker, self._channel_epoch, lane, delivery_tag, properties, body
+                )
+
+    def _process(self, body):
+        """
+        Run the payment for one message (any thread)
+
+        Returns:
+            (response_message or None, error or None, processing seconds)
+        """
+        started = time.perf_counter()
         try:
             payment_data = json.loads(body)
             logger.info(f"Received payment request: {payment_data}")
-            
+
             # Process payment
             result = self.payment_service.process_payment(payment_data)
-            
-            # Send response back
+
             response_message = {
-                'order_id': payment_data.get('order_id'),
+                'order_id': result.get('order_id', payment_data.get('order_id')),
                 'payment_id': result.get('payment_id'),
                 'status': result.get('status'),
                 'message': result.get('message'),
                 'timestamp': result.get('timestamp')
             }
-            
+            return response_message, None, time.perf_counter() - started
+        except Exception as e:
+            return None, e, time.perf_counter() - started
+
+    def _process_inline(self, epoch, lane, delivery_tag, properties, body):
+        if epoch != self._channel_epoch:
+            # Channel lost before it ran: the broker redelivers the request
+            return
+        self._complete(epoch, lane, delivery_tag, properties, body, *self._process(body))
+
+    def _process_in_worker(self, epoch, lane, delivery_tag, properties, body):
+        response_message, error, elapsed = self._process(body)
+        if epoch != self._channel_epoch:
+            # The I/O loop of a lost connection may never run the callback
+            self.stats.finished(elapsed, error is None, lane.name)
+            return
+        # pika channels are not thread-safe: publish and ack on the connection thread
+        self.connection.ioloop.add_callback_threadsafe(
+            partial(self._complete, epoch, lane, delivery_tag, properties, body, response_message, error, elapsed)
+        )
+
+    def _complete(self, epoch, lane, delivery_tag, properties, body, response_message, error, elapsed):
+        """
+        Publish the response, or the request to its retry tier if it failed; the request
+        is acked once the broker confirms that publish (connection thread only)
+        """
+        if epoch != self._channel_epoch or self.channel is None or not self.channel.is_open:
+            # Channel lost: the broker will redeliver this request, and its slots were reset
+            self.stats.finished(elapsed, error is None, lane.name)
+            return
+        self._lane_in_flight[lane.name] -= 1
+        self._running -= 1
+
+        if error is not None:
+            self._retry_later(lane, delivery_tag, properties, body, error, elapsed)
+        else:
+            self._publish_response(
+                PendingResponse(lane, delivery_tag, properties, body, response_message, elapsed)
+            )
+        self._dispatch()
+
+    def _retry_later(self, lane, delivery_tag, properties, body, error, elapsed):
+        """Move a failed request to its delayed-retry tier, or to the dead-letter queue"""
+        attempts = failed_attempts(properties) + 1
+        routing_key, tier = retry_route(self.config, attempts, error, lane.queue)
+        if tier == DEAD_LETTER_ROUTING_KEY:
+            logger.error(
+                f"Error processing {lane.name} payment (attempt {attempts}), dead-lettering request: {str(error)}"
+            )
+        else:
+            logger.warning(
+                f"Error processing {lane.name} payment (attempt {attempts}), retrying in {tier}: {str(error)}"
+            )
+        self._publish_retry(PendingRetry(
+            lane, delivery_tag, failure_properties(properties, attempts, error, lane.queue), body,
+            routing_key, tier, elapsed
+        ))
+
+    def _publish_retry(self, pending):
+        pending.attempts += 1
+        try:
+            self.channel.basic_publish(
+                exchange=self.config.PAYMENT_RETRY_EXCHANGE,
+                routing_key=pending.routing_key,
+                body=pending.body,
+                properties=pending.properties
+            )
+        except Exception as e:
+            logger.error(f"Error publishing payment request to {pending.tier} retry tier: {str(e)}")
+            self._settle_failed(pending)
+            return
+        self._publish_seq += 1
+        self._unconfirmed[self._publish_seq] = pending
+
+    def _publish_response(self, pending):
+        pending.attempts += 1
+        try:
             # Publish response
             self.channel.basic_publish(
                 exchange=self.config.PAYMENT_EXCHANGE,
                 routing_key='payment.response',
-                body=json.dumps(response_message),
+                body=json.dumps(pending.response_message),
                 properties=pika.BasicProperties(
                     delivery_mode=2,  # make message persistent
-                    correlation_id=properties.correlation_id
+                    correlation_id=pending.properties.correlation_id,
+                    timestamp=int(time.time())
                 )
             )
-            
-            # Acknowledge message
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            logger.info(f"Payment processed successfully: {result}")
-            
         except Exception as e:
-            logger.error(f"Error processing payment: {str(e)}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-    
+            logger.error(f"Error publishing payment response: {str(e)}")
+            self._retry_later(
+                pending.lane, pending.delivery_tag, pending.properties, pending.body, e, pending.elapsed
+            )
+            return
+        self._publish_seq += 1
+        self._unconfirmed[self._publish_seq] = pending
+
+    def _on_delivery_confirmation(self, frame):
+        """Broker ack/nack for one or (multiple=True) many published responses"""
+        method = frame.method
+        confirmed_type = method.NAME.split('.')[1].lower()
+        if method.multiple:
+            seqs = [seq for seq in self._unconfirmed if seq <= method.delivery_tag]
+        else:
+            seqs = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+
+        if confirmed_type == 'ack':
+            self.stats.confirmed(len(seqs))
+        ack_upto = None
+        for seq in seqs:
+            pending = self._unconfirmed.pop(seq)
+            retry = isinstance(pending, PendingRetry)
+            if confirmed_type == 'ack':
+                if retry:
+                    # The request is safely parked in its retry tier
+                    self.stats.rerouted(pending.tier)
+                    self.stats.finished(pending.elapsed, False, pending.lane.name)
+                else:
+                    self.stats.finished(pending.elapsed, True, pending.lane.name)
+                    logger.info(
+                        f"Payment processed successfully in {pending.elapsed * 1000:.1f} ms: {pending.response_message}"
+                    )
+                upto = self.ack_tracker.complete(pending.delivery_tag, AckTracker.ACK)
+                ack_upto = upto if upto is not None else ack_upto
+            else:
+                self.stats.broker_nacks += 1
+                kind = f"{pending.tier} retry" if retry else "response"
+                if pending.attempts < self.MAX_PUBLISH_ATTEMPTS:
+                    logger.warning(f"Broker nacked payment {kind}, re-publishing (attempt {pending.attempts + 1})")
+                    if retry:
+                        self._publish_retry(pending)
+                    else:
+                        self._publish_response(pending)
+                elif retry:
+                    logger.error(f"Broker nacked payment {kind} {pending.attempts} times, requeueing the request")
+                    self._settle_failed(pending)
+                else:
+                    self._retry_later(
+                        pending.lane, pending.delivery_tag, pending.properties, pending.body,
+                        RuntimeError(f"Broker nacked payment response {pending.attempts} times"), pending.elapsed
+                    )
+
+        self._ack_finished(ack_upto)
+
+    def _ack_finished(self, ack_upto):
+        # Acknowledge every contiguous finished request with a single ack
+        if ack_upto is not None:
+            self.channel.basic_ack(delivery_tag=ack_upto, multiple=True)
+        if len(self.lanes) > 1:
+            # A slow request of one lane must not hold the prefetch window of the others
+            for delivery_tag in self.ack_tracker.settle_waiting():
+                self.channel.basic_ack(delivery_tag=delivery_tag)
+
+    def _settle_failed(self, pending):
+        """Hand back a request whose retry the broker would not take"""
+        # Requeued, not dropped: a broker refusing publishes is transient, like a closed channel
+        self.channel.basic_nack(delivery_tag=pending.delivery_tag, requeue=True)
+        self.stats.finished(pending.elapsed, False, pending.lane.name)
+        self._ack_finished(self.ack_tracker.complete(pending.delivery_tag, AckTracker.NACK))
+
+    # --- Lifecycle ---
+
     def start_consuming(self):
-        """Start consuming messages"""
-        self.connect()
-        self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(
-            queue=self.config.PAYMENT_QUEUE,
-            on_message_callback=self.callback
-        )
-        
-        logger.info("Waiting for payment requests...")
-        self.channel.start_consuming()
-    
+        """
+        Consume until stop() is requested, then drain in-flight work
+
+        A lost connection or channel is reopened with exponential backoff, like
+        RabbitMQManager does for publishers.
+        """
+        if self.workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='payment-worker')
+        if self.config.PAYMENT_CONSUMER_METRICS_PORT:
+            start_metrics_server(self.config.PAYMENT_CONSUMER_METRICS_PORT)
+        self._install_signal_handlers()
+        delay = 1
+        try:
+            while not self._stopping and not self._stop_requested.is_set():
+                opened_at = time.monotonic()
+                try:
+                    self.connect()
+                    self.connection.ioloop.start()
+                except Exception as e:
+                    logger.error(f"RabbitMQ consumer I/O loop failed: {str(e)}")
+                if self._stopping or self._stop_requested.is_set():
+                    break
+                # A connection that lasted long enough restarts the backoff
+                if time.monotonic() - opened_at > 30:
+                    delay = 1
+                self.reconnects += 1
+                wait = delay * random.uniform(0.5, 1.5)
+                logger.warning(LogMessages.RABBITMQ_CONSUMER_RECONNECTING.format(delay=wait))
+                self._stop_requested.wait(wait)
+                delay = min(delay * 2, self.config.RABBITMQ_RECONNECT_MAX_DELAY)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+            logger.info(f"Payment consumer stats: {self.stats.snapshot()}")
+
+    def stop(self):
+        """Request a graceful shutdown (safe from signal handlers and other threads)"""
+        # Ends a reconnect wait; a running I/O loop drains first
+        self._stop_requested.set()
+        if self.connection is not None:
+            self.connection.ioloop.add_callback_threadsafe(self._begin_drain)
+
+    def _begin_drain(self):
+        """Stop receiving, wait for in-flight messages to be confirmed and settled, then close"""
+        if self._stopping:
+            return
+        self._stopping = True
+        logger.info(f"Draining payment consumer: {len(self.ack_tracker)} message(s) in flight")
+        self._drain_deadline = time.monotonic() + self.config.PAYMENT_CONSUMER_DRAIN_TIMEOUT
+        if self.channel is not None and self.channel.is_open:
+            # Requests already buffered are still dispatched and settled
+            for consumer_tag in self.consumer_tags:
+                self.channel.basic_cancel(consumer_tag)
+        self._check_drained()
+
+    def _check_drained(self):
+        if len(self.ack_tracker) and time.monotonic() < self._drain_deadline:
+            self.connection.ioloop.call_later(0.2, self._check_drained)
+            return
+        if len(self.ack_tracker):
+            # Unacked messages are redelivered by the broker once the channel closes
+            logger.warning(f"Drain timeout: {len(self.ack_tracker)} message(s) left for redelivery")
+        self.close()
+
+    def _install_signal_handlers(self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: self.stop())
+
     def close(self):
         """Close connection"""
-        if self.connection and not self.connection.is_closed:
+        self._stopping = True
+        if self.connection and not (self.connection.is_closed or self.connection.is_closing):
+            # Also aborts a connection that is still opening
             self.connection.close()
             logger.info("RabbitMQ connection closed")
-
@@ -0,0 +1,185 @@
+"""
+Priority lanes for payment requests
+Card authorizations, PSE payments and refunds are published with their own
+routing key (payment.request.<lane>) and land in their own durable queue
+(payment_requests.<lane>), so a backlog of slow PSE or bulk refund requests no
+longer sits in front of card payments. The legacy payment.request key keeps
+feeding PAYMENT_QUEUE, consumed as the "default" lane, for publishers that do
+not set a lane.
+
+PaymentConsumer consumes every lane on one channel with a per-lane prefetch,
+buffers what the broker pushes and hands requests to its workers in smooth
+weighted round-robin order among the lanes that have work and are under their
+concurrency cap: weights share the workers when every lane is busy, and an idle
+lane lends its share to the others.
+
+    payment.request.cc     --> payment_requests.cc      (weight 6)
+    payment.request.pse    --> payment_requests.pse     (weight 2)
+    payment.request.refund --> payment_requests.refund  (weight 1)
+    payment.request        --> payment_requests         (lane "default", weight 3)
+"""
+from functools import partial
+from utils.constants import EventType
+
+DEFAULT_LANE = 'default'
+REFUND_OPERATIONS = ('refund', 'reembolso')
+
+
+class PaymentLane:
+    """One request lane: where it is consumed from and how much of the consumer it gets"""
+
+    __slots__ = ('name', 'queue', 'routing_key', 'weight', 'prefetch', 'concurrency', 'current_weight')
+
+    def __init__(self, name, queue, routing_key, weight, prefetch, concurrency):
+        self.name = name
+        self.queue = queue
+        self.routing_key = routing_key
+        self.weight = weight
+        self.prefetch = prefetch
+        self.concurrency = concurrency
+        # Smooth weighted round-robin state (see LaneScheduler)
+        self.current_weight = 0
+
+
+def lane_routing_key(lane):
+    if lane == DEFAULT_LANE:
+        return EventType.PAYMENT_REQUEST.value
+    return f"{EventType.PAYMENT_REQUEST.value}.{lane}"
+
+
+def lane_queue(config, lane):
+    if lane == DEFAULT_LANE:
+        return config.PAYMENT_QUEUE
+    return f"{config.PAYMENT_QUEUE}.{lane}"
+
+
+def configured_lanes(config):
+    """Lane names from PAYMENT_LANES, always ending with the legacy default lane"""
+    names = [name.strip().lower() for name in config.PAYMENT_LANES.split(',') if name.strip()]
+    return [name for name in dict.fromkeys(names) if name != DEFAULT_LANE] + [DEFAULT_LANE]
+
+
+def lane_for_request(request):
+    """
+    Lane for a payment request
+
+    Args:
+        request: Order data as published (a refund carries type/operation 'refund')
+
+    Returns:
+        Lane name; DEFAULT_LANE when the request does not say which lane it belongs to
+    """
+    operation = str(request.get('type') or request.get('operation') or '').lower()
+    if operation in REFUND_OPERATIONS:
+        return 'refund'
+    method = str(request.get('paymentMethod') or request.get('payment_method') or '').lower()
+    return method or DEFAULT_LANE
+
+
+def request_routing_key(config, request):
+    """Routing key a payment request is published with (legacy key if lanes are off or unknown)"""
+    if not config.PAYMENT_LANE_ROUTING:
+        return EventType.PAYMENT_REQUEST.value
+    lane = lane_for_request(request)
+    if lane not in configured_lanes(config):
+        return EventType.PAYMENT_REQUEST.value
+    return lane_routing_key(lane)
+
+
+def parse_lane_settings(value):
+    """'cc:6,pse:2' -> {'cc': 6, 'pse': 2}"""
+    settings = {}
+    for item in value.split(','):
+        if ':' not in item:
+            continue
+        name, number = item.split(':', 1)
+        settings[name.strip().lower()] = int(number)
+    return settings
+
+
+def load_lanes(config, prefetch, concurrency):
+    """
+    Lanes the consumer reads from
+
+    Args:
+        config: Config with the PAYMENT_LANE_* settings
+        prefetch: Prefetch for lanes without their own PAYMENT_LANE_PREFETCH entry
+        concurrency: Concurrency cap for lanes without a PAYMENT_LANE_CONCURRENCY entry
+
+    Returns:
+        [PaymentLane] in PAYMENT_LANES order, the default lane last
+    """
+    weights = parse_lane_settings(config.PAYMENT_LANE_WEIGHTS)
+    prefetches = parse_lane_settings(config.PAYMENT_LANE_PREFETCH)
+    caps = parse_lane_settings(config.PAYMENT_LANE_CONCURRENCY)
+    return [
+        PaymentLane(
+            name=name,
+            queue=lane_queue(config, name),
+            routing_key=lane_routing_key(name),
+            weight=max(1, weights.get(name, 1)),
+            prefetch=max(1, prefetches.get(name, prefetch)),
+            concurrency=max(1, caps.get(name, concurrency))
+        )
+        for name in configured_lanes(config)
+    ]
+
+
+def declare_lane_topology(channel, config, lanes, callback=None):
+    """
+    Declare the payment exchange and every lane queue with its binding
+
+    Args:
+        channel: pika channel; a BlockingChannel declares synchronously
+        config: Config with the exchange settings
+        lanes: [PaymentLane] to declare
+        callback: For an asynchronous channel, called with the last frame once
+                  everything is declared
+    """
+    operations = [partial(
+        channel.exchange_declare, exchange=config.PAYMENT_EXCHANGE, exchange_type='topic', durable=True
+    )]
+    for lane in lanes:
+        operations.append(partial(channel.queue_declare, queue=lane.queue, durable=True))
+        operations.append(partial(
+            channel.queue_bind, exchange=config.PAYMENT_EXCHANGE, queue=lane.queue, routing_key=lane.routing_key
+        ))
+    run_declarations(operations, callback)
+
+
+def run_declarations(operations, callback=None):
+    """Run pika declarations in order: synchronously without callback, chained through callbacks otherwise"""
+    if callback is None:
+        for operation in operations:
+            operation()
+        return
+
+    def run(index, frame=None):
+        if index == len(operations):
+            callback(frame)
+            return
+        operations[index](callback=lambda frame: run(index + 1, frame))
+
+    run(0)
+
+
+class LaneScheduler:
+    """
+    Smooth weighted round-robin over lanes (the nginx upstream algorithm)
+
+    Only the lanes offered on each pick take part, so a lane with nothing queued
+    does not bank credit while idle and then starve the others when it wakes up.
+    """
+
+    def pick(self, lanes):
+        """Next lane to serve among the eligible ones, or None"""
+        best = None
+        total = 0
+        for lane in lanes:
+            lane.current_weight += lane.weight
+            total += lane.weight
+            if best is None or lane.current_weight > best.current_weight:
+                best = lane
+        if best is not None:
+            best.current_weight -= total
+        return best
@@ -6,6 +6,7 @@ import json
 import logging
 from typing import Dict, Any, Optional
 from config.config import Config
+from events.payment_lanes import request_routing_key
 from utils.rabbitmq_manager import RabbitMQManager
 from utils.constants import EventType, LogMessages, ErrorMessages
 from utils.resilience_decorators import resilient_message_queue, timeout
@@ -26,7 +27,7 @@ class PaymentProducer:
         if not self.rabbitmq_manager.is_connected():
             if not self.rabbitmq_manager.connect():
                 logger.error("Failed to establish RabbitMQ connection")
-                raise ConnectionError("Cannot connect to RabbitMQ")
+                raise ConnectionError(ErrorMessages.RABBITMQ_UNAVAILABLE)
     
     @resilient_message_queue("payment_events")
     @timeout(10)  # 10 second timeout for message publishing
@@ -41,11 +42,16 @@ class PaymentProducer:
         Returns:
             True if published successfully, False otherwise
         """
+        return self._publish_event(event_type, payment_data)
+
+    def _publish_event(self, event_type: str, payment_data: Dict[str, Any],
+                       routing_key: Optional[str] = None, mandatory: bool = False) -> bool:
+        """Publish one event and wait for the broker confirm (no retries of its own)"""
         try:
             # Ensure connection is active
             if not self.rabbitmq_manager.is_connected():
                 if not self.rabbitmq_manager.reconnect():
-                    logger.error("Failed to reconnect to RabbitMQ")
+                    logger.error(ErrorMessages.RABBITMQ_RECONNECT_FAILED)
                     return False
             
             # Prepare message
@@ -57,25 +63,26 @@ class PaymentProducer:
             }
             
             # Determine routing key based on event type
-            routing_key = self._get_routing_key(event_type)
+            routing_key = routing_key or self._get_routing_key(event_type)
             
             # Publish message
             success = self.rabbitmq_manager.publish_message(
                 exchange=self.config.PAYMENT_EXCHANGE,
                 routing_key=routing_key,
                 message=message,
-                persistent=True
+                persistent=True,
+                mandatory=mandatory
             )
             
             if success:
-                logger.info(f"Published payment event: {event_type}")
+                logger.info(LogMessages.EVENT_PUBLISHED.format(event_type=event_type))
             else:
-                logger.error(f"Failed to publish payment event: {event_type}")
+                logger.error(LogMessages.EVENT_NOT_PUBLISHED.format(event_type=event_type))
             
             return success
             
         except Exception as e:
-            logger.error(f"Error publishing payment event: {str(e)}")
+            logger.error(ErrorMessages.PUBLISH_FAILED.format(error=str(e)))
             return False
     
     def _get_routing_key(self, event_type: str) -> str:
@@ -102,7 +109,7 @@ class PaymentProducer:
     @timeout(10)
     def publish_payment_request(self, order_data: Dict[str, Any]) -> bool:
         """
-        Publish payment request event
+        Publish payment request event to its priority lane (events.payment_lanes)
         
         Args:
             order_data: Order data for payment processing
@@ -110,7 +117,10 @@ class PaymentProducer:
         Returns:
             True if published successfully, False otherwise
         """
-        return self.publish_payment_event('request', order_data)
+        # Mandatory: a request no queue receives fails instead of being dropped by the broker
+        return self._publish_event(
+            'request', order_data, request_routing_key(self.config, order_data), mandatory=True
+        )
     
     @resilient_message_queue("payment_responses")
     @timeout(10)
@@ -124,7 +134,7 @@ class PaymentProducer:
         Returns:
             True if published successfully, False otherwise
         """
-        return self.publish_payment_event('response', payment_result)
+        return self._publish_event('response', payment_result)
     
     def close(self):
         """Close RabbitMQ connection"""
@@ -0,0 +1,137 @@
+"""
+Async RabbitMQ Producer for Payment Service
+aio-pika counterpart of PaymentProducer for the asyncio server mode: one robust
+connection per process, a publisher-confirm channel and cached exchange declarations.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional
+import aio_pika
+from config.config import Config
+from events.payment_lanes import request_routing_key
+from utils.constants import EventType, LogMessages, ErrorMessages
+from utils.payu_payloads import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPaymentProducer:
+    """Publishes payment events from coroutines and waits for the broker confirm"""
+
+    ROUTING_KEYS = {
+        'completed': EventType.PAYMENT_COMPLETED.value,
+        'failed': EventType.PAYMENT_FAILED.value,
+        'refunded': EventType.PAYMENT_REFUNDED.value,
+        'request': EventType.PAYMENT_REQUEST.value,
+        'response': EventType.PAYMENT_RESPONSE.value
+    }
+
+    def __init__(self):
+        self.config = Config()
+        self.connection = None
+        self.channel = None
+        self._exchanges = {}
+        self._connect_lock = None
+
+    async def connect(self):
+        """Open the robust connection (it reconnects on its own) and the confirm channel"""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.channel is not None and not self.channel.is_closed:
+                return
+            self.connection = await aio_pika.connect_robust(
+                host=self.config.RABBITMQ_HOST,
+                port=self.config.RABBITMQ_PORT,
+                login=self.config.RABBITMQ_USER,
+                password=self.config.RABBITMQ_PASS,
+                virtualhost=self.config.RABBITMQ_VHOST
+            )
+            # on_return_raises: a returned mandatory message fails its publish
+            self.channel = await self.connection.channel(publisher_confirms=True, on_return_raises=True)
+            self._exchanges.clear()
+
+    async def _exchange(self, name):
+        exchange = self._exchanges.get(name)
+        if exchange is None:
+            exchange = self._exchanges[name] = await self.channel.declare_exchange(
+                name, aio_pika.ExchangeType.TOPIC, durable=True
+            )
+        return exchange
+
+    async def publish_message(self, exchange: str, routing_key: str, message: Dict[str, Any],
+                              persistent: bool = True, mandatory: bool = False) -> bool:
+        """
+        Publish a JSON message and wait for the broker confirm
+
+        Returns:
+            True if the broker confirmed it, False otherwise (also when a
+            mandatory message reaches no queue)
+        """
+        try:
+            await self.connect()
+            target = await self._exchange(exchange)
+            await asyncio.wait_for(
+                target.publish(
+                    aio_pika.Message(
+                        body=dumps(message),
+                        content_type='application/json',
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT if persistent
+                        else aio_pika.DeliveryMode.NOT_PERSISTENT,
+                        timestamp=int(time.time())
+                    ),
+                    routing_key=routing_key,
+                    mandatory=mandatory
+                ),
+                timeout=self.config.RABBITMQ_PUBLISH_CONFIRM_TIMEOUT
+            )
+            return True
+        except Exception as e:
+            logger.error(ErrorMessages.PUBLISH_FAILED.format(error=str(e) or type(e).__name__))
+            return False
+
+    async def publish_payment_event(self, event_type: str, payment_data: Dict[str, Any],
+                                    routing_key: Optional[str] = None, mandatory: bool = False) -> bool:
+        """
+        Publish a payment event (same message shape as PaymentProducer)
+
+        Args:
+            event_type: Type of payment event
+            payment_data: Payment data to publish
+            routing_key: Overrides the routing key of the event type
+            mandatory: Fail the publish if no queue is bound for the routing key
+
+        Returns:
+            True if published successfully, False otherwise
+        """
+        message = {
+            'event_type': event_type,
+            'service': 'payment-service',
+            'timestamp': payment_data.get('timestamp'),
+            'data': payment_data
+        }
+        success = await self.publish_message(
+            exchange=self.config.PAYMENT_EXCHANGE,
+            routing_key=routing_key or self.ROUTING_KEYS.get(event_type, f'payment.{event_type}'),
+            message=message,
+            mandatory=mandatory
+        )
+        if success:
+            logger.info(LogMessages.EVENT_PUBLISHED.format(event_type=event_type))
+        else:
+            logger.error(LogMessages.EVENT_NOT_PUBLISHED.format(event_type=event_type))
+        return success
+
+    async def publish_payment_request(self, order_data: Dict[str, Any]) -> bool:
+        return await self.publish_payment_event(
+            'request', order_data, request_routing_key(self.config, order_data), mandatory=True
+        )
+
+    async def publish_payment_response(self, payment_result: Dict[str, Any]) -> bool:
+        return await self.publish_payment_event('response', payment_result)
+
+    async def close(self):
+        """Close RabbitMQ connection"""
+        if self.connection is not None:
+            await self.connection.close()
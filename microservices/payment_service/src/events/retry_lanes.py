@@ -0,0 +1,152 @@
+"""
+Delayed-retry and dead-letter lanes for payment requests
+A payment.request that fails is re-published to a retry queue instead of being
+dropped. Each delay tier of each request queue (PAYMENT_QUEUE and the priority
+lanes of events.payment_lanes) is its own durable queue with a queue-level TTL
+whose dead-letter target is that request queue (through the default exchange),
+so every message in a tier waits the same time, none blocks the head of another
+tier, and a retried request comes back to its own lane. The number of failed
+deliveries travels in the x-payment-attempts header and the originating queue in
+x-payment-queue; after
+PAYMENT_RETRY_MAX_ATTEMPTS (or at once for a malformed or invalid request) the request is
+parked in PAYMENT_DEAD_LETTER_QUEUE until events.dead_letter_replay re-injects it.
+
+    payment_requests[.<lane>] --fail--> payment_retry --> payment_requests[.<lane>].retry.<delay>ms
+                              --TTL--> payment_requests[.<lane>]
+                              --fail, attempts exhausted--> payment_retry --> payment_requests.dlq
+"""
+import json
+import time
+from functools import partial
+import pika
+from events.payment_lanes import run_declarations
+from services.checkout import InvalidPaymentRequest
+
+ATTEMPTS_HEADER = 'x-payment-attempts'
+ERROR_HEADER = 'x-payment-error'
+FAILED_AT_HEADER = 'x-payment-failed-at'
+REPLAYS_HEADER = 'x-payment-replays'
+QUEUE_HEADER = 'x-payment-queue'
+DEAD_LETTER_ROUTING_KEY = 'dlq'
+# Headers the broker adds when a retry tier dead-letters a message back
+BROKER_DEATH_HEADER_PREFIXES = ('x-death', 'x-first-death-', 'x-last-death-')
+
+# Errors that no retry can fix: the request goes straight to the dead-letter queue
+NON_RETRYABLE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError, InvalidPaymentRequest)
+
+
+def retry_queue_name(config, delay_ms, queue=None):
+    return f"{queue or config.PAYMENT_QUEUE}.retry.{delay_ms}ms"
+
+
+def retry_lanes(config, queues=None):
+    """
+    Queues of the retry topology
+
+    Args:
+        config: Config with the retry settings
+        queues: Request queues that get delay tiers (defaults to PAYMENT_QUEUE)
+
+    Returns:
+        (queue, routing_key, arguments) for every delay tier and the dead-letter queue
+    """
+    lanes = [
+        (retry_queue_name(config, delay_ms, queue), retry_queue_name(config, delay_ms, queue), {
+            'x-message-ttl': delay_ms,
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': queue
+        })
+        for queue in (queues or [config.PAYMENT_QUEUE])
+        for delay_ms in config.PAYMENT_RETRY_DELAYS_MS
+    ]
+    lanes.append((config.PAYMENT_DEAD_LETTER_QUEUE, DEAD_LETTER_ROUTING_KEY, {}))
+    return lanes
+
+
+def declare_retry_topology(channel, config, callback=None, queues=None):
+    """
+    Declare the retry exchange, the delay tiers and the dead-letter queue
+
+    Args:
+        channel: pika channel; a BlockingChannel declares synchronously
+        config: Config with the retry settings
+        callback: For an asynchronous channel, called with the last frame once
+                  everything is declared
+        queues: Request queues that get delay tiers (defaults to PAYMENT_QUEUE)
+    """
+    operations = [partial(
+        channel.exchange_declare, exchange=config.PAYMENT_RETRY_EXCHANGE, exchange_type='direct', durable=True
+    )]
+    for queue, routing_key, arguments in retry_lanes(config, queues):
+        operations.append(partial(channel.queue_declare, queue=queue, durable=True, arguments=arguments))
+        operations.append(partial(
+            channel.queue_bind, queue=queue, exchange=config.PAYMENT_RETRY_EXCHANGE, routing_key=routing_key
+        ))
+    run_declarations(operations, callback)
+
+
+def failed_attempts(properties):
+    """Failed deliveries recorded on a message before the current one"""
+    try:
+        return int((properties.headers or {}).get(ATTEMPTS_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def retry_route(config, attempts, error, queue=None):
+    """
+    Where a failed request goes next
+
+    Args:
+        config: Config with the retry settings
+        attempts: Failed deliveries including the current one
+        error: Exception raised while processing the request
+        queue: Request queue the message was consumed from (defaults to PAYMENT_QUEUE)
+
+    Returns:
+        (routing_key on PAYMENT_RETRY_EXCHANGE, lane label for metrics)
+    """
+    delays = config.PAYMENT_RETRY_DELAYS_MS
+    if isinstance(error, NON_RETRYABLE_ERRORS) or attempts >= config.PAYMENT_RETRY_MAX_ATTEMPTS or not delays:
+        return DEAD_LETTER_ROUTING_KEY, DEAD_LETTER_ROUTING_KEY
+    delay_ms = delays[min(attempts, len(delays)) - 1]
+    return retry_queue_name(config, delay_ms, queue), f"{delay_ms}ms"
+
+
+def _republish_properties(properties, headers):
+    return pika.BasicProperties(
+        content_type=properties.content_type,
+        content_encoding=properties.content_encoding,
+        correlation_id=properties.correlation_id,
+        message_id=properties.message_id,
+        reply_to=properties.reply_to,
+        type=properties.type,
+        app_id=properties.app_id,
+        headers=headers,
+        delivery_mode=2,  # make message persistent
+        # Queue lag is measured from the latest publish, not from the first attempt
+        timestamp=int(time.time())
+    )
+
+
+def failure_properties(properties, attempts, error, queue=None):
+    """Properties for re-publishing a failed request (original headers plus the failure record)"""
+    headers = dict(properties.headers or {})
+    if queue:
+        # Lets the dead-letter replay send the request back to its own lane
+        headers[QUEUE_HEADER] = queue
+    headers[ATTEMPTS_HEADER] = attempts
+    headers[ERROR_HEADER] = f"{type(error).__name__}: {error}"[:500]
+    headers[FAILED_AT_HEADER] = int(time.time())
+    return _republish_properties(properties, headers)
+
+
+def replay_properties(properties):
+    """Properties for re-injecting a dead-lettered request with a fresh attempt budget"""
+    headers = {
+        key: value for key, value in (properties.headers or {}).items()
+        if key not in (ATTEMPTS_HEADER, ERROR_HEADER, FAILED_AT_HEADER)
+        and not key.startswith(BROKER_DEATH_HEADER_PREFIXES)
+    }
+    headers[REPLAYS_HEADER] = int(headers.get(REPLAYS_HEADER, 0)) + 1
+    return _republish_properties(properties, headers)
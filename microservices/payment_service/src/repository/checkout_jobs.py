@@ -0,0 +1,86 @@
+"""
+Shared state of asynchronous checkouts
+An async /checkout answers 202 with a checkout id and runs the payment in the
+background of one worker process. The job is stored here when it is accepted and
+its final (body, status) when it finishes, so GET /checkout/<id> can be answered
+by any gunicorn worker or replica. Documents expire through a TTL index on
+expires_at (see repository/indexes.py).
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+from config.config import Config
+
+CHECKOUT_JOB_COLLECTION = 'checkout_jobs'
+
+
+class CheckoutJobStore:
+    """checkout_jobs collection, opened lazily once per process"""
+
+    def __init__(self, collection=None):
+        """
+        Args:
+            collection: checkout_jobs collection (a client is opened on first use by default)
+        """
+        self.config = Config()
+        self._collection = collection
+        self._pid = os.getpid() if collection is not None else None
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        # A client created before a fork is not reused by the child
+        if self._collection is None or self._pid != os.getpid():
+            with self._lock:
+                if self._collection is None or self._pid != os.getpid():
+                    client = MongoClient(
+                        self.config.MONGO_URI,
+                        serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS
+                    )
+                    self._collection = client[self.config.MONGO_DB][CHECKOUT_JOB_COLLECTION]
+                    self._pid = os.getpid()
+        return self._collection
+
+    def create(self, checkout_id, ttl):
+        """Record an accepted job as PROCESSING"""
+        now = datetime.utcnow()
+        self.collection.insert_one({
+            '_id': checkout_id,
+            'status': 'PROCESSING',
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=ttl)
+        })
+
+    def finish(self, checkout_id, status, result, ttl):
+        """Store the final (body, http_status) of a job"""
+        now = datetime.utcnow()
+        body, http_status = result
+        self.collection.update_one(
+            {'_id': checkout_id},
+            {'$set': {
+                'status': status,
+                'body': body,
+                'http_status': http_status,
+                'finished_at': now,
+                'expires_at': now + timedelta(seconds=ttl)
+            }}
+        )
+
+    def get(self, checkout_id):
+        """
+        Job state in the CheckoutQueue.get() shape
+
+        Returns:
+            {'status', 'createdAt', 'finishedAt', 'result'} or None if unknown or expired
+        """
+        doc = self.collection.find_one({'_id': checkout_id})
+        if doc is None or doc['expires_at'] < datetime.utcnow():
+            return None
+        finished_at = doc.get('finished_at')
+        return {
+            'status': doc['status'],
+            'createdAt': doc['created_at'].timestamp(),
+            'finishedAt': finished_at.timestamp() if finished_at else None,
+            'result': (doc['body'], doc['http_status']) if 'body' in doc else None
+        }
@@ -0,0 +1,120 @@
+"""
+PayU confirmation queue
+The confirmation webhook only verifies a PayU notification and appends it to
+payment_confirmations; workers/confirmations.py applies the queued confirmations to
+the payments in batches. The _id is the PayU transaction id plus the reported state,
+so PayU's retries of the same notification collapse into one document.
+"""
+from datetime import datetime
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from config.config import Config
+from repository.write_buffer import PaymentWriteBuffer
+
+CONFIRMATION_COLLECTION = 'payment_confirmations'
+
+# state_pol reported by PayU -> payment status
+CONFIRMATION_STATES = {
+    '4': 'APPROVED',
+    '5': 'EXPIRED',
+    '6': 'DECLINED',
+    '7': 'PENDING',
+    '104': 'ERROR',
+}
+
+# Notification fields kept with the queued confirmation (for audits and support)
+NOTIFICATION_FIELDS = (
+    'merchant_id', 'reference_sale', 'reference_pol', 'transaction_id', 'state_pol', 'response_code_pol',
+    'response_message_pol', 'value', 'currency', 'payment_method_type', 'payment_method_name',
+    'transaction_date', 'cus', 'pse_bank', 'extra1', 'sign'
+)
+
+
+def build_confirmation(form, now=None):
+    """
+    Queue document for a verified PayU confirmation
+
+    Args:
+        form: Confirmation fields as posted by PayU (transaction_id, reference_sale, state_pol, ...)
+        now: Reception time (defaults to utcnow)
+
+    Returns:
+        The payment_confirmations document
+    """
+    now = now or datetime.utcnow()
+    state_pol = str(form['state_pol'])
+    return {
+        '_id': f"{form['transaction_id']}:{state_pol}",
+        'transaction_id': form['transaction_id'],
+        'reference_code': form['reference_sale'],
+        'status': CONFIRMATION_STATES.get(state_pol),
+        'notification': {field: form.get(field) for field in NOTIFICATION_FIELDS if form.get(field) is not None},
+        'pending': True,
+        'attempts': 0,
+        'received_at': now,
+        'next_attempt_at': now
+    }
+
+
+def is_duplicate(error):
+    """True if a queued insert failed only because the confirmation was already stored"""
+    if isinstance(error, DuplicateKeyError):
+        return True
+    if isinstance(error, BulkWriteError):
+        errors = error.details.get('writeErrors', [])
+        return bool(errors) and all(e.get('code') == 11000 for e in errors)
+    return False
+
+
+class ConfirmationQueue:
+    """Durable, group-committed appends to payment_confirmations"""
+
+    def __init__(self, collection=None):
+        """
+        Args:
+            collection: payment_confirmations collection (a new client is opened by default)
+        """
+        self.config = Config()
+        self.client = None
+        if collection is None:
+            self.client = MongoClient(
+                self.config.MONGO_URI,
+                serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS
+            )
+            collection = self.client[self.config.MONGO_DB][CONFIRMATION_COLLECTION]
+        self.collection = collection
+        # Concurrent webhook requests share one insert_many per flush
+        self.buffer = PaymentWriteBuffer(
+            collection,
+            max_batch=self.config.PAYMENT_CONFIRMATION_BATCH_SIZE,
+            max_delay=self.config.PAYMENT_CONFIRMATION_WRITE_MAX_DELAY_MS / 1000,
+            max_pending=self.config.PAYMENT_CONFIRMATION_WRITE_MAX_PENDING,
+            key_field='_id'
+        )
+
+    def append(self, confirmation, timeout=None):
+        """
+        Store a confirmation durably
+
+        Returns:
+            True if it was stored, False if the same notification was already queued
+
+        Raises:
+            The write error (or TimeoutError) if the confirmation could not be stored
+        """
+        future = self.buffer.insert(confirmation)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            if is_duplicate(e):
+                return False
+            raise
+        return True
+
+    def stats(self):
+        return self.buffer.stats()
+
+    def close(self):
+        self.buffer.close()
+        if self.client is not None:
+            self.client.close()
@@ -0,0 +1,85 @@
+"""
+Declared index sets for the payments, rollup, outbox, confirmation and checkout job collections
+Indexes are created by the migration command (python -m repository.migrate),
+not at application startup. Checkout idempotency reservations are only atomic
+with the unique payment_id index, so the repositories check once per process
+that the migration created it (missing_payment_id_index) and log if it did not.
+"""
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Lookups and idempotency reservations rely on payment_id being unique
+PAYMENT_ID_INDEX = IndexModel([('payment_id', ASCENDING)], unique=True)
+
+PAYMENT_INDEXES = [
+    PAYMENT_ID_INDEX,
+    # Admin listing (keyset pagination on created_at, payment_id)
+    IndexModel([('created_at', DESCENDING), ('payment_id', DESCENDING)]),
+    # User payment history, newest first, without in-memory sorts
+    IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('payment_id', DESCENDING)]),
+    IndexModel([('order_id', ASCENDING), ('created_at', DESCENDING), ('payment_id', DESCENDING)]),
+    # Payments by status, oldest first; payment_id makes the reconciliation keyset unique
+    IndexModel([('status', ASCENDING), ('created_at', ASCENDING), ('payment_id', ASCENDING)]),
+    # PayU confirmations identify the payment by its referenceCode
+    IndexModel([('reference_code', ASCENDING)]),
+]
+
+# payment_rollups documents are keyed by {hour, status, payment_method}; stats read hour ranges
+ROLLUP_INDEXES = [
+    IndexModel([('_id.hour', ASCENDING)]),
+]
+
+# Published outbox events are kept this long for audits, then removed by MongoDB
+OUTBOX_RETENTION_SECONDS = 3 * 24 * 3600
+
+OUTBOX_INDEXES = [
+    # The relay scans unpublished events in _id order; published ones leave the index
+    IndexModel([('pending', ASCENDING), ('_id', ASCENDING)], partialFilterExpression={'pending': True}),
+    IndexModel([('published_at', ASCENDING)], expireAfterSeconds=OUTBOX_RETENTION_SECONDS),
+]
+
+# Applied PayU confirmations are kept this long for audits
+CONFIRMATION_RETENTION_SECONDS = 30 * 24 * 3600
+
+CONFIRMATION_INDEXES = [
+    # The applier reads due confirmations; applied ones leave the index
+    IndexModel([('next_attempt_at', ASCENDING)], partialFilterExpression={'pending': True}),
+    IndexModel([('applied_at', ASCENDING)], expireAfterSeconds=CONFIRMATION_RETENTION_SECONDS),
+]
+
+# Async checkout jobs carry their own expiry (CHECKOUT_RESULT_TTL after the last write)
+CHECKOUT_JOB_INDEXES = [
+    IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+]
+
+
+def _key(spec):
+    return tuple((field, int(direction)) for field, direction in spec)
+
+
+def plan_indexes(collection, declared=None):
+    """
+    Compare the declared indexes with the ones present on the collection
+
+    Returns:
+        (missing IndexModels, names of existing indexes that are not declared)
+    """
+    declared = PAYMENT_INDEXES if declared is None else declared
+    existing = {
+        _key(info['key']): name
+        for name, info in collection.index_information().items()
+        if name != '_id_'
+    }
+    wanted = {_key(model.document['key'].items()): model for model in declared}
+
+    missing = [model for key, model in wanted.items() if key not in existing]
+    obsolete = sorted(name for key, name in existing.items() if key not in wanted)
+    return missing, obsolete
+
+
+def missing_payment_id_index(index_information):
+    """True if collection.index_information() has no unique index on payment_id"""
+    key = _key(PAYMENT_ID_INDEX.document['key'].items())
+    return not any(
+        _key(info['key']) == key and info.get('unique')
+        for info in index_information.values()
+    )
@@ -0,0 +1,85 @@
+"""
+Index migration for the payments, payment_rollups, payment_outbox, payment_confirmations and checkout_jobs collections
+Creates the declared index sets once per deployment instead of on every worker start.
+
+Run from src/ (or with src/ on PYTHONPATH):
+    python -m repository.migrate [--dry-run] [--drop-obsolete]
+"""
+import argparse
+import logging
+import sys
+from pymongo import MongoClient
+from config.config import Config
+from repository.indexes import (
+    CHECKOUT_JOB_INDEXES, CONFIRMATION_INDEXES, OUTBOX_INDEXES, PAYMENT_INDEXES, ROLLUP_INDEXES, plan_indexes
+)
+from repository.checkout_jobs import CHECKOUT_JOB_COLLECTION
+from repository.confirmations import CONFIRMATION_COLLECTION
+from repository.outbox import OUTBOX_COLLECTION
+from repository.rollups import ROLLUP_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(collection, dry_run=False, drop_obsolete=False, declared=PAYMENT_INDEXES):
+    """
+    Bring the collection's indexes in line with its declared index set
+
+    Args:
+        collection: payments (or payment_rollups/payment_outbox/payment_confirmations/checkout_jobs) collection
+        dry_run: Only report what would change
+        drop_obsolete: Also drop indexes that are no longer declared
+        declared: IndexModels for this collection
+
+    Returns:
+        (created index names, dropped index names)
+    """
+    missing, obsolete = plan_indexes(collection, declared)
+    for model in missing:
+        logger.info(f"Missing index on {collection.name}: {dict(model.document['key'])}")
+    for name in obsolete:
+        logger.info(f"Undeclared index on {collection.name}: {name}" + ("" if drop_obsolete else " (kept)"))
+    if dry_run:
+        return [], []
+
+    created = collection.create_indexes(missing) if missing else []
+    dropped = []
+    if drop_obsolete:
+        for name in obsolete:
+            collection.drop_index(name)
+            dropped.append(name)
+    return created, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the declared payments, rollup, outbox, confirmation and checkout job indexes")
+    parser.add_argument('--dry-run', action='store_true', help='Only report missing and undeclared indexes')
+    parser.add_argument('--drop-obsolete', action='store_true', help='Drop indexes that are not declared')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    client = MongoClient(config.MONGO_URI, serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS)
+    db = client[config.MONGO_DB]
+    created, dropped = [], []
+    try:
+        for collection, declared in (
+            (db.payments, PAYMENT_INDEXES),
+            (db[ROLLUP_COLLECTION], ROLLUP_INDEXES),
+            (db[OUTBOX_COLLECTION], OUTBOX_INDEXES),
+            (db[CONFIRMATION_COLLECTION], CONFIRMATION_INDEXES),
+            (db[CHECKOUT_JOB_COLLECTION], CHECKOUT_JOB_INDEXES)
+        ):
+            names = migrate(collection, args.dry_run, args.drop_obsolete, declared)
+            created += names[0]
+            dropped += names[1]
+    except Exception as e:
+        logger.error(f"Index migration failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+    logger.info(f"Index migration done: created {created or 'none'}, dropped {dropped or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
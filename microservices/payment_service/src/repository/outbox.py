@@ -0,0 +1,64 @@
+"""
+Transactional outbox for payment events
+Status changes that other services must hear about are written to payment_outbox in
+the same MongoDB transaction as the payment itself; events/outbox_relay.py publishes
+them to payment_exchange afterwards. Transactions need a replica set (or mongos).
+"""
+from datetime import datetime
+from bson import ObjectId
+from utils.constants import EventType
+
+OUTBOX_COLLECTION = 'payment_outbox'
+
+# Final statuses and the event each one emits (PROCESSING/PENDING emit nothing)
+STATUS_EVENTS = {
+    'APPROVED': EventType.PAYMENT_COMPLETED,
+    'DECLINED': EventType.PAYMENT_FAILED,
+    'REJECTED': EventType.PAYMENT_FAILED,
+    'ERROR': EventType.PAYMENT_FAILED,
+    'EXPIRED': EventType.PAYMENT_FAILED,
+    'REFUNDED': EventType.PAYMENT_REFUNDED,
+}
+
+# Payment fields copied into the event payload
+EVENT_FIELDS = ('payment_id', 'order_id', 'user_id', 'amount', 'payment_method', 'status', 'reference_code')
+
+
+def event_for_status(status):
+    """EventType emitted when a payment reaches this status, or None"""
+    return STATUS_EVENTS.get(status)
+
+
+def build_event(payment, status=None):
+    """
+    Outbox document for a payment status change
+
+    Args:
+        payment: Payment document (or projection with EVENT_FIELDS)
+        status: New status (defaults to payment['status'])
+
+    Returns:
+        The outbox document, or None if the status emits no event
+    """
+    status = status or payment.get('status')
+    event_type = event_for_status(status)
+    if event_type is None:
+        return None
+    now = datetime.utcnow()
+    data = {field: payment.get(field) for field in EVENT_FIELDS}
+    data['status'] = status
+    data['timestamp'] = now.isoformat()
+    return {
+        # ObjectIds grow with time, so the relay publishes in _id order
+        '_id': ObjectId(),
+        'routing_key': event_type.value,
+        'message': {
+            'event_type': event_type.value.split('.', 1)[1],
+            'service': 'payment-service',
+            'timestamp': data['timestamp'],
+            'data': data
+        },
+        'pending': True,
+        'attempts': 0,
+        'created_at': now
+    }
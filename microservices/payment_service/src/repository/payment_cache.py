@@ -0,0 +1,158 @@
+"""
+Read-through cache for payment lookups
+Bounded LRU with per-entry TTL in front of get_payment_by_id and get_payments_by_order
+"""
+import threading
+import time
+from collections import OrderedDict
+from config.config import Config
+
+_MISSING = object()
+
+
+class PaymentCache:
+    """
+    Process-local LRU+TTL cache of payment documents and order listings
+
+    Unknown payment ids can be cached as negative entries with their own (shorter)
+    TTL. Status changes invalidate the payment and its order listing; other
+    workers rely on the TTL or on payment events (events/cache_invalidation.py).
+    """
+
+    def __init__(self, max_entries=10000, ttl=5.0, negative_ttl=1.0):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            ttl: Seconds a cached document or listing is served
+            negative_ttl: Seconds an unknown payment id is remembered (0 disables)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # payment_id -> order_id of cached payments, to invalidate order listings
+        self._orders = {}
+        # Bumped on every invalidation so a read that raced with a write is not cached
+        self.generation = 0
+
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        """
+        Returns:
+            (True, value) on a hit (value is None for a negative entry),
+            (False, None) on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            value = entry[0]
+            if value is None:
+                self._negative_hits += 1
+            else:
+                self._hits += 1
+        return True, _copy(value)
+
+    def put(self, key, value, generation=None):
+        """
+        Cache a document, a listing, or None (negative entry) for key
+
+        Args:
+            generation: self.generation read before the database query; the value is
+                        dropped if something was invalidated since
+        """
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (_copy(value), time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            for doc in value if isinstance(value, list) else [value]:
+                if doc and doc.get('order_id') is not None and 'payment_id' in doc:
+                    self._orders[doc['payment_id']] = doc['order_id']
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+            if len(self._orders) > self.max_entries * 4:
+                self._orders.clear()
+
+    def invalidate_payment(self, payment_id, order_id=None):
+        """Drop a payment and the listing of its order"""
+        with self._lock:
+            self.generation += 1
+            mapped = self._orders.pop(payment_id, None)
+            order_id = order_id if order_id is not None else mapped
+            removed = self._entries.pop(('payment', payment_id), _MISSING) is not _MISSING
+            if order_id is not None:
+                removed |= self._entries.pop(('order', order_id), _MISSING) is not _MISSING
+            if removed:
+                self._invalidations += 1
+
+    def invalidate_order(self, order_id):
+        with self._lock:
+            self.generation += 1
+            if self._entries.pop(('order', order_id), _MISSING) is not _MISSING:
+                self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._orders.clear()
+
+    def stats(self):
+        """Hit-ratio counters for sizing the cache"""
+        with self._lock:
+            lookups = self._hits + self._negative_hits + self._misses
+            return {
+                'size': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl,
+                'negativeTtlSeconds': self.negative_ttl,
+                'hits': self._hits,
+                'negativeHits': self._negative_hits,
+                'misses': self._misses,
+                'hitRatio': round((self._hits + self._negative_hits) / lookups, 4) if lookups else None,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations
+            }
+
+
+def _copy(value):
+    # Callers may mutate what they get back; keep the cached documents intact
+    if isinstance(value, list):
+        return [dict(doc) for doc in value]
+    return dict(value) if value is not None else None
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_payment_cache():
+    """Process-wide cache shared by every PaymentRepository (None when PAYMENT_CACHE_SIZE is 0)"""
+    global _shared_cache
+    if Config.PAYMENT_CACHE_SIZE <= 0:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = PaymentCache(
+                max_entries=Config.PAYMENT_CACHE_SIZE,
+                ttl=Config.PAYMENT_CACHE_TTL,
+                negative_ttl=Config.PAYMENT_CACHE_NEGATIVE_TTL
+            )
+        return _shared_cache
@@ -2,95 +2,607 @@
 Payment Repository - Data Access Layer
 Handles MongoDB operations for payments
 """
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from datetime import datetime, timedelta
+import base64
+import json
 import logging
 from config.config import Config
+from repository.write_buffer import PaymentWriteBuffer
+from repository.indexes import missing_payment_id_index
+from repository.payment_cache import get_payment_cache
+from repository.rollups import PaymentRollups, ROLLUP_COLLECTION, ROLLUP_FIELDS
+from repository.outbox import OUTBOX_COLLECTION, EVENT_FIELDS, build_event, event_for_status
+from utils.metrics import MongoCommandMetrics
 
 logger = logging.getLogger(__name__)
 
+# Listing order; payment_id breaks created_at ties so every page boundary is unique
+LISTING_SORT = [('created_at', -1), ('payment_id', -1)]
+MAX_PAGE_SIZE = 1000
+
+# Indexes are created by `python -m repository.migrate`; the unique payment_id
+# index that idempotency reservations rely on is only checked, once per process
+_payment_id_index_checked = False
+
+# Field set for listings and history views (skips gateway payloads and idempotency data)
+PAYMENT_SUMMARY_FIELDS = (
+    'payment_id', 'order_id', 'user_id', 'amount', 'payment_method',
+    'status', 'reference_code', 'created_at', 'updated_at'
+)
+
+# Statuses a checkout reservation is never reclaimed from (the order already reached PayU)
+UNRECLAIMABLE_STATUSES = ['APPROVED', 'PENDING']
+
+# Pre-image of a status change: cache invalidation, old rollup bucket and outbox payload
+STATUS_CHANGE_FIELDS = tuple(dict.fromkeys(('order_id',) + ROLLUP_FIELDS + EVENT_FIELDS))
+
+
+def build_projection(fields, required=()):
+    """
+    Normalize a projection argument for find()
+    
+    Args:
+        fields: None for whole documents, a dict projection, or an iterable of field names
+        required: Fields an inclusion projection must keep (e.g. the pagination keys)
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, dict):
+        projection = dict(fields)
+    else:
+        projection = {field: 1 for field in fields}
+    if any(value for key, value in projection.items() if key != '_id'):
+        for field in required:
+            projection[field] = 1
+    return projection
+
+
+def encode_cursor(doc):
+    """Opaque pagination token pointing after the given document"""
+    raw = json.dumps([doc['created_at'].isoformat(), doc['payment_id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a token produced by encode_cursor
+    
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, payment_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(payment_id)
+    except Exception:
+        raise ValueError('Invalid pagination cursor')
+
+
 class PaymentRepository:
-    def __init__(self):
-        """Initialize MongoDB connection"""
+    def __init__(self, buffered=None, cache=None):
+        """
+        Initialize MongoDB connection
+        
+        Args:
+            buffered: Batch create_payment/update_payment_status writes through a
+                      PaymentWriteBuffer (defaults to PAYMENT_WRITE_BUFFER)
+            cache: PaymentCache for get_payment_by_id/get_payments_by_order; None uses the
+                   process-wide cache (PAYMENT_CACHE_SIZE), False disables caching
+        """
         self.config = Config()
+        self.write_buffer = None
+        self.cache = get_payment_cache() if cache is None else (cache or None)
         try:
-            self.client = MongoClient(self.config.MONGO_URI)
+            self.client = MongoClient(
+                self.config.MONGO_URI,
+                serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                # Latency of every command (including buffered bulk writes) for /metrics
+                event_listeners=[MongoCommandMetrics()]
+            )
             self.db = self.client[self.config.MONGO_DB]
             self.payments = self.db.payments
-            
-            # Create indexes
-            self.payments.create_index('payment_id', unique=True)
-            self.payments.create_index('order_id')
-            self.payments.create_index('user_id')
-            self.payments.create_index('status')
+            self.rollups = PaymentRollups(self.db[ROLLUP_COLLECTION]) if self.config.PAYMENT_ROLLUPS else None
+            # Payment events are written with the status change and published by events/outbox_relay.py
+            self.outbox = self.db[OUTBOX_COLLECTION] if self.config.PAYMENT_OUTBOX else None
+            if self.config.PAYMENT_WRITE_BUFFER if buffered is None else buffered:
+                self.write_buffer = PaymentWriteBuffer(
+                    self.payments,
+                    max_batch=self.config.PAYMENT_WRITE_BATCH_SIZE,
+                    max_delay=self.config.PAYMENT_WRITE_MAX_DELAY_MS / 1000,
+                    max_pending=self.config.PAYMENT_WRITE_MAX_PENDING,
+                    on_inserted=self._record_created if self.rollups is not None else None,
+                    # Buffered status updates move their rollup bucket once written
+                    on_updated=self._record_changes if self.rollups is not None else None,
+                    previous_fields=ROLLUP_FIELDS
+                )
             
             logger.info("MongoDB connection established")
         except Exception as e:
             logger.error(f"Error connecting to MongoDB: {str(e)}")
             raise
     
-    def create_payment(self, payment_data):
-        """Create a new payment record"""
+    def create_payment(self, payment_data, wait=True):
+        """
+        Create a new payment record
+        
+        Args:
+            payment_data: Payment document
+            wait: With the write buffer enabled, False returns a Future instead of
+                  waiting for the batch (the _id is assigned before queueing)
+        
+        Returns:
+            Inserted id as a string, or a Future resolving to it
+        """
+        # Listings page on created_at, so every payment needs one
+        payment_data.setdefault('created_at', datetime.utcnow())
+        if self.cache is not None:
+            # Drop a negative entry for this id and the order's cached listing
+            self.cache.invalidate_payment(payment_data['payment_id'], payment_data.get('order_id'))
+        if self.write_buffer is not None and not self._emits_event(payment_data.get('status')):
+            payment_data.setdefault('_id', ObjectId())
+            future = self.write_buffer.insert(payment_data)
+            return future.result(timeout=self.config.PAYMENT_WRITE_TIMEOUT) if wait else future
         try:
-            result = self.payments.insert_one(payment_data)
+            result = self._with_outbox(lambda session: (
+                self.payments.insert_one(payment_data, session=session),
+                [build_event(payment_data)]
+            ))
             logger.info(f"Payment created with ID: {payment_data['payment_id']}")
+            self._record_created([payment_data])
             return str(result.inserted_id)
         except Exception as e:
             logger.error(f"Error creating payment: {str(e)}")
             raise
     
-    def get_payment_by_id(self, payment_id):
-        """Get payment by payment_id"""
+    def get_payment_by_id(self, payment_id, projection=None):
+        """
+        Get payment by payment_id
+        
+        Args:
+            projection: Field names or a dict, None for the whole document. Only whole
+                        documents go through the cache.
+        """
+        cache = self.cache if projection is None else None
+        if cache is not None:
+            hit, doc = cache.get(('payment', payment_id))
+            if hit:
+                return doc
+            generation = cache.generation
         try:
-            return self.payments.find_one({'payment_id': payment_id})
+            doc = self.payments.find_one({'payment_id': payment_id}, build_projection(projection))
+            if cache is not None:
+                cache.put(('payment', payment_id), doc, generation)
+            return doc
         except Exception as e:
             logger.error(f"Error getting payment: {str(e)}")
             return None
     
-    def get_payments_by_user(self, user_id):
+    def get_payments_by_user(self, user_id, projection=None):
         """Get all payments for a user"""
         try:
-            return list(self.payments.find({'user_id': user_id}).sort('created_at', -1))
+            return list(
+                self.payments.find({'user_id': user_id}, build_projection(projection))
+                .sort(LISTING_SORT)
+            )
         except Exception as e:
             logger.error(f"Error getting user payments: {str(e)}")
             return []
     
-    def get_payments_by_order(self, order_id):
-        """Get all payments for an order"""
+    def get_payments_by_order(self, order_id, projection=None):
+        """Get all payments for an order (cached when no projection is given)"""
+        cache = self.cache if projection is None else None
+        if cache is not None:
+            hit, docs = cache.get(('order', order_id))
+            if hit:
+                return docs
+            generation = cache.generation
         try:
-            return list(self.payments.find({'order_id': order_id}))
+            docs = list(self.payments.find({'order_id': order_id}, build_projection(projection)))
+            if cache is not None:
+                cache.put(('order', order_id), docs, generation)
+            return docs
         except Exception as e:
             logger.error(f"Error getting order payments: {str(e)}")
             return []
     
-    def update_payment_status(self, payment_id, status):
-        """Update payment status"""
-        try:
-            result = self.payments.update_one(
+    def update_payment_status(self, payment_id, status, wait=True):
+        """
+        Update payment status
+        
+        Returns:
+            True if the payment was updated, or a Future resolving to it when
+            wait is False and the write buffer is enabled (statuses that emit an
+            outbox event are always written directly)
+        """
+        if self.write_buffer is not None and not self._emits_event(status):
+            future = self.write_buffer.update_status(
+                payment_id, {'status': status, 'updated_at': datetime.utcnow()}
+            )
+            if self.cache is not None:
+                future.add_done_callback(lambda _: self.cache.invalidate_payment(payment_id))
+            if not wait:
+                return future
+            try:
+                return future.result(timeout=self.config.PAYMENT_WRITE_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error updating payment status: {str(e)}")
+                return False
+        def update(session):
+            # The pre-image carries the order_id for cache invalidation and the old rollup bucket
+            previous = self.payments.find_one_and_update(
                 {'payment_id': payment_id},
                 {
                     '$set': {
                         'status': status,
                         'updated_at': datetime.utcnow()
                     }
-                }
+                },
+                projection=build_projection(STATUS_CHANGE_FIELDS),
+                session=session
             )
+            return previous, [build_event(previous, status)] if previous else []
+        try:
+            previous = self._with_outbox(update)
+            if self.cache is not None:
+                self.cache.invalidate_payment(payment_id, previous.get('order_id') if previous else None)
+            if previous is not None:
+                self._record_change(previous, dict(previous, status=status))
             logger.info(f"Payment {payment_id} status updated to {status}")
-            return result.modified_count > 0
+            return previous is not None
         except Exception as e:
             logger.error(f"Error updating payment status: {str(e)}")
             return False
     
-    def get_all_payments(self, limit=100, skip=0):
-        """Get all payments with pagination"""
+    def apply_status_changes(self, changes):
+        """
+        Apply many status changes with one bulk write
+        
+        Each update only matches while the payment still has the status of its
+        pre-image, so a change that raced with another writer (a PayU confirmation,
+        the reconciliation worker) is skipped and the rollups stay exact.
+        
+        Args:
+            changes: (previous, status, fields) tuples; previous is the caller's
+                     STATUS_CHANGE_FIELDS pre-image (with payment_id) and fields are
+                     extra values to $set along with the status
+        
+        Returns:
+            The applied (previous, status, fields) tuples
+        """
+        if not changes:
+            return []
+        now = datetime.utcnow()
+        # Marks this batch's writes so skipped updates can be told apart
+        batch_id = ObjectId()
+        requests = [
+            UpdateOne(
+                {'payment_id': previous['payment_id'], 'status': previous['status']},
+                {'$set': dict(fields or {}, status=status, updated_at=now, status_batch_id=batch_id)}
+            )
+            for previous, status, fields in changes
+        ]
+        
+        def write(session):
+            result = self.payments.bulk_write(requests, ordered=False, session=session)
+            applied = changes
+            if result.modified_count != len(requests):
+                updated = {
+                    doc['payment_id'] for doc in self.payments.find(
+                        {
+                            'payment_id': {'$in': [previous['payment_id'] for previous, _, _ in changes]},
+                            'status_batch_id': batch_id
+                        },
+                        {'payment_id': 1},
+                        session=session
+                    )
+                }
+                applied = [change for change in changes if change[0]['payment_id'] in updated]
+            return applied, [build_event(previous, status) for previous, status, _ in applied]
+        
+        try:
+            applied = self._with_outbox(write)
+        except Exception as e:
+            logger.error(f"Error applying status changes: {str(e)}")
+            raise
+        if self.cache is not None:
+            for previous, _, _ in applied:
+                self.cache.invalidate_payment(previous['payment_id'], previous.get('order_id'))
+        if self.rollups is not None and applied:
+            try:
+                self.rollups.apply_many([(previous, dict(previous, status=status)) for previous, status, _ in applied])
+            except Exception as e:
+                logger.error(f"Error updating payment rollups: {str(e)}")
+        return applied
+    
+    def get_all_payments(self, limit=100, skip=0, projection=None):
+        """Get all payments with offset pagination (prefer get_all_payments_page for deep pages)"""
         try:
             return list(
-                self.payments.find()
-                .sort('created_at', -1)
+                self.payments.find({}, build_projection(projection))
+                .sort(LISTING_SORT)
                 .skip(skip)
                 .limit(limit)
             )
         except Exception as e:
             logger.error(f"Error getting all payments: {str(e)}")
             return []
+    
+    def _emits_event(self, status):
+        return self.outbox is not None and event_for_status(status) is not None
+    
+    def _with_outbox(self, write):
+        """
+        Run a payment write and store the outbox events it produces atomically
+        
+        Args:
+            write: Callable(session) -> (result, events); it may run more than once
+                   when MongoDB retries a transient transaction error, so it must not
+                   touch caches or rollups (do that with the returned result)
+        
+        Returns:
+            The write's result
+        """
+        if self.outbox is None:
+            result, _ = write(None)
+            return result
+        
+        def transaction(session):
+            result, events = write(session)
+            events = [event for event in events if event is not None]
+            if events:
+                self.outbox.insert_many(events, session=session)
+            return result
+        
+        with self.client.start_session() as session:
+            return session.with_transaction(transaction)
+    
+    def _record_created(self, docs):
+        """Add new payments to the rollups (never fails the write itself)"""
+        if self.rollups is None:
+            return
+        try:
+            self.rollups.apply_many([(None, doc) for doc in docs])
+        except Exception as e:
+            logger.error(f"Error updating payment rollups: {str(e)}")
+    
+    def _record_changes(self, changes):
+        """Move buffered status changes between rollup buckets (never fails the write itself)"""
+        try:
+            self.rollups.apply_many(changes)
+        except Exception as e:
+            logger.error(f"Error updating payment rollups: {str(e)}")
 
+    def _record_change(self, before, after):
+        """Move a payment between rollup buckets (never fails the write itself)"""
+        if self.rollups is None:
+            return
+        try:
+            self.rollups.apply(before, after)
+        except Exception as e:
+            logger.error(f"Error updating payment rollups: {str(e)}")
+    
+    def get_payment_stats(self, start, end):
+        """Revenue, approval rate and method mix between start and end, read from the rollups only"""
+        rollups = self.rollups or PaymentRollups(self.db[ROLLUP_COLLECTION])
+        return rollups.summary(start, end)
+    
+    def _page(self, query, limit, cursor, projection=None):
+        """
+        Fetch one page in LISTING_SORT order starting after the cursor
+        
+        Returns:
+            (documents, next cursor or None when this is the last page)
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if cursor:
+            created_at, payment_id = decode_cursor(cursor)
+            query = {
+                '$and': [
+                    query,
+                    {'$or': [
+                        {'created_at': {'$lt': created_at}},
+                        {'created_at': created_at, 'payment_id': {'$lt': payment_id}}
+                    ]}
+                ]
+            }
+        # Read one extra document to know whether another page exists
+        projection = build_projection(projection, required=('created_at', 'payment_id'))
+        docs = list(self.payments.find(query, projection).sort(LISTING_SORT).limit(limit + 1))
+        if len(docs) > limit:
+            docs = docs[:limit]
+            return docs, encode_cursor(docs[-1])
+        return docs, None
+    
+    def _stream(self, query, batch_size, projection=None):
+        """Yield every matching document, one keyset page per round-trip"""
+        cursor = None
+        while True:
+            docs, cursor = self._page(query, batch_size, cursor, projection)
+            yield from docs
+            if cursor is None:
+                return
+    
+    def get_all_payments_page(self, limit=100, cursor=None, projection=None):
+        """
+        Get a page of all payments, newest first
+        
+        Args:
+            limit: Page size (capped at MAX_PAGE_SIZE)
+            cursor: next_cursor returned by the previous page, None for the first page
+            projection: Field names or a dict projection (created_at and payment_id are always kept)
+        
+        Returns:
+            (payments, next_cursor)
+        
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        return self._page({}, limit, cursor, projection)
+    
+    def get_payments_by_user_page(self, user_id, limit=100, cursor=None, projection=None):
+        """Get a page of a user's payments, newest first; see get_all_payments_page"""
+        return self._page({'user_id': user_id}, limit, cursor, projection)
+    
+    def get_payments_by_order_page(self, order_id, limit=100, cursor=None, projection=None):
+        """Get a page of an order's payments, newest first; see get_all_payments_page"""
+        return self._page({'order_id': order_id}, limit, cursor, projection)
+    
+    def iter_all_payments(self, batch_size=500, projection=None):
+        """Stream all payments, newest first, without loading them into memory"""
+        return self._stream({}, batch_size, projection)
+    
+    def iter_payments_by_user(self, user_id, batch_size=500, projection=None):
+        """Stream a user's payments, newest first"""
+        return self._stream({'user_id': user_id}, batch_size, projection)
+    
+    def iter_payments_by_order(self, order_id, batch_size=500, projection=None):
+        """Stream an order's payments, newest first"""
+        return self._stream({'order_id': order_id}, batch_size, projection)
+    
+    def _check_payment_id_index(self):
+        global _payment_id_index_checked
+        if _payment_id_index_checked:
+            return
+        _payment_id_index_checked = True
+        try:
+            if missing_payment_id_index(self.payments.index_information()):
+                logger.error("Unique payment_id index missing: idempotency reservations are not atomic "
+                             "until `python -m repository.migrate` runs")
+        except Exception as e:
+            logger.warning(f"Could not check the payment_id index: {str(e)}")
+    
+    def reserve_idempotency_key(self, key, window_seconds, lock_seconds, record=None):
+        """
+        Reserve an idempotency key for a checkout.
+        
+        The key is stored as the payment_id of the checkout's payment record, so the
+        unique payment_id index makes the reservation atomic across workers. A key
+        with a stored response, or whose payment PayU approved or left pending, is
+        never reserved again.
+        
+        Returns:
+            ('reserved', doc) if the caller owns the key and must submit the transaction,
+            ('completed', doc) if a cached response can be replayed,
+            ('in_progress', doc) if another worker is submitting it right now
+        """
+        self._check_payment_id_index()
+        now = datetime.utcnow()
+        fields = dict(record or {})
+        fields.update({
+            'idempotency_key': key,
+            'status': 'PROCESSING',
+            'updated_at': now,
+            'locked_until': now + timedelta(seconds=lock_seconds),
+            'idempotency_expires_at': now + timedelta(seconds=window_seconds)
+        })
+        try:
+            doc = dict(fields, payment_id=key, created_at=now)
+            self.payments.insert_one(doc)
+            if self.cache is not None:
+                self.cache.invalidate_payment(key)
+            self._record_created([doc])
+            return 'reserved', doc
+        except DuplicateKeyError:
+            pass
+        
+        # Reclaim the key only if the previous owner released it (failed attempt) or
+        # died while holding the lock. A stored response is replayed however old it
+        # is: the key is the payment's reference code, and reclaiming it would submit
+        # the order to PayU again and overwrite the record the reconciliation and
+        # confirmation workers match on
+        previous = self.payments.find_one_and_update(
+            {
+                'payment_id': key,
+                'checkout_response': {'$exists': False},
+                'locked_until': {'$lt': now},
+                'status': {'$nin': UNRECLAIMABLE_STATUSES}
+            },
+            {
+                '$set': fields,
+                '$unset': {'checkout_response': '', 'checkout_http_status': ''}
+            },
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous:
+            # The pre-image is needed to move the payment out of its old rollup bucket
+            reclaimed = {
+                k: v for k, v in previous.items()
+                if k not in ('checkout_response', 'checkout_http_status')
+            }
+            reclaimed.update(fields)
+            if self.cache is not None:
+                self.cache.invalidate_payment(key)
+            self._record_change(previous, reclaimed)
+            return 'reserved', reclaimed
+        
+        existing = self.payments.find_one({'payment_id': key})
+        if existing is None:
+            # Deleted between both operations; let the caller retry the reservation
+            return 'in_progress', None
+        if 'checkout_response' in existing:
+            return 'completed', existing
+        return 'in_progress', existing
+    
+    def complete_idempotency_key(self, key, status, response, http_status, window_seconds):
+        """Store the final checkout response so duplicates can replay it"""
+        now = datetime.utcnow()
+        
+        def complete(session):
+            previous = self.payments.find_one_and_update(
+                {'payment_id': key},
+                {
+                    '$set': {
+                        'status': status,
+                        'checkout_response': response,
+                        'checkout_http_status': http_status,
+                        'updated_at': now,
+                        'locked_until': now,
+                        'idempotency_expires_at': now + timedelta(seconds=window_seconds)
+                    }
+                },
+                projection=build_projection(STATUS_CHANGE_FIELDS),
+                session=session
+            )
+            return previous, [build_event(previous, status)] if previous else []
+        
+        previous = self._with_outbox(complete)
+        if self.cache is not None:
+            self.cache.invalidate_payment(key)
+        if previous is not None:
+            self._record_change(previous, dict(previous, status=status))
+        return previous is not None
+    
+    def release_idempotency_key(self, key, status):
+        """Release a reservation without caching the response so the next attempt can retry"""
+        now = datetime.utcnow()
+        
+        def release(session):
+            previous = self.payments.find_one_and_update(
+                {'payment_id': key, 'checkout_response': {'$exists': False}},
+                {'$set': {'status': status, 'updated_at': now, 'locked_until': now}},
+                projection=build_projection(STATUS_CHANGE_FIELDS),
+                session=session
+            )
+            return previous, [build_event(previous, status)] if previous else []
+        
+        previous = self._with_outbox(release)
+        if self.cache is not None:
+            self.cache.invalidate_payment(key)
+        if previous is not None:
+            self._record_change(previous, dict(previous, status=status))
+        return previous is not None
+    
+    def flush(self, timeout=None):
+        """Write any buffered operations (no-op without the write buffer)"""
+        if self.write_buffer is None:
+            return True
+        return self.write_buffer.flush(timeout)
+    
+    def close(self):
+        """Flush buffered writes and close the MongoDB client"""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+        self.client.close()
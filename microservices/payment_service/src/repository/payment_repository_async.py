@@ -0,0 +1,309 @@
+"""
+Async Payment Repository - Data Access Layer for the asyncio server mode
+Same documents, cache, rollups and outbox as PaymentRepository, on the motor driver
+"""
+from datetime import datetime, timedelta
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config.config import Config
+from repository.indexes import missing_payment_id_index
+from repository.payment_cache import get_payment_cache
+from repository.payment_repository import (
+    LISTING_SORT, STATUS_CHANGE_FIELDS, UNRECLAIMABLE_STATUSES, build_projection
+)
+from repository.rollups import PaymentRollups, ROLLUP_COLLECTION
+from repository.outbox import OUTBOX_COLLECTION, build_event
+from utils.metrics import MongoCommandMetrics
+
+logger = logging.getLogger(__name__)
+
+# Checked once per process, created by repository.migrate (see PaymentRepository)
+_payment_id_index_checked = False
+
+
+class AsyncPaymentRepository:
+    def __init__(self, cache=None):
+        """
+        Initialize the motor client (no I/O until the first operation)
+
+        Args:
+            cache: PaymentCache; None uses the process-wide cache, False disables caching
+        """
+        self.config = Config()
+        self.cache = get_payment_cache() if cache is None else (cache or None)
+        self.client = AsyncIOMotorClient(
+            self.config.MONGO_URI,
+            serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            event_listeners=[MongoCommandMetrics()]
+        )
+        self.db = self.client[self.config.MONGO_DB]
+        self.payments = self.db.payments
+        self.rollups = self.db[ROLLUP_COLLECTION] if self.config.PAYMENT_ROLLUPS else None
+        self.outbox = self.db[OUTBOX_COLLECTION] if self.config.PAYMENT_OUTBOX else None
+
+    async def create_payment(self, payment_data):
+        """
+        Create a new payment record
+
+        Returns:
+            Inserted id as a string
+        """
+        payment_data.setdefault('created_at', datetime.utcnow())
+        if self.cache is not None:
+            self.cache.invalidate_payment(payment_data['payment_id'], payment_data.get('order_id'))
+
+        async def insert(session):
+            result = await self.payments.insert_one(payment_data, session=session)
+            return result, [build_event(payment_data)]
+
+        try:
+            result = await self._with_outbox(insert)
+            logger.info(f"Payment created with ID: {payment_data['payment_id']}")
+            await self._record_created([payment_data])
+            return str(result.inserted_id)
+        except Exception as e:
+            logger.error(f"Error creating payment: {str(e)}")
+            raise
+
+    async def get_payment_by_id(self, payment_id, projection=None):
+        """Get payment by payment_id (whole documents go through the cache)"""
+        cache = self.cache if projection is None else None
+        if cache is not None:
+            hit, doc = cache.get(('payment', payment_id))
+            if hit:
+                return doc
+            generation = cache.generation
+        try:
+            doc = await self.payments.find_one({'payment_id': payment_id}, build_projection(projection))
+            if cache is not None:
+                cache.put(('payment', payment_id), doc, generation)
+            return doc
+        except Exception as e:
+            logger.error(f"Error getting payment: {str(e)}")
+            return None
+
+    async def get_payments_by_user(self, user_id, projection=None):
+        """Get all payments for a user"""
+        try:
+            cursor = self.payments.find({'user_id': user_id}, build_projection(projection)).sort(LISTING_SORT)
+            return await cursor.to_list(length=None)
+        except Exception as e:
+            logger.error(f"Error getting user payments: {str(e)}")
+            return []
+
+    async def get_payments_by_order(self, order_id, projection=None):
+        """Get all payments for an order (cached when no projection is given)"""
+        cache = self.cache if projection is None else None
+        if cache is not None:
+            hit, docs = cache.get(('order', order_id))
+            if hit:
+                return docs
+            generation = cache.generation
+        try:
+            docs = await self.payments.find({'order_id': order_id}, build_projection(projection)).to_list(length=None)
+            if cache is not None:
+                cache.put(('order', order_id), docs, generation)
+            return docs
+        except Exception as e:
+            logger.error(f"Error getting order payments: {str(e)}")
+            return []
+
+    async def get_all_payments(self, limit=100, skip=0, projection=None):
+        """Get all payments with offset pagination"""
+        try:
+            cursor = self.payments.find({}, build_projection(projection)).sort(LISTING_SORT).skip(skip).limit(limit)
+            return await cursor.to_list(length=limit)
+        except Exception as e:
+            logger.error(f"Error getting all payments: {str(e)}")
+            return []
+
+    async def update_payment_status(self, payment_id, status):
+        """
+        Update payment status
+
+        Returns:
+            True if the payment was updated
+        """
+        async def update(session):
+            previous = await self.payments.find_one_and_update(
+                {'payment_id': payment_id},
+                {'$set': {'status': status, 'updated_at': datetime.utcnow()}},
+                projection=build_projection(STATUS_CHANGE_FIELDS),
+                session=session
+            )
+            return previous, [build_event(previous, status)] if previous else []
+
+        try:
+            previous = await self._with_outbox(update)
+            if self.cache is not None:
+                self.cache.invalidate_payment(payment_id, previous.get('order_id') if previous else None)
+            if previous is not None:
+                await self._record_change(previous, dict(previous, status=status))
+            logger.info(f"Payment {payment_id} status updated to {status}")
+            return previous is not None
+        except Exception as e:
+            logger.error(f"Error updating payment status: {str(e)}")
+            return False
+
+    async def get_payment_stats(self, start, end):
+        """Revenue, approval rate and method mix between start and end, read from the rollups only"""
+        collection = self.rollups if self.rollups is not None else self.db[ROLLUP_COLLECTION]
+        docs = await collection.find(PaymentRollups.summary_query(start, end)).to_list(length=None)
+        return PaymentRollups.summarize(docs)
+
+    async def _check_payment_id_index(self):
+        global _payment_id_index_checked
+        if _payment_id_index_checked:
+            return
+        _payment_id_index_checked = True
+        try:
+            if missing_payment_id_index(await self.payments.index_information()):
+                logger.error("Unique payment_id index missing: idempotency reservations are not atomic "
+                             "until `python -m repository.migrate` runs")
+        except Exception as e:
+            logger.warning(f"Could not check the payment_id index: {str(e)}")
+
+    async def reserve_idempotency_key(self, key, window_seconds, lock_seconds, record=None):
+        """
+        Reserve an idempotency key for a checkout (see PaymentRepository.reserve_idempotency_key)
+
+        Returns:
+            ('reserved' | 'completed' | 'in_progress', doc)
+        """
+        await self._check_payment_id_index()
+        now = datetime.utcnow()
+        fields = dict(record or {})
+        fields.update({
+            'idempotency_key': key,
+            'status': 'PROCESSING',
+            'updated_at': now,
+            'locked_until': now + timedelta(seconds=lock_seconds),
+            'idempotency_expires_at': now + timedelta(seconds=window_seconds)
+        })
+        try:
+            doc = dict(fields, payment_id=key, created_at=now)
+            await self.payments.insert_one(doc)
+            if self.cache is not None:
+                self.cache.invalidate_payment(key)
+            await self._record_created([doc])
+            return 'reserved', doc
+        except DuplicateKeyError:
+            pass
+
+        previous = await self.payments.find_one_and_update(
+            {
+                'payment_id': key,
+                'checkout_response': {'$exists': False},
+                'locked_until': {'$lt': now},
+                'status': {'$nin': UNRECLAIMABLE_STATUSES}
+            },
+            {
+                '$set': fields,
+                '$unset': {'checkout_response': '', 'checkout_http_status': ''}
+            },
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous:
+            reclaimed = {
+                k: v for k, v in previous.items()
+                if k not in ('checkout_response', 'checkout_http_status')
+            }
+            reclaimed.update(fields)
+            if self.cache is not None:
+                self.cache.invalidate_payment(key)
+            await self._record_change(previous, reclaimed)
+            return 'reserved', reclaimed
+
+        existing = await self.payments.find_one({'payment_id': key})
+        if existing is None:
+            return 'in_progress', None
+        if 'checkout_response' in existing:
+            return 'completed', existing
+        return 'in_progress', existing
+
+    async def complete_idempotency_key(self, key, status, response, http_status, window_seconds):
+        """Store the final checkout response so duplicates can replay it"""
+        now = datetime.utcnow()
+
+        async def complete(session):
+            previous = await self.payments.find_one_and_update(
+                {'payment_id': key},
+                {
+                    '$set': {
+                        'status': status,
+                        'checkout_response': response,
+                        'checkout_http_status': http_status,
+                        'updated_at': now,
+                        'locked_until': now,
+                        'idempotency_expires_at': now + timedelta(seconds=window_seconds)
+                    }
+                },
+                projection=build_projection(STATUS_CHANGE_FIELDS),
+                session=session
+            )
+            return previous, [build_event(previous, status)] if previous else []
+
+        previous = await self._with_outbox(complete)
+        if self.cache is not None:
+            self.cache.invalidate_payment(key)
+        if previous is not None:
+            await self._record_change(previous, dict(previous, status=status))
+        return previous is not None
+
+    async def release_idempotency_key(self, key, status):
+        """Release a reservation without caching the response so the next attempt can retry"""
+        now = datetime.utcnow()
+
+        async def release(session):
+            previous = await self.payments.find_one_and_update(
+                {'payment_id': key, 'checkout_response': {'$exists': False}},
+                {'$set': {'status': status, 'updated_at': now, 'locked_until': now}},
+                projection=build_projection(STATUS_CHANGE_FIELDS),
+                session=session
+            )
+            return previous, [build_event(previous, status)] if previous else []
+
+        previous = await self._with_outbox(release)
+        if self.cache is not None:
+            self.cache.invalidate_payment(key)
+        if previous is not None:
+            await self._record_change(previous, dict(previous, status=status))
+        return previous is not None
+
+    async def _with_outbox(self, write):
+        """Async counterpart of PaymentRepository._with_outbox"""
+        if self.outbox is None:
+            result, _ = await write(None)
+            return result
+
+        async def transaction(session):
+            result, events = await write(session)
+            events = [event for event in events if event is not None]
+            if events:
+                await self.outbox.insert_many(events, session=session)
+            return result
+
+        async with await self.client.start_session() as session:
+            return await session.with_transaction(transaction)
+
+    async def _record_created(self, docs):
+        await self._apply_rollups([(None, doc) for doc in docs])
+
+    async def _record_change(self, before, after):
+        await self._apply_rollups([(before, after)])
+
+    async def _apply_rollups(self, changes):
+        """Move payments between rollup buckets (never fails the write itself)"""
+        if self.rollups is None:
+            return
+        try:
+            requests = PaymentRollups.build_requests(changes)
+            if requests:
+                await self.rollups.bulk_write(requests, ordered=False)
+        except Exception as e:
+            logger.error(f"Error updating payment rollups: {str(e)}")
+
+    def close(self):
+        self.client.close()
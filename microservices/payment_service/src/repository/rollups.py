@@ -0,0 +1,208 @@
+"""
+Materialized payment rollups
+One document per (hour, status, payment_method) with count and amount, kept up to
+date incrementally by PaymentRepository so stats never scan the payments collection.
+
+Rebuild from raw payments (run from src/):
+    python -m repository.rollups [--since-hours 48]
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import MongoClient, UpdateOne
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = 'payment_rollups'
+# Payment fields the rollups need (projection for before-images)
+ROLLUP_FIELDS = ('status', 'payment_method', 'amount', 'created_at')
+# Statuses still waiting for a final outcome (left out of the approval rate)
+OPEN_STATUSES = ('PROCESSING', 'PENDING')
+
+
+def rollup_hour(created_at):
+    return (created_at or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+
+
+def _amount(doc):
+    try:
+        return float(doc.get('amount') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _bucket(doc):
+    # Field order must match the $group _id built by rebuild()
+    return {
+        'hour': rollup_hour(doc.get('created_at')),
+        'status': doc.get('status'),
+        'payment_method': doc.get('payment_method')
+    }
+
+
+class PaymentRollups:
+    """Incremental updates and reads of the payment_rollups collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def apply(self, before, after):
+        """
+        Move one payment between buckets
+
+        Args:
+            before: Payment as it was (None for a new payment)
+            after: Payment as it is now (None for a removed payment)
+        """
+        self.apply_many([(before, after)])
+
+    def apply_many(self, changes):
+        """Apply (before, after) pairs with one unordered bulk_write"""
+        requests = self.build_requests(changes)
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+
+    @staticmethod
+    def build_requests(changes):
+        """UpdateOne upserts for (before, after) pairs (shared with the async repository)"""
+        increments = defaultdict(lambda: [0, 0.0])
+        for before, after in changes:
+            if before is not None and after is not None and _bucket(before) == _bucket(after) \
+                    and _amount(before) == _amount(after):
+                continue
+            for doc, sign in ((before, -1), (after, 1)):
+                if doc is not None:
+                    key = tuple(_bucket(doc).items())
+                    increments[key][0] += sign
+                    increments[key][1] += sign * _amount(doc)
+
+        now = datetime.utcnow()
+        return [
+            UpdateOne(
+                {'_id': dict(key)},
+                {'$inc': {'count': count, 'amount': amount}, '$set': {'updated_at': now}},
+                upsert=True
+            )
+            for key, (count, amount) in increments.items()
+            if count or amount
+        ]
+
+    def summary(self, start, end):
+        """
+        Aggregate rollups between start (inclusive) and end (exclusive)
+
+        Returns:
+            Totals, approved revenue, approval rate, status/method mix and an hourly series
+        """
+        return self.summarize(self.collection.find(self.summary_query(start, end)))
+
+    @staticmethod
+    def summary_query(start, end):
+        return {'_id.hour': {'$gte': start, '$lt': end}}
+
+    @staticmethod
+    def summarize(docs):
+        """Fold rollup documents into the summary() result"""
+        totals = {'count': 0, 'amount': 0.0}
+        approved = {'count': 0, 'amount': 0.0}
+        open_count = 0
+        by_status = defaultdict(lambda: {'count': 0, 'amount': 0.0})
+        by_method = defaultdict(lambda: {'count': 0, 'amount': 0.0})
+        series = defaultdict(lambda: {'count': 0, 'amount': 0.0, 'approved': 0})
+
+        for doc in docs:
+            bucket, count, amount = doc['_id'], doc.get('count', 0), doc.get('amount', 0.0)
+            if not count:
+                continue
+            status = bucket.get('status') or 'UNKNOWN'
+            method = bucket.get('payment_method') or 'UNKNOWN'
+            hour = bucket['hour'].isoformat()
+
+            totals['count'] += count
+            totals['amount'] += amount
+            by_status[status]['count'] += count
+            by_status[status]['amount'] += amount
+            by_method[method]['count'] += count
+            by_method[method]['amount'] += amount
+            series[hour]['count'] += count
+            series[hour]['amount'] += amount
+            if status == 'APPROVED':
+                approved['count'] += count
+                approved['amount'] += amount
+                series[hour]['approved'] += count
+            elif status in OPEN_STATUSES:
+                open_count += count
+
+        finished = totals['count'] - open_count
+        return {
+            'totals': totals,
+            'approved': approved,
+            'approvalRate': round(approved['count'] / finished, 4) if finished else None,
+            'byStatus': dict(by_status),
+            'byMethod': dict(by_method),
+            'series': [dict(point, hour=hour) for hour, point in sorted(series.items())]
+        }
+
+    def rebuild(self, payments, since=None):
+        """
+        Recompute rollups from the payments collection with an aggregation pipeline
+
+        Args:
+            payments: payments collection
+            since: Only recompute hours from this datetime on (None rebuilds everything)
+        """
+        match = {'created_at': {'$gte': rollup_hour(since)}} if since else {'created_at': {'$exists': True}}
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {
+                    'hour': {'$dateFromParts': {
+                        'year': {'$year': '$created_at'},
+                        'month': {'$month': '$created_at'},
+                        'day': {'$dayOfMonth': '$created_at'},
+                        'hour': {'$hour': '$created_at'}
+                    }},
+                    # Missing fields become null, as in the incremental buckets
+                    'status': {'$ifNull': ['$status', None]},
+                    'payment_method': {'$ifNull': ['$payment_method', None]}
+                },
+                'count': {'$sum': 1},
+                'amount': {'$sum': {'$convert': {'input': '$amount', 'to': 'double', 'onError': 0, 'onNull': 0}}}
+            }},
+            {'$set': {'updated_at': '$$NOW'}},
+        ]
+        if since is None:
+            # $out swaps the collection atomically and keeps its indexes
+            pipeline.append({'$out': self.collection.name})
+        else:
+            self.collection.delete_many({'_id.hour': {'$gte': rollup_hour(since)}})
+            pipeline.append({'$merge': {'into': self.collection.name, 'whenMatched': 'replace'}})
+        payments.aggregate(pipeline, allowDiskUse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild payment rollups from the payments collection")
+    parser.add_argument('--since-hours', type=int, default=None,
+                        help='Only recompute the last N hours (default: rebuild everything)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    client = MongoClient(config.MONGO_URI, serverSelectionTimeoutMS=config.MONGO_SERVER_SELECTION_TIMEOUT_MS)
+    db = client[config.MONGO_DB]
+    since = datetime.utcnow() - timedelta(hours=args.since_hours) if args.since_hours else None
+    try:
+        PaymentRollups(db[ROLLUP_COLLECTION]).rebuild(db.payments, since)
+    except Exception as e:
+        logger.error(f"Rollup rebuild failed: {str(e)}")
+        sys.exit(1)
+    finally:
+        client.close()
+    logger.info(f"Rollups rebuilt{f' for the last {args.since_hours} hours' if since else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""
+Buffered bulk writes for the payments collection
+Coalesces payment inserts and status updates into unordered bulk_write batches
+(the PayU confirmation queue uses it for group-committed inserts too)
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentWriteBuffer:
+    """
+    Queues payment writes and flushes them with bulk_write(ordered=False)
+
+    A batch is flushed when it reaches max_batch operations or when its oldest
+    operation has waited max_delay seconds. Every queued operation gets a
+    Future resolved with its own outcome once the batch is written.
+    """
+
+    def __init__(self, collection, max_batch=500, max_delay=0.05, max_pending=5000, on_inserted=None,
+                 key_field='payment_id', on_updated=None, previous_fields=None):
+        """
+        Args:
+            collection: pymongo collection the writes go to
+            max_batch: Operations per bulk_write
+            max_delay: Seconds the oldest queued operation may wait before a flush
+            max_pending: Queued operations before writers block (backpressure)
+            on_inserted: Called on the flusher thread with the documents each batch inserted
+            key_field: Unique field identifying a document (updates match on it)
+            on_updated: Called on the flusher thread with (previous, updated) pairs for the
+                        documents each batch updated (see _with_previous and _raced_updates)
+            previous_fields: Pre-image fields read for on_updated (key_field and status are
+                             always included)
+        """
+        self.collection = collection
+        self.key_field = key_field
+        self.on_inserted = on_inserted
+        self.on_updated = on_updated
+        self.previous_projection = dict.fromkeys(
+            (key_field, 'status') + tuple(previous_fields or ()), 1
+        )
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.max_pending = max(self.max_batch, max_pending)
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._oldest = None
+        self._closed = False
+        self._flushing = False
+
+        self._batches = 0
+        self._operations = 0
+        self._coalesced = 0
+        self._requeued = 0
+        self._errors = 0
+        self._write_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='payment-write-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def insert(self, document):
+        """
+        Queue an insert (the document must already carry its _id)
+
+        Returns:
+            Future resolved with the inserted id as a string
+        """
+        return self._enqueue(('insert', document[self.key_field], document))
+
+    def update_status(self, payment_id, fields):
+        """
+        Queue a $set on the document whose key_field is payment_id
+
+        Returns:
+            Future resolved with True if the update matched a document
+        """
+        return self._enqueue(('update', payment_id, fields))
+
+    def _enqueue(self, op):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Payment write buffer is closed")
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                # Wake the flusher to start the deadline of the new batch
+                self._oldest = time.monotonic()
+                self._cond.notify_all()
+            self._pending.append((op, future))
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        wait = self._oldest + self.max_delay - time.monotonic()
+                        if len(self._pending) >= self.max_batch or wait <= 0 or self._closed:
+                            break
+                        self._cond.wait(wait)
+                    elif self._closed:
+                        return
+                    else:
+                        self._cond.wait()
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                self._oldest = time.monotonic() if self._pending else None
+                self._flushing = True
+                self._cond.notify_all()
+            try:
+                self._write(batch)
+            except Exception as e:
+                # A failed batch fails its own writes only: the flusher keeps serving the rest
+                logger.error(f"Error writing payment batch of {len(batch)} operations: {str(e)}")
+                self._fail(batch, e)
+            finally:
+                with self._cond:
+                    self._flushing = False
+                    self._cond.notify_all()
+
+    def _fail(self, batch, error):
+        """Resolve every still-pending future of the batch with the error"""
+        for _, future in batch:
+            if not future.done():
+                self._errors += 1
+                future.set_exception(error)
+
+    def _write(self, batch):
+        """Write one batch and resolve each operation's future"""
+        # An unordered bulk_write may apply operations in any order, so every update is
+        # folded into the earlier insert or update of the same payment (last write wins)
+        entries = []
+        positions = {}
+        for (kind, payment_id, data), future in batch:
+            if kind == 'update' and payment_id in positions:
+                entry = entries[positions[payment_id]]
+                entry[2].update(data)
+                entry[3].append((future, True))
+                self._coalesced += 1
+                continue
+            positions[payment_id] = len(entries)
+            value = str(data['_id']) if kind == 'insert' else True
+            entries.append((kind, payment_id, dict(data), [(future, value)]))
+
+        previous = {}
+        if self.on_updated is not None:
+            entries, previous = self._with_previous(batch, entries)
+            if not entries:
+                return
+
+        # Updates of a known pre-image only apply while the document still has its status
+        # and mark themselves, so the ones that raced with another writer can be found
+        batch_id = ObjectId()
+        requests = [
+            InsertOne(data) if kind == 'insert'
+            else UpdateOne(
+                {self.key_field: payment_id, 'status': previous[payment_id].get('status')},
+                {'$set': dict(data, status_batch_id=batch_id)}
+            ) if payment_id in previous
+            else UpdateOne({self.key_field: payment_id}, {'$set': data})
+            for kind, payment_id, data, _ in entries
+        ]
+        updates = sum(1 for entry in entries if entry[0] == 'update')
+
+        failed = {}
+        matched = updates
+        started = time.perf_counter()
+        try:
+            matched = self.collection.bulk_write(requests, ordered=False).matched_count
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                failed[error['index']] = error
+            matched = e.details.get('nMatched', updates)
+        except Exception as e:
+            logger.error(f"Error writing payment batch of {len(requests)} operations: {str(e)}")
+            self._errors += len(batch)
+            for entry in entries:
+                for future, _ in entry[3]:
+                    future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        unmatched = set()
+        raced = set()
+        if matched < updates - sum(1 for i in failed if entries[i][0] == 'update'):
+            if previous:
+                try:
+                    raced = self._raced_updates(entries, previous, batch_id, failed)
+                except Exception as e:
+                    # The batch is written but which updates applied is unknown: fail its
+                    # futures (see _run) and leave the rollups to `python -m repository.rollups`
+                    logger.error(
+                        f"Error checking raced payment updates, rollups of this batch not applied: {str(e)}"
+                    )
+                    raise
+            unmatched = self._unmatched_updates(entries) - raced
+
+        self._batches += 1
+        self._operations += len(batch)
+        self._errors += sum(len(entries[i][3]) for i in failed)
+        self._write_seconds += elapsed
+        logger.info(
+            f"Payment batch written: {len(requests)} operations "
+            f"({len(failed)} failed) in {elapsed * 1000:.1f} ms"
+        )
+
+        if self.on_inserted is not None:
+            docs = [data for i, (kind, _, data, _) in enumerate(entries) if kind == 'insert' and i not in failed]
+            if docs:
+                try:
+                    self.on_inserted(docs)
+                except Exception as e:
+                    logger.error(f"Error in payment batch insert hook: {str(e)}")
+
+        if previous:
+            changes = [
+                (previous[payment_id], dict(previous[payment_id], **data))
+                for i, (kind, payment_id, data, _) in enumerate(entries)
+                if payment_id in previous and i not in failed and payment_id not in raced | unmatched
+            ]
+            if changes:
+                try:
+                    self.on_updated(changes)
+                except Exception as e:
+                    logger.error(f"Error in payment batch update hook: {str(e)}")
+
+        if raced:
+            # Written again in the next batch against a fresh pre-image
+            with self._cond:
+                self._pending[:0] = [item for item in batch if item[0][0] == 'update' and item[0][1] in raced]
+                self._oldest = time.monotonic() - self.max_delay
+                self._requeued += len(raced)
+                self._cond.notify_all()
+
+        for index, (kind, payment_id, _, owners) in enumerate(entries):
+            if payment_id in raced:
+                continue
+            error = failed.get(index)
+            for future, value in owners:
+                if error is not None:
+                    future.set_exception(BulkWriteError({'writeErrors': [error]}))
+                elif kind == 'update' and payment_id in unmatched:
+                    future.set_result(False)
+                else:
+                    future.set_result(value)
+
+    def _with_previous(self, batch, entries):
+        """
+        Read the pre-images of the batch's updates with one query
+
+        Returns:
+            (entries left to write, {payment_id: pre-image}); an update whose document
+            does not exist yet is resolved as unmatched right away
+        """
+        ids = [payment_id for kind, payment_id, _, _ in entries if kind == 'update']
+        if not ids:
+            return entries, {}
+        try:
+            previous = {
+                doc[self.key_field]: doc
+                for doc in self.collection.find({self.key_field: {'$in': ids}}, self.previous_projection)
+            }
+        except Exception as e:
+            logger.error(f"Error reading pre-images of {len(ids)} payment updates: {str(e)}")
+            self._errors += sum(len(entry[3]) for entry in entries)
+            for entry in entries:
+                for future, _ in entry[3]:
+                    future.set_exception(e)
+            return [], {}
+        left = []
+        for entry in entries:
+            if entry[0] == 'update' and entry[1] not in previous:
+                for future, _ in entry[3]:
+                    future.set_result(False)
+            else:
+                left.append(entry)
+        return left, previous
+
+    def _raced_updates(self, entries, previous, batch_id, failed):
+        """payment_ids whose conditional update lost a race with another writer"""
+        ids = [
+            payment_id for i, (kind, payment_id, _, _) in enumerate(entries)
+            if kind == 'update' and payment_id in previous and i not in failed
+        ]
+        written = {
+            doc[self.key_field]
+            for doc in self.collection.find(
+                {self.key_field: {'$in': ids}, 'status_batch_id': batch_id}, {self.key_field: 1}
+            )
+        }
+        return set(ids) - written
+
+    def _unmatched_updates(self, entries):
+        """payment_ids of updates that matched nothing (only runs when the batch counts disagree)"""
+        ids = [payment_id for kind, payment_id, _, _ in entries if kind == 'update']
+        existing = {
+            doc[self.key_field]
+            for doc in self.collection.find({self.key_field: {'$in': ids}}, {self.key_field: 1})
+        }
+        return set(ids) - existing
+
+    def flush(self, timeout=None):
+        """Write everything queued so far; returns False if the timeout expired first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._pending:
+                self._oldest = time.monotonic() - self.max_delay
+                self._cond.notify_all()
+            while self._pending or self._flushing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Flush pending writes and stop the flusher thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Payment write buffer closed with {len(self._pending)} operation(s) unwritten")
+
+    def stats(self):
+        """Batching counters for monitoring"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'batches': self._batches,
+            'operations': self._operations,
+            'coalescedUpdates': self._coalesced,
+            'requeuedUpdates': self._requeued,
+            'errors': self._errors,
+            'avgBatchSize': round(self._operations / self._batches, 1) if self._batches else None,
+            'avgBatchMs': round(self._write_seconds / self._batches * 1000, 2) if self._batches else None
+        }
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+from services.checkout import (
+    build_checkout_response, client_session_data, payment_record, reference_code, validate_checkout
+)
+
+# Lógica de las rutas de pago que no depende del framework.
+# La comparten payment_routes (Flask, workers síncronos) y payment_routes_async
+# (Quart/asyncio) para que ambos modos respondan exactamente lo mismo. Las reglas
+# del checkout en sí viven en services.checkout (también las usa PaymentService).
+
+# Rango máximo consultable en /stats (los rollups son por hora)
+STATS_MAX_RANGE = timedelta(days=92)
+
+INTERNAL_ERROR_RESPONSE = ({"error": "Error interno del servidor", "status": "INTERNAL_ERROR"}, 500)
+BUSY_RESPONSE = ({"error": "Servicio de pagos saturado, reintente más tarde", "status": "BUSY"}, 503)
+RATE_LIMITED_RESPONSE = (
+    {"error": "Demasiadas solicitudes de checkout, reintente más tarde", "status": "RATE_LIMITED"}, 429
+)
+
+
+def admission_rejection(admission):
+    """(body, status) de un checkout rechazado por el control de admisión."""
+    return BUSY_RESPONSE if admission.reason == 'busy' else RATE_LIMITED_RESPONSE
+
+
+def wants_async(headers, args):
+    # Modo asíncrono opt-in: cabecera estándar "Prefer: respond-async" o ?async=true
+    prefer = headers.get('Prefer', '')
+    if 'respond-async' in prefer.lower():
+        return True
+    return args.get('async', '').lower() in ('1', 'true', 'yes')
+
+
+def idempotency_key(data, headers):
+    # Mismo referenceCode que envía payment_service a PayU; una Idempotency-Key
+    # del cliente se acota a la orden para que no colisione entre órdenes
+    client_key = headers.get('Idempotency-Key', '').strip()
+    if client_key:
+        return f"{reference_code(data)}:{client_key}"
+    return reference_code(data)
+
+
+def banks_response(payu_response):
+    """(body, status) de /banks/pse a partir de la respuesta de PayU."""
+    if payu_response.get('code') == "SUCCESS":
+        return {
+            "code": "SUCCESS",
+            "banks": payu_response.get('banks', [])
+        }, 200
+    return {
+        "error": "Fallo al obtener la lista de bancos PayU",
+        "details": payu_response.get('error')
+    }, 400
+
+
+def parse_stats_range(args):
+    """Lee ?from=&to= (ISO 8601, UTC). Por defecto las últimas 24 horas."""
+    end = datetime.fromisoformat(args['to']) if args.get('to') else datetime.utcnow()
+    start = datetime.fromisoformat(args['from']) if args.get('from') else end - timedelta(hours=24)
+    # Los rollups se guardan en UTC sin zona horaria
+    start, end = (d.replace(tzinfo=None) - (d.utcoffset() or timedelta()) for d in (start, end))
+    if start >= end:
+        raise ValueError("'from' debe ser anterior a 'to'")
+    if end - start > STATS_MAX_RANGE:
+        raise ValueError(f"El rango máximo es de {STATS_MAX_RANGE.days} días")
+    return start, end
+
+
+def stats_response(stats, start, end):
+    return dict(stats, **{"from": start.isoformat(), "to": end.isoformat()})
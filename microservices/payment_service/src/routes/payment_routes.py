@@ -1,117 +1,194 @@
-from flask import Blueprint, request, jsonify
-from src.services.payment_service import build_cc_payload, build_pse_payload, get_pse_banks
+import threading
+import time
+from flask import Blueprint, request, jsonify, url_for
+from services.payment_service import build_cc_payload, build_pse_payload, get_pse_banks, get_payu_client, get_pse_banks_cache_stats, get_payu_resilience_stats
+from services.checkout_queue import CheckoutQueue, PROCESSING
+from services.idempotency import IdempotencyStore
+from services.confirmations import get_confirmation_stats, receive_confirmation
+from services.admission import admit_checkout, get_admission_stats, release_checkout
+from repository.payment_repository import PaymentRepository
+from repository.payment_cache import get_payment_cache
+from repository.checkout_jobs import CheckoutJobStore
+from utils.metrics import CHECKOUT_SECONDS
+from routes.checkout_common import (
+    BUSY_RESPONSE, INTERNAL_ERROR_RESPONSE, admission_rejection, banks_response, build_checkout_response,
+    client_session_data, idempotency_key, parse_stats_range, payment_record, stats_response, validate_checkout,
+    wants_async
+)
 
 # Definimos el Blueprint para las rutas de pago
 payment_bp = Blueprint('payment', __name__)
 
-# Estados que indican una transacción exitosa o en proceso
-SUCCESS_STATUS = ["APPROVED", "PENDING"]
+# Pool acotado para el modo de checkout asíncrono (uno por proceso); el estado de
+# cada checkout se comparte en checkout_jobs para que cualquier worker lo responda
+checkout_queue = CheckoutQueue(job_store=CheckoutJobStore())
+
+# Supresión de duplicados en /checkout (memoria del proceso + colección payments)
+idempotency_store = IdempotencyStore(repository_factory=PaymentRepository)
+
+# Cache de lecturas de pagos del proceso; los eventos de pago lo invalidan entre workers
+# (el listener lo arranca el servidor en cada worker: events.cache_invalidation)
+payment_cache = get_payment_cache()
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    """Repositorio compartido por las rutas de lectura de este worker."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = PaymentRepository()
+        return _repository
 
 @payment_bp.route('/banks/pse', methods=['GET'])
 def list_pse_banks():
     try:
-        payu_response = get_pse_banks()
-        
-        if payu_response.get('code') == "SUCCESS":
-            return jsonify({
-                "code": "SUCCESS",
-                "banks": payu_response.get('banks', [])
-            }), 200
-        else:
-            return jsonify({
-                "error": "Fallo al obtener la lista de bancos PayU", 
-                "details": payu_response.get('error')
-            }), 400
-            
+        body, status = banks_response(get_pse_banks())
+        return jsonify(body), status
     except Exception as e:
         print(f"Error inesperado al listar bancos PSE: {e}")
         return jsonify({"error": "Error interno del servidor"}), 500
 
+@payment_bp.route('/gateway/stats', methods=['GET'])
+def gateway_stats():
+    # Contadores del cliente PayU, caches y colas de este worker
+    return jsonify({
+        "payuClient": get_payu_client().stats(),
+        "payuResilience": get_payu_resilience_stats(),
+        "pseBanksCache": get_pse_banks_cache_stats(),
+        "checkoutQueue": checkout_queue.stats(),
+        "idempotency": idempotency_store.stats(),
+        "paymentCache": payment_cache.stats() if payment_cache is not None else None,
+        "confirmationQueue": get_confirmation_stats(),
+        "admission": get_admission_stats()
+    }), 200
+
+@payment_bp.route('/confirmation', methods=['POST'])
+def payu_confirmation():
+    # Página de confirmación de PayU (notifyUrl): verificar, encolar y responder
+    body, status = receive_confirmation(request.form.to_dict())
+    return jsonify(body), status
+
+@payment_bp.route('/stats', methods=['GET'])
+def payment_stats():
+    # Recaudo, tasa de aprobación y mezcla de medios de pago leídos solo de los rollups
+    try:
+        start, end = parse_stats_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Rango inválido: {e}"}), 400
+    try:
+        stats = get_repository().get_payment_stats(start, end)
+    except Exception as e:
+        print(f"Error al consultar estadísticas de pagos: {e}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    return jsonify(stats_response(stats, start, end)), 200
+
+def _process_checkout_once(data, client_data, key):
+    """Ejecuta el checkout una sola vez por clave. Retorna (body, status, replayed)."""
+    return idempotency_store.execute(key, lambda: _process_checkout(data, client_data), payment_record(data))
+
+def _process_checkout_async_job(data, client_data, key, slot):
+    try:
+        body, status, _ = _process_checkout_once(data, client_data, key)
+    finally:
+        release_checkout(slot)
+    return body, status
+
+def _process_checkout(data, client_data):
+    """Envía la transacción a PayU y retorna (body, status). Bloquea durante la llamada."""
+    method = data['paymentMethod']
+    order_data = data['order']
+    user_data = data['user']
+    
+    if method == "CC":
+        # Llamada al servicio de tarjeta de crédito
+        payu_response = build_cc_payload(order_data, user_data, data['card'], client_data)
+    else:
+        # Llamada al servicio de pago PSE
+        payu_response = build_pse_payload(order_data, user_data, data['pse'], client_data)
+    
+    return build_checkout_response(method, payu_response)
+
 @payment_bp.route('/checkout', methods=['POST'])
 def initiate_checkout():
+    started = time.perf_counter()
+    response, status = _initiate_checkout()
+    method = (request.get_json(silent=True) or {}).get('paymentMethod')
+    CHECKOUT_SECONDS.labels(
+        method if method in ("CC", "PSE") else "INVALID", str(status)
+    ).observe(time.perf_counter() - started)
+    return response, status
+
+def _initiate_checkout():
     data = request.json
     
     # 1. Validación de datos de entrada mínimos y método de pago
-    method = data.get('paymentMethod')
-    if method not in ["CC", "PSE"]:
-        return jsonify({"error": "paymentMethod debe ser 'CC' o 'PSE'"}), 400
-    if not all(k in data.get('order', {}) for k in ('orderId', 'amount')):
-        return jsonify({"error": "Faltan datos de orden (orderId o amount)"}), 400
-    if not data.get('user'):
-        return jsonify({"error": "Faltan datos de usuario"}), 400
+    validation_error = validate_checkout(data)
+    if validation_error:
+        body, status = validation_error
+        return jsonify(body), status
+
+    # 2. Control de admisión: límites por usuario e IP y cupo global de checkouts en curso
+    admission = admit_checkout(data, request.headers, request.remote_addr)
+    if not admission.admitted:
+        body, status = admission_rejection(admission)
+        response = jsonify(body)
+        response.headers['Retry-After'] = str(admission.retry_after)
+        return response, status
+    slot = admission.slot
 
     try:
-        order_data = data['order']
-        user_data = data['user']
-        
         # Obtener datos de la sesión del cliente
-        client_data = {
-            "ipAddress": request.remote_addr, 
-            "userAgent": request.headers.get('User-Agent'),
-            "deviceSessionId": data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
-            "cookie": data.get('cookie', 'SIMULATED_COOKIE')
-        }
-
-        payu_response = {}
-        
-        if method == "CC":
-            if not data.get('card'):
-                 return jsonify({"error": "Faltan datos de tarjeta para el método CC"}), 400
-            # Llamada al servicio de tarjeta de crédito
-            payu_response = build_cc_payload(order_data, user_data, data['card'], client_data)
-        
-        elif method == "PSE":
-            if not data.get('pse') or not order_data.get('responseUrl'):
-                 return jsonify({"error": "Faltan datos PSE (bankCode, userType) o responseUrl"}), 400
-            # Llamada al servicio de pago PSE
-            payu_response = build_pse_payload(order_data, user_data, data['pse'], client_data)
-        
-        # 2. Procesar Respuesta PayU (Unificada)
-        transaction_response = payu_response.get('transactionResponse', {})
-        transaction_status = transaction_response.get('state')
-        
-        # Extracción de campos detallados
-        detailed_response = {
-            "transactionId": transaction_response.get('transactionId'),
-            "orderId": transaction_response.get('orderId'),
-            "state": transaction_status,
-            "responseCode": transaction_response.get('responseCode'),
-            "paymentNetworkResponseCode": transaction_response.get('paymentNetworkResponseCode'),
-            "trazabilityCode": transaction_response.get('trazabilityCode'),
-            "authorizationCode": transaction_response.get('authorizationCode'),
-            "responseMessage": transaction_response.get('responseMessage'),
-            "operationDate": transaction_response.get('operationDate')
-        }
-        
-        if payu_response.get('code') == "SUCCESS" and transaction_status in SUCCESS_STATUS:
-            
-            if method == "PSE":
-                # PSE: Retorna la URL de redirección
-                redirection_url = transaction_response.get('extraParameters', {}).get('BANK_URL')
-                return jsonify({
-                    "message": "Redirección a PSE pendiente", 
-                    "status": transaction_status,
-                    "redirectionUrl": redirection_url,
-                    "details": detailed_response
-                }), 200
-            else:
-                # CC: Retorna el estado final
-                return jsonify({
-                    "message": "Transacción procesada correctamente", 
-                    "status": transaction_status,
-                    "details": detailed_response
-                }), 200
-        else:
-            # Transacción RECHAZADA o ERROR de API
-            error_message = payu_response.get('error') or transaction_response.get('responseMessage', 'Transacción rechazada o fallida')
-            
-            return jsonify({
-                "error": "Fallo en el pago",
-                "details": error_message,
-                "status": transaction_status or 'ERROR',
-                "payuResponseDetails": detailed_response 
-            }), 400
+        client_data = client_session_data(data, request.headers, request.remote_addr)
+
+        key = idempotency_key(data, request.headers)
+
+        if wants_async(request.headers, request.args):
+            # 3a. Modo asíncrono: encolar y responder 202 con el handle del checkout
+            checkout_id = checkout_queue.submit(_process_checkout_async_job, data, client_data, key, slot)
+            if checkout_id is None:
+                body, status = BUSY_RESPONSE
+                response = jsonify(body)
+                response.headers['Retry-After'] = '2'
+                return response, status
+            # El trabajo encolado libera el cupo al terminar
+            slot = None
+            status_url = url_for('payment.checkout_status', checkout_id=checkout_id)
+            response = jsonify({
+                "message": "Checkout en proceso",
+                "checkoutId": checkout_id,
+                "status": PROCESSING,
+                "statusUrl": status_url
+            })
+            response.headers['Location'] = status_url
+            return response, 202
+
+        # 3b. Modo síncrono: procesar respuesta PayU (unificada)
+        body, status, replayed = _process_checkout_once(data, client_data, key)
+        response = jsonify(body)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response, status
             
     except Exception as e:
         print(f"Error inesperado al procesar el checkout: {e}")
-        return jsonify({"error": "Error interno del servidor", "status": "INTERNAL_ERROR"}), 500
\ No newline at end of file
+        body, status = INTERNAL_ERROR_RESPONSE
+        return jsonify(body), status
+    finally:
+        release_checkout(slot)
+
+@payment_bp.route('/checkout/<checkout_id>', methods=['GET'])
+def checkout_status(checkout_id):
+    job = checkout_queue.get(checkout_id)
+    if job is None:
+        return jsonify({"error": "Checkout no encontrado o expirado"}), 404
+
+    if job['status'] == PROCESSING:
+        response = jsonify({"checkoutId": checkout_id, "status": PROCESSING})
+        response.headers['Retry-After'] = '1'
+        return response, 202
+
+    # Respuesta final: mismo cuerpo y código que el modo síncrono
+    body, status = job['result']
+    return jsonify(dict(body, checkoutId=checkout_id)), status
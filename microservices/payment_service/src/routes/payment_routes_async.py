@@ -0,0 +1,202 @@
+import asyncio
+import time
+from quart import Blueprint, request, jsonify, url_for
+from services.payment_service import get_pse_banks_cache_stats
+from services import payment_service_async
+from services.payment_service_async import build_cc_payload, build_pse_payload, get_pse_banks_async, get_payu_resilience_stats
+from services.checkout_queue import AsyncCheckoutQueue, PROCESSING
+from services.idempotency import AsyncIdempotencyStore
+from services.confirmations import get_confirmation_stats, receive_confirmation
+from services.admission import admit_checkout, get_admission_stats, release_checkout
+from repository.payment_repository_async import AsyncPaymentRepository
+from repository.payment_cache import get_payment_cache
+from repository.checkout_jobs import CheckoutJobStore
+from utils.metrics import CHECKOUT_SECONDS
+from routes.checkout_common import (
+    BUSY_RESPONSE, INTERNAL_ERROR_RESPONSE, admission_rejection, banks_response, build_checkout_response,
+    client_session_data, idempotency_key, parse_stats_range, payment_record, stats_response, validate_checkout,
+    wants_async
+)
+
+# Blueprint de Quart con las mismas rutas y respuestas que routes/payment_routes.py.
+# Todo corre en el event loop: una llamada a PayU en curso es una corrutina
+# suspendida, no un worker ocupado.
+payment_bp = Blueprint('payment', __name__)
+
+# Checkouts en segundo plano (tareas del loop) para el modo 202; su estado se
+# comparte en checkout_jobs para que cualquier worker o réplica lo responda
+checkout_queue = AsyncCheckoutQueue(job_store=CheckoutJobStore())
+
+_repository = None
+
+def get_repository():
+    """Repositorio motor compartido por las rutas del proceso."""
+    global _repository
+    if _repository is None:
+        _repository = AsyncPaymentRepository()
+    return _repository
+
+# Supresión de duplicados en /checkout (memoria del proceso + colección payments)
+idempotency_store = AsyncIdempotencyStore(repository_factory=get_repository)
+
+# Cache de lecturas de pagos; el listener de invalidación corre en su propio hilo
+# y lo arranca server/app_async.py al empezar a servir
+payment_cache = get_payment_cache()
+
+@payment_bp.after_app_serving
+async def close_clients():
+    await payment_service_async.close()
+    checkout_queue.shutdown()
+    if _repository is not None:
+        _repository.close()
+
+@payment_bp.route('/banks/pse', methods=['GET'])
+async def list_pse_banks():
+    try:
+        body, status = banks_response(await get_pse_banks_async())
+        return jsonify(body), status
+    except Exception as e:
+        print(f"Error inesperado al listar bancos PSE: {e}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+@payment_bp.route('/gateway/stats', methods=['GET'])
+async def gateway_stats():
+    # Contadores del cliente PayU, caches y colas de este proceso
+    return jsonify({
+        "payuClient": payment_service_async.get_payu_client().stats(),
+        "payuResilience": get_payu_resilience_stats(),
+        "pseBanksCache": get_pse_banks_cache_stats(),
+        "checkoutQueue": checkout_queue.stats(),
+        "idempotency": idempotency_store.stats(),
+        "paymentCache": payment_cache.stats() if payment_cache is not None else None,
+        "confirmationQueue": get_confirmation_stats(),
+        "admission": get_admission_stats()
+    }), 200
+
+@payment_bp.route('/confirmation', methods=['POST'])
+async def payu_confirmation():
+    # La escritura agrupada espera en un hilo del pool, no en el event loop
+    form = (await request.form).to_dict()
+    body, status = await asyncio.to_thread(receive_confirmation, form)
+    return jsonify(body), status
+
+@payment_bp.route('/stats', methods=['GET'])
+async def payment_stats():
+    # Recaudo, tasa de aprobación y mezcla de medios de pago leídos solo de los rollups
+    try:
+        start, end = parse_stats_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Rango inválido: {e}"}), 400
+    try:
+        stats = await get_repository().get_payment_stats(start, end)
+    except Exception as e:
+        print(f"Error al consultar estadísticas de pagos: {e}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    return jsonify(stats_response(stats, start, end)), 200
+
+async def _process_checkout_once(data, client_data, key):
+    """Ejecuta el checkout una sola vez por clave. Retorna (body, status, replayed)."""
+    return await idempotency_store.execute(key, lambda: _process_checkout(data, client_data), payment_record(data))
+
+async def _process_checkout_async_job(data, client_data, key, slot):
+    try:
+        body, status, _ = await _process_checkout_once(data, client_data, key)
+    finally:
+        await asyncio.to_thread(release_checkout, slot)
+    return body, status
+
+async def _process_checkout(data, client_data):
+    """Envía la transacción a PayU y retorna (body, status)."""
+    method = data['paymentMethod']
+    if method == "CC":
+        payu_response = await build_cc_payload(data['order'], data['user'], data['card'], client_data)
+    else:
+        payu_response = await build_pse_payload(data['order'], data['user'], data['pse'], client_data)
+    return build_checkout_response(method, payu_response)
+
+@payment_bp.route('/checkout', methods=['POST'])
+async def initiate_checkout():
+    started = time.perf_counter()
+    data = await request.get_json(silent=True)
+    response, status = await _initiate_checkout(data)
+    method = (data or {}).get('paymentMethod')
+    CHECKOUT_SECONDS.labels(
+        method if method in ("CC", "PSE") else "INVALID", str(status)
+    ).observe(time.perf_counter() - started)
+    return response, status
+
+async def _initiate_checkout(data):
+    if data is None:
+        # Flask responde 415/400 cuando el cuerpo no es JSON
+        return jsonify({"error": "Se esperaba un cuerpo JSON"}), 400
+
+    # 1. Validación de datos de entrada mínimos y método de pago
+    validation_error = validate_checkout(data)
+    if validation_error:
+        body, status = validation_error
+        return jsonify(body), status
+
+    # 2. Control de admisión (SQLite compartido): fuera del event loop por si hay contención
+    admission = await asyncio.to_thread(admit_checkout, data, request.headers, request.remote_addr)
+    if not admission.admitted:
+        body, status = admission_rejection(admission)
+        response = jsonify(body)
+        response.headers['Retry-After'] = str(admission.retry_after)
+        return response, status
+    slot = admission.slot
+
+    try:
+        # Obtener datos de la sesión del cliente
+        client_data = client_session_data(data, request.headers, request.remote_addr)
+
+        key = idempotency_key(data, request.headers)
+
+        if wants_async(request.headers, request.args):
+            # 3a. Modo asíncrono: agendar y responder 202 con el handle del checkout
+            checkout_id = await checkout_queue.submit(_process_checkout_async_job, data, client_data, key, slot)
+            if checkout_id is None:
+                body, status = BUSY_RESPONSE
+                response = jsonify(body)
+                response.headers['Retry-After'] = '2'
+                return response, status
+            # La tarea agendada libera el cupo al terminar
+            slot = None
+            status_url = url_for('payment.checkout_status', checkout_id=checkout_id)
+            response = jsonify({
+                "message": "Checkout en proceso",
+                "checkoutId": checkout_id,
+                "status": PROCESSING,
+                "statusUrl": status_url
+            })
+            response.headers['Location'] = status_url
+            return response, 202
+
+        # 3b. Modo síncrono: la corrutina espera a PayU sin bloquear el proceso
+        body, status, replayed = await _process_checkout_once(data, client_data, key)
+        response = jsonify(body)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response, status
+
+    except Exception as e:
+        print(f"Error inesperado al procesar el checkout: {e}")
+        body, status = INTERNAL_ERROR_RESPONSE
+        return jsonify(body), status
+    finally:
+        if slot is not None:
+            await asyncio.to_thread(release_checkout, slot)
+
+@payment_bp.route('/checkout/<checkout_id>', methods=['GET'])
+async def checkout_status(checkout_id):
+    job = await checkout_queue.get(checkout_id)
+    if job is None:
+        return jsonify({"error": "Checkout no encontrado o expirado"}), 404
+
+    if job['status'] == PROCESSING:
+        response = jsonify({"checkoutId": checkout_id, "status": PROCESSING})
+        response.headers['Retry-After'] = '1'
+        return response, 202
+
+    # Respuesta final: mismo cuerpo y código que el modo síncrono
+    body, status = job['result']
+    return jsonify(dict(body, checkoutId=checkout_id)), status
@@ -0,0 +1,266 @@
+import ipaddress
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from utils.metrics import ADMISSION_DECISIONS
+
+# Control de admisión de /checkout compartido por todos los workers de gunicorn.
+# Un token bucket por usuario y otro por IP de cliente frenan las ráfagas de un
+# solo cliente (429) y un cupo global de checkouts en curso protege los workers y
+# la cuota de PayU (503). El estado vive en una base SQLite en memoria compartida
+# (/dev/shm): cada decisión es una transacción local de microsegundos, sin red.
+# Si la base falla la solicitud se admite: el control de admisión no debe tumbar
+# los checkouts legítimos.
+
+_DEFAULT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+ADMISSION_DB_PATH = os.getenv("ADMISSION_DB_PATH", os.path.join(_DEFAULT_DIR, "payment_admission.db"))
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+
+# Checkouts por segundo y ráfaga máxima por usuario (email) y por IP de cliente (0 = sin límite).
+# El email viene en el cuerpo sin autenticar: se normaliza (minúsculas, sin +etiqueta) pero
+# un bot puede rotarlo, así que contra él protegen la cubeta por IP y el cupo global
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", 1))
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", 5))
+ADMISSION_IP_RATE = float(os.getenv("ADMISSION_IP_RATE", 5))
+ADMISSION_IP_BURST = float(os.getenv("ADMISSION_IP_BURST", 20))
+
+# Checkouts en curso entre todos los workers (0 = sin límite). Los cupos de un worker
+# muerto se liberan al llegar al límite y cualquier cupo vence a los ADMISSION_SLOT_TTL
+# segundos (más que el plazo de una llamada a PayU)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 64))
+ADMISSION_SLOT_TTL = float(os.getenv("ADMISSION_SLOT_TTL", 120))
+ADMISSION_BUSY_RETRY_AFTER = int(os.getenv("ADMISSION_BUSY_RETRY_AFTER", 2))
+
+# Proxies de confianza (IPs o redes CIDR separadas por comas), p. ej. los pods del gateway.
+# Si la conexión llega desde uno de ellos la IP de cliente se toma de X-Forwarded-For; si
+# no, es la dirección de la conexión (detrás del gateway sin configurar esto, la cubeta
+# por IP sería un único cupo para todo el sitio)
+ADMISSION_TRUSTED_PROXIES = os.getenv("ADMISSION_TRUSTED_PROXIES", "")
+
+# Cubetas inactivas más viejas que esto se borran (ya estarían llenas)
+BUCKET_IDLE_SECONDS = 3600
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS slots (id TEXT PRIMARY KEY, pid INTEGER NOT NULL, expires REAL NOT NULL)",
+)
+
+
+class Admission:
+    """Resultado de admit(): si entra, su cupo global y, si no, el motivo ('rate_limited' o 'busy') y Retry-After."""
+
+    __slots__ = ('admitted', 'slot', 'reason', 'retry_after')
+
+    def __init__(self, admitted, slot=None, reason=None, retry_after=None):
+        self.admitted = admitted
+        self.slot = slot
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_networks(value):
+    """'10.0.0.0/8, 192.168.1.10' -> (IPv4Network, ...)"""
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(',') if item.strip())
+
+
+TRUSTED_PROXY_NETWORKS = parse_networks(ADMISSION_TRUSTED_PROXIES)
+
+
+def _is_trusted(address, networks):
+    try:
+        ip = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_ip(headers, remote_addr, networks=TRUSTED_PROXY_NETWORKS):
+    """IP del cliente: la de la conexión o, desde un proxy de confianza, la última de
+    X-Forwarded-For que no es otro proxy de confianza (las anteriores las escribe el cliente)."""
+    if not networks or not remote_addr or not _is_trusted(remote_addr, networks):
+        return remote_addr
+    hops = [hop.strip() for hop in headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, networks):
+            return hop
+    return hops[0] if hops else remote_addr
+
+
+def user_key(email):
+    # Variantes triviales del mismo buzón comparten cubeta
+    if not email:
+        return None
+    local, _, domain = str(email).strip().lower().partition('@')
+    return f"{local.split('+', 1)[0]}@{domain}" if domain else local
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdmissionController:
+    """Token buckets por usuario e IP y cupo global de checkouts sobre SQLite."""
+
+    def __init__(self, path=ADMISSION_DB_PATH, user_rate=ADMISSION_USER_RATE, user_burst=ADMISSION_USER_BURST,
+                 ip_rate=ADMISSION_IP_RATE, ip_burst=ADMISSION_IP_BURST, max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+                 slot_ttl=ADMISSION_SLOT_TTL):
+        self.path = path
+        # Tipo de clave -> (tokens por segundo, capacidad)
+        self.limits = {
+            'user': (user_rate, max(1.0, user_burst)),
+            'ip': (ip_rate, max(1.0, ip_burst)),
+        }
+        self.max_in_flight = max_in_flight
+        self.slot_ttl = slot_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._last_sweep = 0.0
+
+    def _connection(self):
+        # Una conexión por hilo y por proceso (las de antes de un fork no se reutilizan)
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def _count(self, outcome):
+        ADMISSION_DECISIONS.labels(outcome).inc()
+        with self._lock:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+
+    def admit(self, user_key=None, ip=None):
+        """Decide si un checkout entra. Si entra y hay cupo global, admission.slot debe liberarse con release()."""
+        keys = [
+            (kind, f"{kind}:{value}") for kind, value in (('user', user_key), ('ip', ip))
+            if value and self.limits[kind][0] > 0
+        ]
+        slot = uuid.uuid4().hex if self.max_in_flight > 0 else None
+        try:
+            outcome, retry_after = self._admit(keys, slot)
+        except sqlite3.Error as e:
+            print(f"Error en el control de admisión, se admite el checkout: {e}")
+            self._count('error')
+            return Admission(True)
+        self._count(outcome)
+        if outcome == 'admitted':
+            return Admission(True, slot=slot)
+        return Admission(False, reason='busy' if outcome == 'busy' else 'rate_limited', retry_after=retry_after)
+
+    def _admit(self, keys, slot):
+        now = time.time()
+        conn = self._connection()
+        # BEGIN IMMEDIATE serializa las decisiones entre procesos (un solo escritor)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if now - self._last_sweep > 60:
+                self._last_sweep = now
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - BUCKET_IDLE_SECONDS,))
+
+            refilled = []
+            for kind, key in keys:
+                rate, capacity = self.limits[kind]
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                if tokens < 1:
+                    conn.execute("COMMIT")
+                    return f"rate_limited_{kind}", math.ceil((1 - tokens) / rate)
+                refilled.append((key, tokens))
+
+            if slot is not None:
+                conn.execute("DELETE FROM slots WHERE expires < ?", (now,))
+                in_flight = conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+                if in_flight >= self.max_in_flight:
+                    in_flight -= self._purge_dead_slots(conn)
+                if in_flight >= self.max_in_flight:
+                    conn.execute("COMMIT")
+                    return 'busy', ADMISSION_BUSY_RETRY_AFTER
+                conn.execute(
+                    "INSERT INTO slots (id, pid, expires) VALUES (?, ?, ?)",
+                    (slot, os.getpid(), now + self.slot_ttl)
+                )
+
+            # Solo se cobra el token si el checkout entra por todos los límites
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens - 1, now) for key, tokens in refilled]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return 'admitted', None
+
+    def _purge_dead_slots(self, conn):
+        """Borra los cupos de workers que ya no existen (muertos sin liberar). Retorna cuántos."""
+        dead = [pid for (pid,) in conn.execute("SELECT DISTINCT pid FROM slots") if not _process_alive(pid)]
+        purged = 0
+        for pid in dead:
+            purged += conn.execute("DELETE FROM slots WHERE pid = ?", (pid,)).rowcount
+        return purged
+
+    def release(self, slot):
+        """Libera el cupo global de un checkout admitido."""
+        if slot is None:
+            return
+        try:
+            self._connection().execute("DELETE FROM slots WHERE id = ?", (slot,))
+        except sqlite3.Error as e:
+            # El cupo vence solo tras slot_ttl
+            print(f"Error liberando cupo de checkout {slot}: {e}")
+
+    def in_flight(self):
+        try:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM slots WHERE expires >= ?", (time.time(),)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "userRate": self.limits['user'][0],
+            "ipRate": self.limits['ip'][0],
+            "maxInFlight": self.max_in_flight,
+            "inFlight": self.in_flight() if self.max_in_flight > 0 else None,
+            "decisions": counts
+        }
+
+
+_controller = AdmissionController() if ADMISSION_ENABLED else None
+
+
+def admit_checkout(data, headers, remote_addr):
+    """Control de admisión de un checkout ya validado (clave de usuario: su email normalizado)."""
+    if _controller is None:
+        return Admission(True)
+    return _controller.admit(user_key(data['user'].get('email')), client_ip(headers, remote_addr))
+
+
+def release_checkout(slot):
+    if _controller is not None:
+        _controller.release(slot)
+
+
+def get_admission_stats():
+    return _controller.stats() if _controller is not None else None
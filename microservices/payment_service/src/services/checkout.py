@@ -0,0 +1,107 @@
+# Lógica de checkout que no depende del framework ni del transporte.
+# La usan las rutas HTTP (routes.checkout_common la re-exporta) y PaymentService,
+# que procesa los payment.request de RabbitMQ con las mismas reglas.
+
+# Estados que indican una transacción exitosa o en proceso
+SUCCESS_STATUS = ["APPROVED", "PENDING"]
+
+# Marca de submit_transaction en un error que no respondió PayU (circuito abierto,
+# sin cupo de concurrencia, fallo de red o respuesta ilegible): se puede reintentar
+GATEWAY_UNAVAILABLE = "gatewayUnavailable"
+
+
+class InvalidPaymentRequest(ValueError):
+    """La solicitud de pago no es válida: ningún reintento la arregla."""
+
+
+class PaymentGatewayUnavailable(Exception):
+    """PayU no se pudo consultar; la solicitud puede reintentarse más tarde."""
+
+
+def validate_checkout(data):
+    """Valida la solicitud de checkout. Retorna (body, status) si es inválida o None."""
+    method = data.get('paymentMethod')
+    if method not in ["CC", "PSE"]:
+        return {"error": "paymentMethod debe ser 'CC' o 'PSE'"}, 400
+    if not all(k in data.get('order', {}) for k in ('orderId', 'amount')):
+        return {"error": "Faltan datos de orden (orderId o amount)"}, 400
+    if not data.get('user'):
+        return {"error": "Faltan datos de usuario"}, 400
+    if method == "CC" and not data.get('card'):
+        return {"error": "Faltan datos de tarjeta para el método CC"}, 400
+    if method == "PSE" and (not data.get('pse') or not data['order'].get('responseUrl')):
+        return {"error": "Faltan datos PSE (bankCode, userType) o responseUrl"}, 400
+    return None
+
+
+def client_session_data(data, headers, remote_addr):
+    """Datos de la sesión del cliente que PayU exige en la transacción."""
+    return {
+        "ipAddress": remote_addr,
+        "userAgent": headers.get('User-Agent'),
+        "deviceSessionId": data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
+        "cookie": data.get('cookie', 'SIMULATED_COOKIE')
+    }
+
+
+def reference_code(data):
+    return f"ORDER-{data['paymentMethod']}-{data['order']['orderId']}"
+
+
+def payment_record(data):
+    """Campos del registro de pago que reserva la clave de idempotencia."""
+    return {
+        'order_id': data['order']['orderId'],
+        'user_id': data['user'].get('email'),
+        'amount': data['order']['amount'],
+        'payment_method': data['paymentMethod'],
+        'reference_code': reference_code(data)
+    }
+
+
+def build_checkout_response(method, payu_response):
+    """Traduce la respuesta de PayU a (body, status) para el cliente."""
+    transaction_response = payu_response.get('transactionResponse', {})
+    transaction_status = transaction_response.get('state')
+
+    # Extracción de campos detallados
+    detailed_response = {
+        "transactionId": transaction_response.get('transactionId'),
+        "orderId": transaction_response.get('orderId'),
+        "state": transaction_status,
+        "responseCode": transaction_response.get('responseCode'),
+        "paymentNetworkResponseCode": transaction_response.get('paymentNetworkResponseCode'),
+        "trazabilityCode": transaction_response.get('trazabilityCode'),
+        "authorizationCode": transaction_response.get('authorizationCode'),
+        "responseMessage": transaction_response.get('responseMessage'),
+        "operationDate": transaction_response.get('operationDate')
+    }
+
+    if payu_response.get('code') == "SUCCESS" and transaction_status in SUCCESS_STATUS:
+
+        if method == "PSE":
+            # PSE: Retorna la URL de redirección
+            redirection_url = transaction_response.get('extraParameters', {}).get('BANK_URL')
+            return {
+                "message": "Redirección a PSE pendiente",
+                "status": transaction_status,
+                "redirectionUrl": redirection_url,
+                "details": detailed_response
+            }, 200
+        else:
+            # CC: Retorna el estado final
+            return {
+                "message": "Transacción procesada correctamente",
+                "status": transaction_status,
+                "details": detailed_response
+            }, 200
+    else:
+        # Transacción RECHAZADA o ERROR de API
+        error_message = payu_response.get('error') or transaction_response.get('responseMessage', 'Transacción rechazada o fallida')
+
+        return {
+            "error": "Fallo en el pago",
+            "details": error_message,
+            "status": transaction_status or 'ERROR',
+            "payuResponseDetails": detailed_response
+        }, 400
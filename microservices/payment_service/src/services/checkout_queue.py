@@ -0,0 +1,229 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Cola acotada para el modo de checkout asíncrono.
+# La ruta valida la solicitud, encola la transacción y responde 202 de inmediato;
+# el resultado final se consulta por el identificador del checkout.
+# El trabajo corre en el proceso que lo aceptó, pero con un job_store
+# (repository.checkout_jobs) su estado y su resultado se guardan también en Mongo:
+# cualquier worker de gunicorn o réplica responde el endpoint de estado. Sin él
+# los resultados viven solo en memoria del proceso.
+
+CHECKOUT_WORKERS = int(os.getenv("CHECKOUT_WORKERS", 8))
+CHECKOUT_QUEUE_SIZE = int(os.getenv("CHECKOUT_QUEUE_SIZE", 100))
+CHECKOUT_RESULT_TTL = int(os.getenv("CHECKOUT_RESULT_TTL", 900))
+
+PROCESSING = "PROCESSING"
+DONE = "DONE"
+
+
+class CheckoutQueue:
+    """Pool de workers acotado con almacenamiento de resultados por handle."""
+
+    def __init__(self, max_workers=CHECKOUT_WORKERS, max_pending=CHECKOUT_QUEUE_SIZE,
+                 result_ttl=CHECKOUT_RESULT_TTL, job_store=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.job_store = job_store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="checkout")
+        # Cupos = trabajos en ejecución + trabajos en espera
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._rejected = 0
+
+    def submit(self, fn, *args):
+        """Encola fn(*args). Retorna el handle o None si la cola está llena.
+
+        fn debe retornar la tupla (body, http_status) de la respuesta final.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            return None
+
+        checkout_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_expired()
+            self._jobs[checkout_id] = {
+                "status": PROCESSING,
+                "createdAt": time.time(),
+                "finishedAt": None,
+                "result": None
+            }
+        # Registrado antes del 202: el primer sondeo puede llegar a otro worker
+        self._share_created(checkout_id)
+        try:
+            self._executor.submit(self._run, checkout_id, fn, args)
+        except RuntimeError:
+            # El executor fue cerrado
+            self._slots.release()
+            with self._lock:
+                self._jobs.pop(checkout_id, None)
+            return None
+        return checkout_id
+
+    def get(self, checkout_id):
+        """Retorna una copia del estado del trabajo o None si no existe.
+
+        Los trabajos de otros procesos se buscan en el job_store.
+        """
+        with self._lock:
+            job = self._jobs.get(checkout_id)
+            if job:
+                return dict(job)
+        return self._shared_job(checkout_id)
+
+    def stats(self):
+        with self._lock:
+            processing = sum(1 for job in self._jobs.values() if job["status"] == PROCESSING)
+            return {
+                "workers": self.max_workers,
+                "maxPending": self.max_pending,
+                "processing": processing,
+                "storedResults": len(self._jobs) - processing,
+                "rejected": self._rejected
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, checkout_id, fn, args):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            print(f"Error inesperado en checkout asíncrono {checkout_id}: {e}")
+            result = ({"error": "Error interno del servidor", "status": "INTERNAL_ERROR"}, 500)
+        finally:
+            self._slots.release()
+        self._finish(checkout_id, result)
+        self._share_finished(checkout_id, result)
+
+    def _finish(self, checkout_id, result):
+        with self._lock:
+            job = self._jobs.get(checkout_id)
+            if job is not None:
+                job["status"] = DONE
+                job["finishedAt"] = time.time()
+                job["result"] = result
+
+    # Si Mongo falla el trabajo sigue: su estado queda al menos en este proceso
+    def _share_created(self, checkout_id):
+        if self.job_store is None:
+            return
+        try:
+            self.job_store.create(checkout_id, self.result_ttl)
+        except Exception as e:
+            print(f"No se pudo registrar el checkout asíncrono {checkout_id}: {e}")
+
+    def _share_finished(self, checkout_id, result):
+        if self.job_store is None:
+            return
+        try:
+            self.job_store.finish(checkout_id, DONE, result, self.result_ttl)
+        except Exception as e:
+            print(f"No se pudo guardar el resultado del checkout asíncrono {checkout_id}: {e}")
+
+    def _shared_job(self, checkout_id):
+        if self.job_store is None:
+            return None
+        try:
+            return self.job_store.get(checkout_id)
+        except Exception as e:
+            print(f"No se pudo consultar el checkout asíncrono {checkout_id}: {e}")
+            return None
+
+    def _purge_expired(self):
+        # Se llama con self._lock tomado
+        limit = time.time() - self.result_ttl
+        expired = [key for key, job in self._jobs.items()
+                   if job["status"] == DONE and job["finishedAt"] < limit]
+        for key in expired:
+            del self._jobs[key]
+
+
+class AsyncCheckoutQueue(CheckoutQueue):
+    """CheckoutQueue para el modo asyncio: cada trabajo es una tarea del event loop.
+
+    max_workers limita las corrutinas en ejecución (el resto espera su turno hasta
+    max_pending); mismos handles, estados y estadísticas que CheckoutQueue.
+    submit y get son corrutinas: el job_store (pymongo) se consulta en un hilo.
+    """
+
+    def __init__(self, max_workers=CHECKOUT_WORKERS, max_pending=CHECKOUT_QUEUE_SIZE,
+                 result_ttl=CHECKOUT_RESULT_TTL, job_store=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.job_store = job_store
+        self._running = None
+        self._admitted = 0
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._tasks = set()
+        self._rejected = 0
+
+    async def submit(self, fn, *args):
+        """Agenda await fn(*args) en el loop actual. Retorna el handle o None si está lleno."""
+        if self._admitted >= self.max_workers + self.max_pending:
+            self._rejected += 1
+            return None
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.max_workers)
+        self._admitted += 1
+
+        checkout_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_expired()
+            self._jobs[checkout_id] = {
+                "status": PROCESSING,
+                "createdAt": time.time(),
+                "finishedAt": None,
+                "result": None
+            }
+        if self.job_store is not None:
+            try:
+                await asyncio.to_thread(self._share_created, checkout_id)
+            except BaseException:
+                # Solicitud cancelada mientras se registraba: el trabajo no corre
+                self._admitted -= 1
+                with self._lock:
+                    self._jobs.pop(checkout_id, None)
+                raise
+        task = asyncio.ensure_future(self._run_async(checkout_id, fn, args))
+        # El loop solo guarda referencias débiles a las tareas
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return checkout_id
+
+    async def get(self, checkout_id):
+        """Retorna una copia del estado del trabajo o None si no existe."""
+        with self._lock:
+            job = self._jobs.get(checkout_id)
+            if job:
+                return dict(job)
+        if self.job_store is None:
+            return None
+        return await asyncio.to_thread(self._shared_job, checkout_id)
+
+    def shutdown(self, wait=True):
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _run_async(self, checkout_id, fn, args):
+        try:
+            async with self._running:
+                result = await fn(*args)
+        except Exception as e:
+            print(f"Error inesperado en checkout asíncrono {checkout_id}: {e}")
+            result = ({"error": "Error interno del servidor", "status": "INTERNAL_ERROR"}, 500)
+        finally:
+            self._admitted -= 1
+        self._finish(checkout_id, result)
+        if self.job_store is not None:
+            await asyncio.to_thread(self._share_finished, checkout_id, result)
@@ -0,0 +1,73 @@
+import hmac
+import os
+import threading
+from services.payment_service import PAYU_MERCHANT_ID, PAYU_MD5_KEY
+from repository.confirmations import ConfirmationQueue, build_confirmation
+from config.config import Config
+from utils.metrics import CONFIRMATIONS_RECEIVED
+from utils.payu_utils import generate_confirmation_signature
+
+# Recepción de las confirmaciones de PayU (página de confirmación / notifyUrl).
+# La ruta solo verifica la firma y guarda la notificación en la cola durable
+# payment_confirmations; workers/confirmations.py la aplica a los pagos por lotes.
+# Las escrituras de solicitudes concurrentes se agrupan en un solo insert_many.
+
+REQUIRED_FIELDS = ('merchant_id', 'reference_sale', 'value', 'currency', 'state_pol', 'sign', 'transaction_id')
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+def get_confirmation_queue():
+    """Cola de confirmaciones del proceso actual (se recrea tras un fork de gunicorn)."""
+    global _queue, _queue_pid
+    pid = os.getpid()
+    if _queue is None or _queue_pid != pid:
+        with _queue_lock:
+            if _queue is None or _queue_pid != pid:
+                _queue = ConfirmationQueue()
+                _queue_pid = pid
+    return _queue
+
+def verify_confirmation(form):
+    """Retorna None si la notificación es auténtica o el motivo del rechazo."""
+    missing = [field for field in REQUIRED_FIELDS if not form.get(field)]
+    if missing:
+        return f"Faltan campos: {', '.join(missing)}"
+    if str(form['merchant_id']) != str(PAYU_MERCHANT_ID):
+        return "merchant_id desconocido"
+    try:
+        expected = generate_confirmation_signature(
+            form['merchant_id'], form['reference_sale'], form['value'], form['currency'],
+            form['state_pol'], PAYU_MD5_KEY
+        )
+    except ValueError:
+        return "value inválido"
+    if not hmac.compare_digest(expected, str(form['sign']).lower()):
+        return "Firma inválida"
+    return None
+
+def receive_confirmation(form):
+    """Verifica y encola una confirmación de PayU. Retorna (body, status)."""
+    error = verify_confirmation(form)
+    if error:
+        CONFIRMATIONS_RECEIVED.labels('invalid').inc()
+        print(f"Confirmación de PayU rechazada ({form.get('reference_sale')}): {error}")
+        return {"error": error}, 400
+
+    try:
+        stored = get_confirmation_queue().append(
+            build_confirmation(form), timeout=Config.PAYMENT_CONFIRMATION_WRITE_TIMEOUT
+        )
+    except Exception as e:
+        # Sin 200 PayU reintenta la notificación más tarde
+        CONFIRMATIONS_RECEIVED.labels('error').inc()
+        print(f"Error guardando confirmación de PayU {form.get('transaction_id')}: {e}")
+        return {"error": "No se pudo registrar la confirmación"}, 503
+
+    CONFIRMATIONS_RECEIVED.labels('accepted' if stored else 'duplicate').inc()
+    return {"status": "RECEIVED" if stored else "DUPLICATE"}, 200
+
+def get_confirmation_stats():
+    # Solo si este proceso ya recibió confirmaciones
+    return _queue.stats() if _queue is not None and _queue_pid == os.getpid() else None
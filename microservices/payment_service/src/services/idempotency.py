@@ -0,0 +1,351 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from pymongo.errors import ConnectionFailure
+
+# Supresión de envíos duplicados a PayU en /checkout.
+# Cada clave de idempotencia (cabecera Idempotency-Key o el referenceCode de la
+# orden) se ejecuta una sola vez dentro de la ventana configurada:
+# - Camino rápido en memoria: duplicados concurrentes en el mismo proceso
+#   esperan el resultado en curso y las repeticiones se sirven desde cache.
+# - Entre workers/réplicas la reserva se hace en la colección payments de Mongo.
+# Solo se guardan respuestas exitosas (HTTP 200); un rechazo o error libera la
+# clave para que el cliente pueda reintentar. Una respuesta guardada en Mongo se
+# reutiliza aunque haya pasado la ventana: la clave es el referenceCode del pago
+# y volver a reservarla enviaría la orden otra vez a PayU.
+
+IDEMPOTENCY_WINDOW = int(os.getenv("IDEMPOTENCY_WINDOW", 600))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 40))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 90))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_RETRY_BACKEND_AFTER = 30
+
+IN_PROGRESS_RESPONSE = (
+    {"error": "Ya existe un checkout en proceso para esta solicitud", "status": "PROCESSING"},
+    409
+)
+
+
+class _Entry:
+    __slots__ = ("event", "result", "expires_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.expires_at = None
+
+
+class IdempotencyStore:
+    """Ejecuta cada checkout una vez por clave y reutiliza su respuesta."""
+
+    def __init__(self, repository_factory=None, window=IDEMPOTENCY_WINDOW,
+                 wait_timeout=IDEMPOTENCY_WAIT_TIMEOUT, lock_timeout=IDEMPOTENCY_LOCK_TIMEOUT,
+                 max_entries=IDEMPOTENCY_CACHE_SIZE):
+        self.repository_factory = repository_factory
+        self.window = window
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = lock_timeout
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._repository = None
+        self._repository_failed_at = None
+
+        self._executed = 0
+        self._replayed = 0
+        self._waited = 0
+        self._conflicts = 0
+
+    def execute(self, key, fn, record=None):
+        """Ejecuta fn() una sola vez por clave.
+
+        fn debe retornar (body, http_status). Retorna (body, http_status, replayed).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.result is not None and entry.expires_at < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            return self._wait_local(entry)
+
+        try:
+            body, status, replayed = self._execute_as_leader(key, fn, record)
+        except Exception:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry.event.set()
+            raise
+
+        with self._lock:
+            # Los duplicados que ya esperan reciben la misma respuesta
+            entry.result = (body, status)
+            if status == 200:
+                entry.expires_at = time.monotonic() + self.window
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                # No se cachea: un nuevo intento volverá a consultar PayU
+                self._entries.pop(key, None)
+        entry.event.set()
+        return body, status, replayed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self._executed,
+                "replayed": self._replayed,
+                "waitedForInFlight": self._waited,
+                "conflicts": self._conflicts,
+                "localEntries": len(self._entries),
+                "backendAvailable": self._repository is not None and self._repository_failed_at is None
+            }
+
+    # --- Internos ---
+
+    def _wait_local(self, entry):
+        with self._lock:
+            self._waited += 1
+        if not entry.event.wait(self.wait_timeout):
+            with self._lock:
+                self._conflicts += 1
+            body, status = IN_PROGRESS_RESPONSE
+            return body, status, False
+        if entry.result is None:
+            # El intento original terminó con una excepción
+            return {"error": "Error interno del servidor", "status": "INTERNAL_ERROR"}, 500, False
+        with self._lock:
+            self._replayed += 1
+        body, status = entry.result
+        return body, status, True
+
+    def _execute_as_leader(self, key, fn, record):
+        repository = self._get_repository()
+        if repository is None:
+            return self._run(fn) + (False,)
+
+        try:
+            outcome, doc = repository.reserve_idempotency_key(
+                key, self.window, self.lock_timeout, record
+            )
+        except Exception as e:
+            print(f"Error reservando clave de idempotencia {key}: {e}")
+            self._backend_error(e)
+            return self._run(fn) + (False,)
+
+        if outcome == 'completed':
+            with self._lock:
+                self._replayed += 1
+            return doc['checkout_response'], doc['checkout_http_status'], True
+        if outcome == 'in_progress':
+            return self._wait_backend(repository, key)
+
+        body, status = self._run(fn)
+        try:
+            if status == 200:
+                repository.complete_idempotency_key(
+                    key, body.get('status'), body, status, self.window
+                )
+            else:
+                repository.release_idempotency_key(key, body.get('status') or 'ERROR')
+        except Exception as e:
+            print(f"Error guardando resultado de idempotencia {key}: {e}")
+            self._backend_error(e)
+        return body, status, False
+
+    def _wait_backend(self, repository, key):
+        """Espera a que otro worker termine el checkout con la misma clave."""
+        with self._lock:
+            self._waited += 1
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.1
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            doc = repository.get_payment_by_id(
+                key, projection=('status', 'checkout_response', 'checkout_http_status')
+            )
+            if doc and 'checkout_response' in doc:
+                with self._lock:
+                    self._replayed += 1
+                return doc['checkout_response'], doc['checkout_http_status'], True
+            if doc and doc.get('status') != 'PROCESSING':
+                # El otro intento terminó sin respuesta reutilizable
+                break
+        with self._lock:
+            self._conflicts += 1
+        body, status = IN_PROGRESS_RESPONSE
+        return body, status, False
+
+    def _run(self, fn):
+        with self._lock:
+            self._executed += 1
+        return fn()
+
+    def _backend_error(self, error):
+        # Sin conexión a Mongo cada operación esperaría el timeout de selección de
+        # servidor: se usa solo la memoria del proceso hasta el próximo reintento
+        if isinstance(error, ConnectionFailure):
+            with self._lock:
+                self._repository_failed_at = time.monotonic()
+
+    def _get_repository(self):
+        if self.repository_factory is None:
+            return None
+        with self._lock:
+            failed_at = self._repository_failed_at
+            if failed_at is not None:
+                if time.monotonic() - failed_at < IDEMPOTENCY_RETRY_BACKEND_AFTER:
+                    return None
+                self._repository_failed_at = None
+            if self._repository is not None:
+                return self._repository
+        try:
+            repository = self.repository_factory()
+        except Exception as e:
+            print(f"Idempotencia sin MongoDB, usando solo memoria del proceso: {e}")
+            with self._lock:
+                self._repository_failed_at = time.monotonic()
+            return None
+        with self._lock:
+            if self._repository is None:
+                self._repository = repository
+            return self._repository
+
+
+class _AsyncEntry(_Entry):
+    __slots__ = ()
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.result = None
+        self.expires_at = None
+
+
+class AsyncIdempotencyStore(IdempotencyStore):
+    """IdempotencyStore para el modo asyncio: fn es una corrutina y el repositorio
+    es AsyncPaymentRepository. Las esperas no bloquean el event loop."""
+
+    async def execute(self, key, fn, record=None):
+        """await fn() una sola vez por clave. Retorna (body, http_status, replayed)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.result is not None and entry.expires_at < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                entry = self._entries[key] = _AsyncEntry()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            return await self._wait_local(entry)
+
+        try:
+            body, status, replayed = await self._execute_as_leader(key, fn, record)
+        except BaseException:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry.event.set()
+            raise
+
+        with self._lock:
+            entry.result = (body, status)
+            if status == 200:
+                entry.expires_at = time.monotonic() + self.window
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.pop(key, None)
+        entry.event.set()
+        return body, status, replayed
+
+    async def _wait_local(self, entry):
+        with self._lock:
+            self._waited += 1
+        try:
+            await asyncio.wait_for(entry.event.wait(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._conflicts += 1
+            body, status = IN_PROGRESS_RESPONSE
+            return body, status, False
+        if entry.result is None:
+            return {"error": "Error interno del servidor", "status": "INTERNAL_ERROR"}, 500, False
+        with self._lock:
+            self._replayed += 1
+        body, status = entry.result
+        return body, status, True
+
+    async def _execute_as_leader(self, key, fn, record):
+        repository = self._get_repository()
+        if repository is None:
+            return await self._run(fn) + (False,)
+
+        try:
+            outcome, doc = await repository.reserve_idempotency_key(
+                key, self.window, self.lock_timeout, record
+            )
+        except Exception as e:
+            print(f"Error reservando clave de idempotencia {key}: {e}")
+            self._backend_error(e)
+            return await self._run(fn) + (False,)
+
+        if outcome == 'completed':
+            with self._lock:
+                self._replayed += 1
+            return doc['checkout_response'], doc['checkout_http_status'], True
+        if outcome == 'in_progress':
+            return await self._wait_backend(repository, key)
+
+        body, status = await self._run(fn)
+        try:
+            if status == 200:
+                await repository.complete_idempotency_key(
+                    key, body.get('status'), body, status, self.window
+                )
+            else:
+                await repository.release_idempotency_key(key, body.get('status') or 'ERROR')
+        except Exception as e:
+            print(f"Error guardando resultado de idempotencia {key}: {e}")
+            self._backend_error(e)
+        return body, status, False
+
+    async def _wait_backend(self, repository, key):
+        with self._lock:
+            self._waited += 1
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.1
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+            doc = await repository.get_payment_by_id(
+                key, projection=('status', 'checkout_response', 'checkout_http_status')
+            )
+            if doc and 'checkout_response' in doc:
+                with self._lock:
+                    self._replayed += 1
+                return doc['checkout_response'], doc['checkout_http_status'], True
+            if doc and doc.get('status') != 'PROCESSING':
+                break
+        with self._lock:
+            self._conflicts += 1
+        body, status = IN_PROGRESS_RESPONSE
+        return body, status, False
+
+    async def _run(self, fn):
+        with self._lock:
+            self._executed += 1
+        return await fn()
@@ -1,7 +1,19 @@
 import requests
 import os
-import json
-from src.utils.payu_utils import generate_payu_signature, calculate_tax_values
+import threading
+from datetime import datetime
+from utils.payu_client import PayUClient
+from utils.payu_payloads import PayUPayloadBuilder, dumps
+from utils.swr_cache import StaleWhileRevalidateCache
+from utils.resilience_decorators import (
+    Bulkhead, BulkheadFullError, CircuitBreakerOpenError, deadline, get_circuit_breaker, hedged_call
+)
+from repository.payment_repository import PaymentRepository
+from services.checkout import (
+    GATEWAY_UNAVAILABLE, InvalidPaymentRequest, PaymentGatewayUnavailable, build_checkout_response,
+    client_session_data, payment_record, reference_code, validate_checkout
+)
+from services.idempotency import IdempotencyStore
 
 # Cargar configuración desde environment
 PAYU_API_KEY = os.getenv("PAYU_API_KEY", "4Vj8eK4rloUO70w0KzSXXXX")     
@@ -9,192 +21,255 @@ PAYU_MERCHANT_ID = os.getenv("PAYU_MERCHANT_ID", "508029")
 PAYU_ACCOUNT_ID = os.getenv("PAYU_ACCOUNT_ID", "512321")              
 PAYU_MD5_KEY = os.getenv("PAYU_MD5_KEY", "4Vj8eK4rloUO70w0KzSXXXX")    
 PAYU_API_URL = os.getenv("PAYU_API_URL", "https://sandbox.api.payulatam.com/payments-api/4.0/service.cgi")
+# Consultas de órdenes y transacciones (API de reportes)
+PAYU_REPORTS_API_URL = os.getenv("PAYU_REPORTS_API_URL", "https://sandbox.api.payulatam.com/reports-api/4.0/service.cgi")
+# Página de confirmación (POST /api/v1/payment/confirmation) a la que PayU notifica los pagos PSE
+PAYU_NOTIFY_URL = os.getenv("PAYU_NOTIFY_URL", "http://yourdomain.com/api/v1/payment/confirmation")
 CURRENCY = "COP" # Asumimos COP para Colombia
 
-def submit_transaction(payload):
-    """Envía la solicitud de pago o consulta a la API de PayU."""
-    headers = {'Content-Type': 'application/json; charset=utf-8'}
-    
+# Configuración del cliente HTTP (timeouts en segundos, pool por worker de gunicorn)
+PAYU_CONNECT_TIMEOUT = float(os.getenv("PAYU_CONNECT_TIMEOUT", 3.05))
+PAYU_READ_TIMEOUT = float(os.getenv("PAYU_READ_TIMEOUT", 30))
+PAYU_POOL_MAXSIZE = int(os.getenv("PAYU_POOL_MAXSIZE", 10))
+
+# Resiliencia frente a PayU (por worker): circuito, límite de concurrencia y plazo total
+PAYU_BREAKER_FAILURE_THRESHOLD = int(os.getenv("PAYU_BREAKER_FAILURE_THRESHOLD", 5))
+PAYU_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("PAYU_BREAKER_RECOVERY_TIMEOUT", 30))
+PAYU_BREAKER_HALF_OPEN_CALLS = int(os.getenv("PAYU_BREAKER_HALF_OPEN_CALLS", 1))
+PAYU_BULKHEAD_MAX_CONCURRENT = int(os.getenv("PAYU_BULKHEAD_MAX_CONCURRENT", PAYU_POOL_MAXSIZE))
+PAYU_BULKHEAD_MAX_WAIT = float(os.getenv("PAYU_BULKHEAD_MAX_WAIT", 0.5))
+PAYU_CALL_DEADLINE = float(os.getenv("PAYU_CALL_DEADLINE", 35))
+# Consultas idempotentes: segundo intento si el primero tarda más de esto (segundos)
+PAYU_HEDGE_DELAY = float(os.getenv("PAYU_HEDGE_DELAY", 2))
+PAYU_HEDGE_MAX_ATTEMPTS = int(os.getenv("PAYU_HEDGE_MAX_ATTEMPTS", 2))
+
+# Cache de la lista de bancos PSE (segundos)
+PSE_BANKS_CACHE_TTL = int(os.getenv("PSE_BANKS_CACHE_TTL", 3600))
+PSE_BANKS_CACHE_MAX_STALE = int(os.getenv("PSE_BANKS_CACHE_MAX_STALE", 86400))
+
+_payu_clients = {}
+_payu_client_pid = None
+_payu_client_lock = threading.Lock()
+
+def get_payu_client(api_url=PAYU_API_URL):
+    """Retorna el cliente PayU del proceso actual para api_url.
+
+    Se crea de forma perezosa y se recrea tras un fork, para que cada worker
+    de gunicorn tenga su propio pool de conexiones.
+    """
+    global _payu_client_pid
+    pid = os.getpid()
+    client = _payu_clients.get(api_url)
+    if client is None or _payu_client_pid != pid:
+        with _payu_client_lock:
+            if _payu_client_pid != pid:
+                _payu_clients.clear()
+                _payu_client_pid = pid
+            client = _payu_clients.get(api_url)
+            if client is None:
+                client = _payu_clients[api_url] = PayUClient(
+                    api_url,
+                    connect_timeout=PAYU_CONNECT_TIMEOUT,
+                    read_timeout=PAYU_READ_TIMEOUT,
+                    pool_maxsize=PAYU_POOL_MAXSIZE
+                )
+    return client
+
+# Fallos de transporte o respuestas ilegibles cuentan para el circuito; un rechazo
+# de PayU (code != SUCCESS) es una respuesta válida y no lo abre
+_payu_breaker = get_circuit_breaker(
+    "payu",
+    failure_threshold=PAYU_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=PAYU_BREAKER_RECOVERY_TIMEOUT,
+    half_open_max_calls=PAYU_BREAKER_HALF_OPEN_CALLS,
+    failure_exceptions=(requests.exceptions.RequestException, ValueError)
+)
+_payu_bulkhead = Bulkhead("payu", PAYU_BULKHEAD_MAX_CONCURRENT, max_wait=PAYU_BULKHEAD_MAX_WAIT)
+
+def _post(payload, command, api_url=PAYU_API_URL):
+    # Bulkhead antes que el circuito: una llamada rechazada por cupo no consume
+    # la prueba half-open
+    with _payu_bulkhead:
+        return _payu_breaker.call(get_payu_client(api_url).post, payload, command=command)
+
+def submit_transaction(payload, command=None, idempotent=False, api_url=PAYU_API_URL):
+    """Envía la solicitud de pago o consulta a la API de PayU.
+
+    Falla rápido si el circuito de PayU está abierto o no hay cupo de concurrencia.
+    SUBMIT_TRANSACTION nunca se reintenta (podría cobrar dos veces); las consultas
+    idempotentes usan intentos de respaldo (hedged).
+    """
     try:
-        response = requests.post(PAYU_API_URL, headers=headers, json=payload)
-        response.raise_for_status() 
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        with deadline(PAYU_CALL_DEADLINE):
+            if idempotent:
+                return hedged_call(
+                    _post, payload, command, api_url,
+                    hedge_delay=PAYU_HEDGE_DELAY,
+                    max_attempts=PAYU_HEDGE_MAX_ATTEMPTS,
+                    retry_on=(requests.exceptions.RequestException, ValueError, BulkheadFullError)
+                )
+            return _post(payload, command, api_url)
+    except CircuitBreakerOpenError as e:
+        print(f"PayU no disponible, llamada rechazada: {e}")
+        return {"code": "ERROR", "error": "PayU no disponible temporalmente, reintente más tarde",
+                GATEWAY_UNAVAILABLE: True}
+    except BulkheadFullError as e:
+        print(f"Llamada a PayU rechazada por concurrencia: {e}")
+        return {"code": "ERROR", "error": "Demasiadas solicitudes a PayU en curso, reintente más tarde",
+                GATEWAY_UNAVAILABLE: True}
+    except (requests.exceptions.RequestException, ValueError, TimeoutError) as e:
         print(f"Error comunicándose con la API de PayU: {e}")
         # Retorna una estructura de error consistente para ser manejada por la ruta
-        return {"code": "ERROR", "error": f"API Request Failed: {e}"}
+        return {"code": "ERROR", "error": f"API Request Failed: {e}", GATEWAY_UNAVAILABLE: True}
 
 # --- Funciones de Utilidad ---
 
+# El cuerpo de GET_BANKS_LIST no cambia: se serializa una sola vez
+_PSE_BANKS_REQUEST = dumps({
+    "language": "es",
+    "command": "GET_BANKS_LIST",
+    "merchant": {
+        "apiLogin": PAYU_API_KEY,
+        "apiKey": PAYU_API_KEY # PayU usa API Key para apiLogin en Sandbox/pruebas
+    },
+    "test": True,
+    "bankListInformation": {
+        "paymentMethod": "PSE",
+        "paymentCountry": "CO"
+    }
+})
+
+def _fetch_pse_banks():
+    """Consulta GET_BANKS_LIST en PayU. Lanza excepción si PayU no responde SUCCESS."""
+    response = submit_transaction(_PSE_BANKS_REQUEST, command="GET_BANKS_LIST", idempotent=True)
+    if response.get('code') != "SUCCESS":
+        # Una respuesta de error no debe quedar cacheada
+        raise RuntimeError(response.get('error') or "Respuesta inválida de PayU")
+    return response
+
+# La lista de bancos casi no cambia: se cachea por proceso y se refresca en segundo plano
+_pse_banks_cache = StaleWhileRevalidateCache(
+    _fetch_pse_banks,
+    ttl=PSE_BANKS_CACHE_TTL,
+    max_stale=PSE_BANKS_CACHE_MAX_STALE,
+    name="pse-banks"
+)
+
 def get_pse_banks():
+    try:
+        return _pse_banks_cache.get()
+    except Exception as e:
+        return {"code": "ERROR", "error": str(e)}
 
-    payload = {
-        "language": "es",
-        "command": "GET_BANKS_LIST",
-        "merchant": {
-            "apiLogin": PAYU_API_KEY,
-            "apiKey": PAYU_API_KEY # PayU usa API Key para apiLogin en Sandbox/pruebas
-        },
-        "test": True,
-        "bankListInformation": {
-            "paymentMethod": "PSE",
-            "paymentCountry": "CO"
-        }
+def get_pse_banks_cache_stats():
+    return _pse_banks_cache.stats()
+
+def get_payu_resilience_stats():
+    return {
+        "circuitBreaker": _payu_breaker.stats(),
+        "bulkhead": _payu_bulkhead.stats()
     }
-    return submit_transaction(payload)
 
 
-def build_pse_payload(order_data, user_data, pse_data, client_data):
+# Plantillas precompiladas de SUBMIT_TRANSACTION (una vez por proceso)
+_payload_builder = PayUPayloadBuilder(
+    PAYU_API_KEY, PAYU_MERCHANT_ID, PAYU_ACCOUNT_ID, PAYU_MD5_KEY, CURRENCY, notify_url=PAYU_NOTIFY_URL
+)
 
-    amount = order_data['amount']
-    reference_code = f"ORDER-PSE-{order_data['orderId']}"
-    
-    # 1. Calcular valores de impuestos
-    calculated_values = calculate_tax_values(amount)
-    
-    # 2. Generar firma
-    signature = generate_payu_signature(
-        PAYU_MERCHANT_ID, calculated_values['TX_VALUE'], CURRENCY, reference_code, PAYU_MD5_KEY
-    )
-
-    # 3. Construir el payload
-    payload = {
-        "test": True, 
-        "language": "es",
-        "command": "SUBMIT_TRANSACTION",
-        "merchant": {
-            "apiKey": PAYU_API_KEY,
-            "apiLogin": PAYU_API_KEY 
-        },
-        "transaction": {
-            "type": "AUTHORIZATION_AND_CAPTURE",
-            "paymentMethod": "PSE",
-            "paymentCountry": "CO",
-            "deviceSessionId": client_data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
-            "ipAddress": client_data.get('ipAddress', '127.0.0.1'),
-            "cookie": client_data.get('cookie', 'SIMULATED_COOKIE'),
-            "userAgent": client_data.get('userAgent', 'SIMULATED_USER_AGENT'),
-            "order": {
-                "accountId": PAYU_ACCOUNT_ID,
-                "referenceCode": reference_code,
-                "description": f"Bookstore purchase - PSE Order #{order_data['orderId']}",
-                "language": "es",
-                "signature": signature,
-                "notifyUrl": order_data.get('notifyUrl', 'http://yourdomain.com/payu/notify'),
-                "additionalValues": {
-                    "TX_VALUE": {
-                        "value": calculated_values['TX_VALUE'],
-                        "currency": CURRENCY
-                    },
-                    "TX_TAX": {
-                        "value": calculated_values['TX_TAX'],
-                        "currency": CURRENCY
-                    },
-                    "TX_TAX_RETURN_BASE": {
-                        "value": calculated_values['TX_TAX_RETURN_BASE'],
-                        "currency": CURRENCY
-                    }
-                },
-                "buyer": {
-                    "fullName": user_data['fullName'],
-                    "emailAddress": user_data['email'],
-                    "contactPhone": user_data['contactPhone'],
-                    "dniNumber": user_data['dniNumber'],
-                    "shippingAddress": user_data['shippingAddress'] # Asumimos que la estructura es completa
-                }
-            },
-            "payer": {
-                "fullName": user_data['fullName'],
-                "emailAddress": user_data['email'],
-                "contactPhone": user_data['contactPhone'],
-                "dniNumber": user_data['dniNumber'],
-                "dniType": user_data.get('dniType', 'CC'), 
-                "billingAddress": user_data['shippingAddress'] # Usamos la misma dirección para facturación PSE
-            },
-            "extraParameters": {
-                "RESPONSE_URL": order_data['responseUrl'], # Obligatorio para redirección PSE
-                "FINANCIAL_INSTITUTION_CODE": pse_data['bankCode'], # Código del banco
-                "USER_TYPE": pse_data['userType'] # N o J
-            }
-        }
-    }
-    return payload
+def build_pse_payload(order_data, user_data, pse_data, client_data):
+    """
+    Construye y envía el payload de PayU para PSE.
+    """
+    payload = _payload_builder.build_pse(order_data, user_data, pse_data, client_data)
+    return submit_transaction(payload, command="SUBMIT_TRANSACTION")
 
 # Función de Tarjeta de Crédito
 
 def build_cc_payload(order_data, user_data, card_data, client_data):
     """
-    Construye el payload completo de PayU para Tarjeta de Crédito/Débito.
+    Construye y envía el payload de PayU para Tarjeta de Crédito/Débito.
+    """
+    payload = _payload_builder.build_cc(order_data, user_data, card_data, client_data)
+    return submit_transaction(payload, command="SUBMIT_TRANSACTION")
+
+# --- Consultas (API de reportes) ---
+# Son de solo lectura: se envían como idempotentes (con intentos de respaldo)
+
+def query_transaction(transaction_id):
+    """Consulta TRANSACTION_RESPONSE_DETAIL de una transacción."""
+    payload = _payload_builder.build_query("TRANSACTION_RESPONSE_DETAIL", {"transactionId": transaction_id})
+    return submit_transaction(payload, command="TRANSACTION_RESPONSE_DETAIL", idempotent=True,
+                              api_url=PAYU_REPORTS_API_URL)
+
+def query_order(order_id):
+    """Consulta ORDER_DETAIL por el id de orden de PayU."""
+    payload = _payload_builder.build_query("ORDER_DETAIL", {"orderId": order_id})
+    return submit_transaction(payload, command="ORDER_DETAIL", idempotent=True, api_url=PAYU_REPORTS_API_URL)
+
+def query_order_by_reference(reference_code):
+    """Consulta ORDER_DETAIL_BY_REFERENCE_CODE por nuestro referenceCode."""
+    payload = _payload_builder.build_query("ORDER_DETAIL_BY_REFERENCE_CODE", {"referenceCode": reference_code})
+    return submit_transaction(payload, command="ORDER_DETAIL_BY_REFERENCE_CODE", idempotent=True,
+                              api_url=PAYU_REPORTS_API_URL)
+
+
+# --- Solicitudes de pago por RabbitMQ ---
+
+class PaymentService:
+    """
+    Procesa los payment.request que recibe events.payment_consumer.
+
+    El mensaje trae los mismos datos que el cuerpo de /checkout (directamente o
+    dentro de "data", como lo publica PaymentProducer) y se envía a PayU con el
+    mismo referenceCode y la misma clave de idempotencia, así que un reintento
+    del consumidor o un /checkout de la misma orden no cobran dos veces.
     """
-    amount = order_data['amount']
-    reference_code = f"ORDER-CC-{order_data['orderId']}"
-    
-    # 1. Calcular valores de impuestos
-    calculated_values = calculate_tax_values(amount)
-    
-    # 2. Generar firma
-    signature = generate_payu_signature(
-        PAYU_MERCHANT_ID, calculated_values['TX_VALUE'], CURRENCY, reference_code, PAYU_MD5_KEY
-    )
-
-    # 3. Construir el payload con campos OBLIGATORIOS (mínimos)
-    payload = {
-        "test": True, 
-        "language": "es",
-        "command": "SUBMIT_TRANSACTION",
-        "merchant": {
-            "apiKey": PAYU_API_KEY,
-            "apiLogin": PAYU_API_KEY 
-        },
-        "transaction": {
-            "type": "AUTHORIZATION_AND_CAPTURE",
-            "paymentMethod": card_data.get('paymentMethod', 'VISA'),
-            "paymentCountry": "CO",
-            "deviceSessionId": client_data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
-            "ipAddress": client_data.get('ipAddress', '127.0.0.1'),
-            "cookie": client_data.get('cookie', 'SIMULATED_COOKIE'),
-            "userAgent": client_data.get('userAgent', 'SIMULATED_USER_AGENT'),
-            "order": {
-                "accountId": PAYU_ACCOUNT_ID,
-                "referenceCode": reference_code,
-                "description": f"Bookstore purchase - CC Order #{order_data['orderId']}",
-                "language": "es",
-                "signature": signature,
-                "additionalValues": {
-                    "TX_VALUE": {
-                        "value": calculated_values['TX_VALUE'],
-                        "currency": CURRENCY
-                    },
-                    "TX_TAX": {
-                        "value": calculated_values['TX_TAX'],
-                        "currency": CURRENCY
-                    },
-                    "TX_TAX_RETURN_BASE": {
-                        "value": calculated_values['TX_TAX_RETURN_BASE'],
-                        "currency": CURRENCY
-                    }
-                },
-                "buyer": {
-                    "fullName": user_data['fullName'],
-                    "emailAddress": user_data['email'],
-                    "contactPhone": user_data['contactPhone'],
-                    "dniNumber": user_data['dniNumber'],
-                    "shippingAddress": user_data['shippingAddress']
-                }
-            },
-            "creditCard": {
-                "number": card_data['number'], 
-                "securityCode": card_data['securityCode'],
-                "expirationDate": card_data['expirationDate'], 
-                "name": card_data['cardHolderName']
-            },
-            "payer": {
-                "fullName": card_data['cardHolderName'],
-                "emailAddress": user_data['email'],
-                "contactPhone": user_data['contactPhone'],
-                "dniNumber": user_data['dniNumber'],
-                "billingAddress": user_data['shippingAddress'] # Usamos la misma dirección para facturación
-            }
+
+    def __init__(self, idempotency_store=None):
+        self.idempotency_store = idempotency_store or IdempotencyStore(repository_factory=PaymentRepository)
+
+    def process_payment(self, payment_data):
+        """
+        Retorna {'order_id', 'payment_id', 'status', 'message', 'timestamp'}; un
+        rechazo o error que respondió PayU se retorna con su estado.
+
+        Lanza InvalidPaymentRequest si la solicitud no es válida (va directo a la
+        cola de dead-letter) y PaymentGatewayUnavailable si PayU no se pudo
+        consultar (circuito abierto, sin cupo o fallo de red), para que el
+        consumidor reintente el mensaje.
+        """
+        data = payment_data.get('data') if isinstance(payment_data.get('data'), dict) else payment_data
+        invalid = validate_checkout(data)
+        if invalid is not None:
+            raise InvalidPaymentRequest(invalid[0]['error'])
+
+        # Sin cabeceras HTTP: la sesión del cliente viaja en el mensaje si el publicador la tiene
+        client_data = data.get('client') or client_session_data(
+            data, {'User-Agent': 'payment-consumer'}, data.get('ipAddress', '127.0.0.1')
+        )
+        key = reference_code(data)
+        body, _, _ = self.idempotency_store.execute(
+            key, lambda: self._submit(data, client_data), payment_record(data)
+        )
+        if body.get(GATEWAY_UNAVAILABLE):
+            # La respuesta no se guardó (status 400): el reintento vuelve a reservar la clave
+            raise PaymentGatewayUnavailable(body.get('details'))
+        return {
+            'order_id': data['order']['orderId'],
+            'payment_id': key,
+            'status': body.get('status'),
+            'message': body.get('message') or body.get('details') or body.get('error'),
+            'timestamp': datetime.utcnow().isoformat()
         }
-    }
-    return submit_transaction(payload)
\ No newline at end of file
+
+    @staticmethod
+    def _submit(data, client_data):
+        method = data['paymentMethod']
+        if method == "CC":
+            payu_response = build_cc_payload(data['order'], data['user'], data['card'], client_data)
+        else:
+            payu_response = build_pse_payload(data['order'], data['user'], data['pse'], client_data)
+        body, status = build_checkout_response(method, payu_response)
+        if payu_response.get(GATEWAY_UNAVAILABLE):
+            body[GATEWAY_UNAVAILABLE] = True
+        return body, status
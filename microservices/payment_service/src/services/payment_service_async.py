@@ -0,0 +1,109 @@
+import asyncio
+import os
+import aiohttp
+from services.payment_service import (
+    PAYU_API_URL, PAYU_CONNECT_TIMEOUT, PAYU_READ_TIMEOUT, PAYU_BREAKER_FAILURE_THRESHOLD,
+    PAYU_BREAKER_RECOVERY_TIMEOUT, PAYU_BREAKER_HALF_OPEN_CALLS, PAYU_BULKHEAD_MAX_WAIT, PAYU_CALL_DEADLINE,
+    PAYU_HEDGE_DELAY, PAYU_HEDGE_MAX_ATTEMPTS, _payload_builder, get_pse_banks
+)
+from utils.payu_client_async import AsyncPayUClient
+from utils.resilience_decorators import (
+    AsyncBulkhead, BulkheadFullError, CircuitBreakerOpenError, get_circuit_breaker, hedged_call_async
+)
+
+# Versión asyncio de services/payment_service para server/app_async.py.
+# Comparte con el modo síncrono las plantillas de payload y la configuración del
+# circuito. El bulkhead es del event loop y su cupo por defecto es mucho mayor
+# porque una llamada en curso ya no bloquea un hilo.
+
+PAYU_ASYNC_MAX_CONCURRENT = int(os.getenv("PAYU_ASYNC_MAX_CONCURRENT", 500))
+PAYU_ASYNC_POOL_MAXSIZE = int(os.getenv("PAYU_ASYNC_POOL_MAXSIZE", 200))
+
+_RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+# Errores de aiohttp en vez de los de requests cuentan para el circuito
+_payu_breaker = get_circuit_breaker(
+    "payu-async",
+    failure_threshold=PAYU_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=PAYU_BREAKER_RECOVERY_TIMEOUT,
+    half_open_max_calls=PAYU_BREAKER_HALF_OPEN_CALLS,
+    failure_exceptions=_RETRYABLE_ERRORS
+)
+
+_payu_client = None
+_payu_bulkhead = None
+
+def get_payu_client():
+    """Cliente PayU asyncio del proceso (se crea en el primer uso, dentro del loop)."""
+    global _payu_client
+    if _payu_client is None:
+        _payu_client = AsyncPayUClient(
+            PAYU_API_URL,
+            connect_timeout=PAYU_CONNECT_TIMEOUT,
+            read_timeout=PAYU_READ_TIMEOUT,
+            pool_maxsize=PAYU_ASYNC_POOL_MAXSIZE
+        )
+    return _payu_client
+
+def _get_bulkhead():
+    global _payu_bulkhead
+    if _payu_bulkhead is None:
+        _payu_bulkhead = AsyncBulkhead("payu-async", PAYU_ASYNC_MAX_CONCURRENT, max_wait=PAYU_BULKHEAD_MAX_WAIT)
+    return _payu_bulkhead
+
+async def _post(payload, command):
+    async with _get_bulkhead():
+        return await _payu_breaker.call_async(get_payu_client().post, payload, command=command)
+
+async def submit_transaction(payload, command=None, idempotent=False):
+    """Envía la solicitud a PayU; mismas respuestas de error que el modo síncrono."""
+    try:
+        async with asyncio.timeout(PAYU_CALL_DEADLINE):
+            if idempotent:
+                return await hedged_call_async(
+                    _post, payload, command,
+                    hedge_delay=PAYU_HEDGE_DELAY,
+                    max_attempts=PAYU_HEDGE_MAX_ATTEMPTS,
+                    retry_on=_RETRYABLE_ERRORS + (BulkheadFullError,)
+                )
+            return await _post(payload, command)
+    except CircuitBreakerOpenError as e:
+        print(f"PayU no disponible, llamada rechazada: {e}")
+        return {"code": "ERROR", "error": "PayU no disponible temporalmente, reintente más tarde"}
+    except BulkheadFullError as e:
+        print(f"Llamada a PayU rechazada por concurrencia: {e}")
+        return {"code": "ERROR", "error": "Demasiadas solicitudes a PayU en curso, reintente más tarde"}
+    except _RETRYABLE_ERRORS as e:
+        # asyncio.TimeoutError no trae mensaje
+        error = str(e) or type(e).__name__
+        print(f"Error comunicándose con la API de PayU: {error}")
+        return {"code": "ERROR", "error": f"API Request Failed: {error}"}
+
+async def get_pse_banks_async():
+    # La lista de bancos se sirve del cache stale-while-revalidate del modo síncrono
+    # (casi siempre un hit); solo una recarga ocupa un hilo del pool por defecto
+    return await asyncio.to_thread(get_pse_banks)
+
+async def build_pse_payload(order_data, user_data, pse_data, client_data):
+    """
+    Construye y envía el payload de PayU para PSE.
+    """
+    payload = _payload_builder.build_pse(order_data, user_data, pse_data, client_data)
+    return await submit_transaction(payload, command="SUBMIT_TRANSACTION")
+
+async def build_cc_payload(order_data, user_data, card_data, client_data):
+    """
+    Construye y envía el payload de PayU para Tarjeta de Crédito/Débito.
+    """
+    payload = _payload_builder.build_cc(order_data, user_data, card_data, client_data)
+    return await submit_transaction(payload, command="SUBMIT_TRANSACTION")
+
+def get_payu_resilience_stats():
+    return {
+        "circuitBreaker": _payu_breaker.stats(),
+        "bulkhead": _get_bulkhead().stats()
+    }
+
+async def close():
+    if _payu_client is not None:
+        await _payu_client.close()
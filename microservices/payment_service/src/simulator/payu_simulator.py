@@ -0,0 +1,393 @@
+"""
+Local PayU stand-in for load testing
+Implements SUBMIT_TRANSACTION, GET_BANKS_LIST and the order/transaction queries
+(ORDER_DETAIL, ORDER_DETAIL_BY_REFERENCE_CODE, TRANSACTION_RESPONSE_DETAIL) with
+configurable latency distributions and approval/decline/error/timeout/connection-reset ratios.
+
+Run from src/ (or with src/ on PYTHONPATH):
+    python -m simulator.payu_simulator --port 9090 --latency lognormal:0.25,0.5 --decline-rate 0.1
+
+Then point the payment service at it:
+    PAYU_API_URL=http://localhost:9090/payments-api/4.0/service.cgi
+    PAYU_REPORTS_API_URL=http://localhost:9090/reports-api/4.0/service.cgi
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ('approve', 'decline', 'error', 'http_error', 'timeout', 'reset')
+QUERY_COMMANDS = ('ORDER_DETAIL', 'ORDER_DETAIL_BY_REFERENCE_CODE', 'TRANSACTION_RESPONSE_DETAIL')
+QUERY_STATES = {'approve': 'APPROVED', 'decline': 'DECLINED', 'pending': 'PENDING'}
+ORDER_STATUSES = {'APPROVED': 'CAPTURED', 'DECLINED': 'DECLINED', 'PENDING': 'IN_PROGRESS'}
+
+PSE_BANKS = [
+    {"id": "0", "description": "A continuación seleccione su banco", "pseCode": "0"},
+    {"id": "1", "description": "BANCO AGRARIO", "pseCode": "1040"},
+    {"id": "2", "description": "BANCO AV VILLAS", "pseCode": "1052"},
+    {"id": "3", "description": "BANCO CAJA SOCIAL", "pseCode": "1032"},
+    {"id": "4", "description": "BANCO DAVIVIENDA", "pseCode": "1051"},
+    {"id": "5", "description": "BANCO DE BOGOTA", "pseCode": "1001"},
+    {"id": "6", "description": "BANCO DE OCCIDENTE", "pseCode": "1023"},
+    {"id": "7", "description": "BANCO POPULAR", "pseCode": "1002"},
+    {"id": "8", "description": "BANCOLOMBIA", "pseCode": "1007"},
+    {"id": "9", "description": "BANCO UNION COLOMBIANO", "pseCode": "1022"},
+    {"id": "10", "description": "NEQUI", "pseCode": "1507"}
+]
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a sampler returning seconds.
+
+    Supported specs:
+        fixed:S | uniform:MIN,MAX | normal:MEAN,SD | lognormal:MEDIAN,SIGMA | exponential:MEAN
+    """
+    name, _, raw = spec.partition(':')
+    params = [float(p) for p in raw.split(',') if p]
+    name = name.strip().lower()
+
+    if name == 'fixed' and len(params) == 1:
+        return lambda rng: params[0]
+    if name == 'uniform' and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if name == 'normal' and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if name == 'lognormal' and len(params) == 2:
+        mu = math.log(params[0]) if params[0] > 0 else 0.0
+        return lambda rng: rng.lognormvariate(mu, params[1])
+    if name == 'exponential' and len(params) == 1:
+        return lambda rng: rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class SimulationProfile:
+    """Latency and outcome configuration shared by all request handlers"""
+
+    def __init__(self, latency='fixed:0', banks_latency='fixed:0', decline_rate=0.0,
+                 error_rate=0.0, http_error_rate=0.0, timeout_rate=0.0, reset_rate=0.0,
+                 timeout_seconds=60.0, seed=None, query_latency='fixed:0', query_pending_rate=0.0):
+        self.latency_spec = latency
+        self.banks_latency_spec = banks_latency
+        self.query_latency_spec = query_latency
+        self.sample_latency = parse_latency(latency)
+        self.sample_banks_latency = parse_latency(banks_latency)
+        self.sample_query_latency = parse_latency(query_latency)
+        self.timeout_seconds = timeout_seconds
+        if not 0 <= query_pending_rate <= 1:
+            raise ValueError("Query pending rate must be between 0 and 1")
+        self.query_pending_rate = query_pending_rate
+
+        rates = {
+            'decline': decline_rate,
+            'error': error_rate,
+            'http_error': http_error_rate,
+            'timeout': timeout_rate,
+            'reset': reset_rate
+        }
+        if any(rate < 0 for rate in rates.values()) or sum(rates.values()) > 1:
+            raise ValueError("Outcome rates must be non-negative and add up to at most 1")
+        rates['approve'] = 1 - sum(rates.values())
+        self.rates = rates
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {outcome: 0 for outcome in OUTCOMES}
+        self.counters['banks'] = 0
+        self.counters['queries'] = 0
+
+    def draw(self, banks=False):
+        """Pick (outcome, latency_seconds) for one request"""
+        with self._lock:
+            if banks:
+                latency = self.sample_banks_latency(self._rng)
+                roll = self._rng.random()
+                # Bank listing only fails through transport faults
+                outcome = 'banks'
+                for fault in ('http_error', 'timeout', 'reset'):
+                    roll -= self.rates[fault]
+                    if roll < 0:
+                        outcome = fault
+                        break
+            else:
+                latency = self.sample_latency(self._rng)
+                roll = self._rng.random()
+                outcome = 'approve'
+                for candidate in ('decline', 'error', 'http_error', 'timeout', 'reset'):
+                    roll -= self.rates[candidate]
+                    if roll < 0:
+                        outcome = candidate
+                        break
+            self.counters[outcome] += 1
+            return outcome, latency
+
+    def draw_query(self):
+        """Pick (outcome, latency_seconds) for an order/transaction query"""
+        with self._lock:
+            latency = self.sample_query_latency(self._rng)
+            self.counters['queries'] += 1
+            roll = self._rng.random()
+            for fault in ('http_error', 'timeout', 'reset'):
+                roll -= self.rates[fault]
+                if roll < 0:
+                    self.counters[fault] += 1
+                    return fault, latency
+            # The transaction is still waiting on the bank, or it settled
+            roll = self._rng.random()
+            if roll < self.query_pending_rate:
+                return 'pending', latency
+            if roll < self.query_pending_rate + (1 - self.query_pending_rate) * self.rates['decline']:
+                return 'decline', latency
+            return 'approve', latency
+
+    def describe(self):
+        with self._lock:
+            return {
+                'latency': self.latency_spec,
+                'banksLatency': self.banks_latency_spec,
+                'queryLatency': self.query_latency_spec,
+                'queryPendingRate': self.query_pending_rate,
+                'rates': dict(self.rates),
+                'timeoutSeconds': self.timeout_seconds,
+                'counters': dict(self.counters)
+            }
+
+
+def transaction_response(payload, outcome):
+    """Build a PayU-shaped SUBMIT_TRANSACTION response"""
+    transaction = payload.get('transaction', {})
+    order = transaction.get('order', {})
+    is_pse = transaction.get('paymentMethod') == 'PSE'
+    now = int(time.time() * 1000)
+
+    if outcome == 'error':
+        return {"code": "ERROR", "error": "Simulated gateway error", "transactionResponse": None}
+
+    response = {
+        "orderId": abs(hash(order.get('referenceCode', ''))) % 10**9,
+        "transactionId": str(uuid.uuid4()),
+        "paymentNetworkResponseCode": None,
+        "paymentNetworkResponseErrorMessage": None,
+        "trazabilityCode": str(now % 10**8),
+        "authorizationCode": None,
+        "pendingReason": None,
+        "responseCode": None,
+        "errorCode": None,
+        "responseMessage": None,
+        "transactionDate": None,
+        "transactionTime": None,
+        "operationDate": now,
+        "referenceQuestionnaire": None,
+        "extraParameters": None,
+        "additionalInfo": None
+    }
+
+    if outcome == 'decline':
+        response.update({
+            "state": "DECLINED",
+            "responseCode": "INSUFFICIENT_FUNDS" if not is_pse else "PAYMENT_NETWORK_REJECTED",
+            "paymentNetworkResponseCode": "51",
+            "responseMessage": "Simulated decline"
+        })
+    elif is_pse:
+        response.update({
+            "state": "PENDING",
+            "pendingReason": "AWAITING_NOTIFICATION",
+            "responseCode": "PENDING_TRANSACTION_CONFIRMATION",
+            "extraParameters": {
+                "BANK_URL": f"https://sandbox.pse.local/bank?ref={order.get('referenceCode', '')}",
+                "TRAZABILITY_CODE": str(now % 10**8)
+            }
+        })
+    else:
+        response.update({
+            "state": "APPROVED",
+            "responseCode": "APPROVED",
+            "authorizationCode": f"{now % 10**6:06d}",
+            "paymentNetworkResponseCode": "00",
+            "responseMessage": "APPROVED"
+        })
+    return {"code": "SUCCESS", "error": None, "transactionResponse": response}
+
+
+def query_response(payload, outcome):
+    """Build a PayU-shaped reports API response for one of QUERY_COMMANDS"""
+    command = payload.get('command')
+    details = payload.get('details') or {}
+    now = int(time.time() * 1000)
+    state = QUERY_STATES[outcome]
+    transaction = {
+        "state": state,
+        "responseCode": {"APPROVED": "APPROVED", "DECLINED": "PAYMENT_NETWORK_REJECTED"}.get(
+            state, "PENDING_TRANSACTION_CONFIRMATION"),
+        "paymentNetworkResponseCode": {"APPROVED": "00", "DECLINED": "51"}.get(state),
+        "trazabilityCode": str(now % 10**8),
+        "authorizationCode": f"{now % 10**6:06d}" if state == "APPROVED" else None,
+        "pendingReason": "AWAITING_NOTIFICATION" if state == "PENDING" else None,
+        "operationDate": now
+    }
+    if command == 'TRANSACTION_RESPONSE_DETAIL':
+        result = transaction
+    else:
+        reference_code = details.get('referenceCode', '')
+        order = {
+            "id": details.get('orderId') or abs(hash(reference_code)) % 10**9,
+            "referenceCode": reference_code,
+            "status": ORDER_STATUSES[state],
+            "transactions": [{"id": str(uuid.uuid4()), "transactionResponse": transaction}]
+        }
+        result = [order] if command == 'ORDER_DETAIL_BY_REFERENCE_CODE' else order
+    return {"code": "SUCCESS", "error": None, "result": {"payload": result}}
+
+
+class PayUSimulatorHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 keep-alive handler so pooled clients reuse connections like against PayU"""
+
+    protocol_version = 'HTTP/1.1'
+    profile = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._send_json(400, {"code": "ERROR", "error": "Invalid JSON"})
+            return
+
+        command = payload.get('command')
+        if command == 'GET_BANKS_LIST':
+            outcome, latency = self.profile.draw(banks=True)
+        elif command == 'SUBMIT_TRANSACTION':
+            outcome, latency = self.profile.draw()
+        elif command in QUERY_COMMANDS:
+            outcome, latency = self.profile.draw_query()
+        elif command == 'PING':
+            self._send_json(200, {"code": "SUCCESS", "error": None, "result": None})
+            return
+        else:
+            self._send_json(200, {"code": "ERROR", "error": f"Unsupported command: {command}"})
+            return
+
+        if outcome == 'timeout':
+            # Hold the request longer than any sane client read timeout
+            time.sleep(self.profile.timeout_seconds)
+            self.close_connection = True
+            return
+
+        time.sleep(latency)
+
+        if outcome == 'reset':
+            self._reset_connection()
+        elif outcome == 'http_error':
+            self._send_json(500, {"code": "ERROR", "error": "Simulated HTTP 500"})
+        elif outcome == 'banks':
+            self._send_json(200, {"code": "SUCCESS", "error": None, "banks": PSE_BANKS})
+        elif command in QUERY_COMMANDS:
+            self._send_json(200, query_response(payload, outcome))
+        else:
+            self._send_json(200, transaction_response(payload, outcome))
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.profile.describe())
+        else:
+            self._send_json(200, {"status": "PayU simulator running"})
+
+    def finish(self):
+        try:
+            super().finish()
+        except (OSError, ValueError):
+            # Socket already aborted by a simulated connection reset
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reset_connection(self):
+        # SO_LINGER with zero timeout makes close() send a TCP RST
+        self.close_connection = True
+        try:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.connection.close()
+        except OSError:
+            pass
+
+
+def create_server(host, port, profile):
+    """Build a threaded simulator server bound to host:port (port 0 picks a free port)"""
+    handler = type('ConfiguredPayUSimulatorHandler', (PayUSimulatorHandler,), {'profile': profile})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description="Local PayU stand-in for load testing")
+    parser.add_argument('--host', default=os.getenv('PAYU_SIM_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PAYU_SIM_PORT', 9090)))
+    parser.add_argument('--latency', default=os.getenv('PAYU_SIM_LATENCY', f"fixed:{config.PAYMENT_PROCESSING_TIME}"),
+                        help='SUBMIT_TRANSACTION latency distribution, e.g. lognormal:0.3,0.4')
+    parser.add_argument('--banks-latency', default=os.getenv('PAYU_SIM_BANKS_LATENCY', 'fixed:0.05'))
+    parser.add_argument('--query-latency', default=os.getenv('PAYU_SIM_QUERY_LATENCY', 'fixed:0.05'),
+                        help='ORDER_DETAIL/TRANSACTION_RESPONSE_DETAIL latency distribution')
+    parser.add_argument('--query-pending-rate', type=float,
+                        default=float(os.getenv('PAYU_SIM_QUERY_PENDING_RATE', 0.2)),
+                        help='Share of queried transactions that are still PENDING')
+    parser.add_argument('--decline-rate', type=float,
+                        default=float(os.getenv('PAYU_SIM_DECLINE_RATE', 1 - config.PAYMENT_SUCCESS_RATE)))
+    parser.add_argument('--error-rate', type=float, default=float(os.getenv('PAYU_SIM_ERROR_RATE', 0)))
+    parser.add_argument('--http-error-rate', type=float, default=float(os.getenv('PAYU_SIM_HTTP_ERROR_RATE', 0)))
+    parser.add_argument('--timeout-rate', type=float, default=float(os.getenv('PAYU_SIM_TIMEOUT_RATE', 0)))
+    parser.add_argument('--reset-rate', type=float, default=float(os.getenv('PAYU_SIM_RESET_RATE', 0)))
+    parser.add_argument('--timeout-seconds', type=float, default=float(os.getenv('PAYU_SIM_TIMEOUT_SECONDS', 60)))
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    profile = SimulationProfile(
+        latency=args.latency,
+        banks_latency=args.banks_latency,
+        decline_rate=args.decline_rate,
+        error_rate=args.error_rate,
+        http_error_rate=args.http_error_rate,
+        timeout_rate=args.timeout_rate,
+        reset_rate=args.reset_rate,
+        timeout_seconds=args.timeout_seconds,
+        seed=args.seed,
+        query_latency=args.query_latency,
+        query_pending_rate=args.query_pending_rate
+    )
+    server = create_server(args.host, args.port, profile)
+    logger.info(f"PayU simulator listening on {args.host}:{server.server_address[1]} with profile {profile.describe()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+from enum import Enum
+
+# Constantes compartidas por los productores y consumidores de eventos de pago.
+
+
+class EventType(Enum):
+    """Eventos de pago; el valor es la routing key en PAYMENT_EXCHANGE."""
+
+    PAYMENT_REQUEST = 'payment.request'
+    PAYMENT_RESPONSE = 'payment.response'
+    PAYMENT_COMPLETED = 'payment.completed'
+    PAYMENT_FAILED = 'payment.failed'
+    PAYMENT_REFUNDED = 'payment.refunded'
+
+
+class LogMessages:
+    EVENT_PUBLISHED = "Published payment event: {event_type}"
+    EVENT_NOT_PUBLISHED = "Failed to publish payment event: {event_type}"
+    RABBITMQ_RECONNECTING = "RabbitMQ publisher disconnected; reconnecting in {delay:.1f}s"
+    RABBITMQ_CONSUMER_RECONNECTING = "RabbitMQ consumer disconnected; reconnecting in {delay:.1f}s"
+
+
+class ErrorMessages:
+    RABBITMQ_UNAVAILABLE = "Cannot connect to RabbitMQ"
+    RABBITMQ_RECONNECT_FAILED = "Failed to reconnect to RabbitMQ"
+    PUBLISH_FAILED = "Error publishing payment event: {error}"
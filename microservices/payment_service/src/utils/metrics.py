@@ -0,0 +1,161 @@
+import os
+import threading
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess, start_http_server
+)
+from pymongo import monitoring
+
+# Métricas Prometheus del servicio de pagos.
+# Con gunicorn cada worker es un proceso distinto: si PROMETHEUS_MULTIPROC_DIR está
+# definida (server/gunicorn_conf.py la prepara antes de crear los workers) cada
+# proceso escribe sus valores en ese directorio y /metrics los agrega todos.
+
+PAYU_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 300, 900)
+
+PAYU_REQUEST_SECONDS = Histogram(
+    'payu_request_duration_seconds',
+    'Latencia de las llamadas a la API de PayU',
+    ['command', 'outcome'],
+    buckets=PAYU_BUCKETS
+)
+PAYU_IN_FLIGHT = Gauge(
+    'payu_requests_in_flight',
+    'Llamadas a PayU en curso',
+    multiprocess_mode='livesum'
+)
+ADMISSION_DECISIONS = Counter(
+    'checkout_admission_decisions_total',
+    'Decisiones del control de admisión de /checkout',
+    ['outcome']
+)
+CHECKOUT_SECONDS = Histogram(
+    'checkout_duration_seconds',
+    'Latencia del handler de checkout por método de pago y código HTTP',
+    ['method', 'code'],
+    buckets=PAYU_BUCKETS
+)
+MONGO_OPERATION_SECONDS = Histogram(
+    'mongo_operation_duration_seconds',
+    'Latencia de los comandos de MongoDB del repositorio de pagos',
+    ['command', 'collection', 'outcome'],
+    buckets=MONGO_BUCKETS
+)
+CONSUMER_PROCESSING_SECONDS = Histogram(
+    'payment_consumer_processing_seconds',
+    'Tiempo de procesamiento de cada mensaje payment.request por carril',
+    ['lane', 'outcome'],
+    buckets=PAYU_BUCKETS
+)
+CONSUMER_QUEUE_LAG_SECONDS = Histogram(
+    'payment_consumer_queue_lag_seconds',
+    'Tiempo entre la publicación de un payment.request y su entrega al consumidor',
+    ['lane'],
+    buckets=LAG_BUCKETS
+)
+CONSUMER_DISPATCH_WAIT_SECONDS = Histogram(
+    'payment_consumer_dispatch_wait_seconds',
+    'Tiempo que un payment.request entregado espera en el consumidor a un worker de su carril',
+    ['lane'],
+    buckets=LAG_BUCKETS
+)
+CONSUMER_LANE_DEPTH = Gauge(
+    'payment_consumer_lane_depth',
+    'Mensajes por carril: en la cola del broker, en espera en el consumidor o en proceso',
+    ['lane', 'stage'],
+    multiprocess_mode='livesum'
+)
+CONSUMER_MESSAGES = Counter(
+    'payment_consumer_messages_total',
+    'Mensajes payment.request terminados',
+    ['lane', 'outcome']
+)
+CONSUMER_RETRIES = Counter(
+    'payment_consumer_retries_total',
+    'Solicitudes payment.request fallidas reenviadas a una cola de reintento o a la DLQ',
+    ['lane']
+)
+CONFIRMATIONS_RECEIVED = Counter(
+    'payu_confirmations_received_total',
+    'Confirmaciones de PayU recibidas por el webhook',
+    ['outcome']
+)
+CONFIRMATIONS_APPLIED = Counter(
+    'payu_confirmations_applied_total',
+    'Confirmaciones de PayU procesadas por el aplicador',
+    ['outcome']
+)
+CONFIRMATION_APPLY_LAG_SECONDS = Histogram(
+    'payu_confirmation_apply_lag_seconds',
+    'Tiempo entre la recepción de una confirmación de PayU y su aplicación al pago',
+    buckets=LAG_BUCKETS
+)
+RECONCILIATION_QUERIES = Counter(
+    'payment_reconciliation_queries_total',
+    'Consultas de estado a PayU del worker de conciliación por estado reportado',
+    ['command', 'outcome']
+)
+RECONCILIATION_UPDATES = Counter(
+    'payment_reconciliation_updates_total',
+    'Pagos PENDING que la conciliación llevó a un estado final',
+    ['status']
+)
+RECONCILIATION_BATCH_SECONDS = Histogram(
+    'payment_reconciliation_batch_seconds',
+    'Duración de cada lote de conciliación (consultas y escritura)',
+    buckets=PAYU_BUCKETS
+)
+RECONCILIATION_OLDEST_PENDING_SECONDS = Gauge(
+    'payment_reconciliation_oldest_pending_seconds',
+    'Antigüedad del pago PENDING más antiguo del último lote conciliado',
+    multiprocess_mode='max'
+)
+
+
+def _registry():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_payload():
+    """Retorna (cuerpo, content-type) de /metrics en formato de texto Prometheus."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port):
+    """Expone /metrics en un puerto propio (procesos sin Flask, como el consumidor)."""
+    start_http_server(port, registry=_registry())
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener de pymongo que mide cada comando enviado por un MongoClient."""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else ''
+            )
+
+    def _observe(self, event, outcome):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), '')
+        MONGO_OPERATION_SECONDS.labels(event.command_name, collection, outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._observe(event, 'success')
+
+    def failed(self, event):
+        self._observe(event, 'error')
+
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utils.payu_payloads import dumps, loads
+from utils.metrics import PAYU_REQUEST_SECONDS, PAYU_IN_FLIGHT
+from utils.resilience_decorators import remaining
+
+# Cliente HTTP dedicado para la API de PayU.
+# Mantiene una sesión con conexiones keep-alive reutilizables, de modo que cada
+# transacción no pague un handshake TCP+TLS nuevo, y aplica timeouts para que
+# un worker de gunicorn nunca quede colgado esperando al gateway.
+
+DEFAULT_HEADERS = {
+    'Content-Type': 'application/json; charset=utf-8',
+    'Accept': 'application/json'
+}
+
+
+class PayUClient:
+    """Cliente HTTP con pool de conexiones para la API de PayU."""
+
+    def __init__(self, api_url, connect_timeout=3.05, read_timeout=30,
+                 pool_connections=1, pool_maxsize=10, pool_block=True):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+
+        # pool_block=True limita el número de conexiones abiertas por proceso:
+        # si el pool está lleno, la petición espera una conexión libre en vez
+        # de abrir una nueva.
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._requests_total = 0
+        self._errors_total = 0
+        self._timeouts_total = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    def _request_timeout(self):
+        # Con un plazo activo (utils.resilience_decorators.deadline) ningún timeout
+        # supera el tiempo que queda. El read timeout de requests es por lectura del
+        # socket, no total, pero acota la espera típica de PayU (una sola respuesta).
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            raise requests.exceptions.Timeout("Plazo vencido antes de llamar a PayU")
+        connect_timeout, read_timeout = self.timeout
+        return (min(connect_timeout, left), min(read_timeout, left))
+
+    def post(self, payload, command=None):
+        """Envía el payload a PayU y retorna el JSON de respuesta.
+
+        payload puede ser un dict o un cuerpo JSON ya serializado (bytes).
+        command solo etiqueta las métricas (por defecto el 'command' del dict).
+        """
+        body = payload if isinstance(payload, bytes) else dumps(payload)
+        if command is None:
+            command = payload.get('command', 'UNKNOWN') if isinstance(payload, dict) else 'UNKNOWN'
+        with self._lock:
+            self._requests_total += 1
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        PAYU_IN_FLIGHT.inc()
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.api_url, data=body, timeout=self._request_timeout())
+            response.raise_for_status()
+            data = loads(response.content)
+            outcome = 'success' if data.get('code') == 'SUCCESS' else 'error_response'
+            return data
+        except requests.exceptions.Timeout:
+            outcome = 'timeout'
+            with self._lock:
+                self._timeouts_total += 1
+                self._errors_total += 1
+            raise
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if isinstance(e, requests.exceptions.HTTPError):
+                outcome = 'http_error'
+            elif isinstance(e, requests.exceptions.ConnectionError):
+                outcome = 'connection_error'
+            elif isinstance(e, ValueError):
+                outcome = 'invalid_response'
+            with self._lock:
+                self._errors_total += 1
+            raise
+        finally:
+            PAYU_REQUEST_SECONDS.labels(command, outcome).observe(time.perf_counter() - started)
+            PAYU_IN_FLIGHT.dec()
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        """Contadores de uso del cliente y del pool de conexiones."""
+        connections_opened = 0
+        requests_sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections_opened += pool.num_connections
+            requests_sent += pool.num_requests
+
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "requestsTotal": self._requests_total,
+                "errorsTotal": self._errors_total,
+                "timeoutsTotal": self._timeouts_total,
+                "inFlight": self._in_flight,
+                "maxInFlight": self._max_in_flight,
+                "poolMaxSize": self.pool_maxsize,
+                "connectionsOpened": connections_opened,
+                "connectionRequests": requests_sent
+            }
+
+    def close(self):
+        self.session.close()
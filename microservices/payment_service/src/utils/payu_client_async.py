@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+import aiohttp
+from utils.payu_client import DEFAULT_HEADERS
+from utils.payu_payloads import dumps, loads
+from utils.metrics import PAYU_REQUEST_SECONDS, PAYU_IN_FLIGHT
+
+# Cliente asyncio para la API de PayU (modo server/app_async.py).
+# Una llamada en curso no ocupa un hilo: cientos de transacciones esperan al
+# gateway dentro del mismo event loop. El connector mantiene conexiones
+# keep-alive y su límite hace de pool (las llamadas extra esperan conexión).
+
+
+class AsyncPayUClient:
+    """Cliente aiohttp con pool de conexiones para la API de PayU."""
+
+    def __init__(self, api_url, connect_timeout=3.05, read_timeout=30, pool_maxsize=200):
+        self.api_url = api_url
+        self.pool_maxsize = pool_maxsize
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._session = None
+
+        self._requests_total = 0
+        self._errors_total = 0
+        self._timeouts_total = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    def _get_session(self):
+        # La sesión se crea dentro del loop que la usa
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize, keepalive_timeout=60),
+                headers=DEFAULT_HEADERS,
+                timeout=self.timeout
+            )
+        return self._session
+
+    async def post(self, payload, command=None):
+        """Envía el payload a PayU y retorna el JSON de respuesta (igual que PayUClient.post)."""
+        body = payload if isinstance(payload, bytes) else dumps(payload)
+        if command is None:
+            command = payload.get('command', 'UNKNOWN') if isinstance(payload, dict) else 'UNKNOWN'
+        self._requests_total += 1
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        PAYU_IN_FLIGHT.inc()
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            async with self._get_session().post(self.api_url, data=body) as response:
+                response.raise_for_status()
+                data = loads(await response.read())
+            outcome = 'success' if data.get('code') == 'SUCCESS' else 'error_response'
+            return data
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            self._timeouts_total += 1
+            self._errors_total += 1
+            raise
+        except (aiohttp.ClientError, ValueError) as e:
+            if isinstance(e, aiohttp.ClientResponseError):
+                outcome = 'http_error'
+            elif isinstance(e, aiohttp.ClientConnectionError):
+                outcome = 'connection_error'
+            elif isinstance(e, ValueError):
+                outcome = 'invalid_response'
+            self._errors_total += 1
+            raise
+        finally:
+            PAYU_REQUEST_SECONDS.labels(command, outcome).observe(time.perf_counter() - started)
+            PAYU_IN_FLIGHT.dec()
+            self._in_flight -= 1
+
+    def stats(self):
+        """Contadores de PayUClient.stats() (aiohttp no expone los del pool)."""
+        return {
+            "pid": os.getpid(),
+            "requestsTotal": self._requests_total,
+            "errorsTotal": self._errors_total,
+            "timeoutsTotal": self._timeouts_total,
+            "inFlight": self._in_flight,
+            "maxInFlight": self._max_in_flight,
+            "poolMaxSize": self.pool_maxsize
+        }
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,144 @@
+import json
+from utils.payu_utils import generate_payu_signature, calculate_tax_values
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; json estándar como respaldo
+    orjson = None
+
+# Construcción de payloads de PayU con plantillas precompiladas.
+# Las partes constantes (bloque merchant, comando, idioma, datos de la cuenta)
+# se serializan una sola vez por proceso; por transacción solo se arma y
+# serializa el bloque "transaction", directo a bytes.
+
+
+def dumps(obj):
+    """Serializa a bytes JSON compactos (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class PayUPayloadBuilder:
+    """Arma los cuerpos SUBMIT_TRANSACTION (CC y PSE) como bytes listos para enviar."""
+
+    def __init__(self, api_key, merchant_id, account_id, md5_key, currency, test=True,
+                 notify_url='http://yourdomain.com/payu/notify'):
+        self.merchant_id = merchant_id
+        self.notify_url = notify_url
+        self.account_id = account_id
+        self.md5_key = md5_key
+        self.currency = currency
+
+        envelope = {
+            "test": test,
+            "language": "es",
+            "command": "SUBMIT_TRANSACTION",
+            "merchant": {
+                "apiKey": api_key,
+                "apiLogin": api_key
+            }
+        }
+        # '{"test":true,...,"merchant":{...}' + ',"transaction":' + <transacción> + '}'
+        self._prefix = dumps(envelope)[:-1] + b',"transaction":'
+        self._suffix = b'}'
+        # Consultas de la API de reportes: mismo bloque merchant, otro comando
+        self._query_envelope = {key: value for key, value in envelope.items() if key != 'command'}
+
+    def build_query(self, command, details):
+        """Cuerpo de una consulta (ORDER_DETAIL, ORDER_DETAIL_BY_REFERENCE_CODE, TRANSACTION_RESPONSE_DETAIL)."""
+        return dumps(dict(self._query_envelope, command=command, details=details))
+
+    def build_cc(self, order_data, user_data, card_data, client_data):
+        """Cuerpo para Tarjeta de Crédito/Débito."""
+        order_id = order_data['orderId']
+        order = self._order(order_data, f"ORDER-CC-{order_id}", f"Bookstore purchase - CC Order #{order_id}")
+        order["buyer"] = {
+            "fullName": user_data['fullName'],
+            "emailAddress": user_data['email'],
+            "contactPhone": user_data['contactPhone'],
+            "dniNumber": user_data['dniNumber'],
+            "shippingAddress": user_data['shippingAddress']
+        }
+        transaction = self._transaction(card_data.get('paymentMethod', 'VISA'), client_data, order)
+        transaction["creditCard"] = {
+            "number": card_data['number'],
+            "securityCode": card_data['securityCode'],
+            "expirationDate": card_data['expirationDate'],
+            "name": card_data['cardHolderName']
+        }
+        transaction["payer"] = {
+            "fullName": card_data['cardHolderName'],
+            "emailAddress": user_data['email'],
+            "contactPhone": user_data['contactPhone'],
+            "dniNumber": user_data['dniNumber'],
+            "billingAddress": user_data['shippingAddress'] # Misma dirección para facturación
+        }
+        return self._prefix + dumps(transaction) + self._suffix
+
+    def build_pse(self, order_data, user_data, pse_data, client_data):
+        """Cuerpo para PSE."""
+        order_id = order_data['orderId']
+        order = self._order(order_data, f"ORDER-PSE-{order_id}", f"Bookstore purchase - PSE Order #{order_id}")
+        order["notifyUrl"] = order_data.get('notifyUrl', self.notify_url)
+        buyer = {
+            "fullName": user_data['fullName'],
+            "emailAddress": user_data['email'],
+            "contactPhone": user_data['contactPhone'],
+            "dniNumber": user_data['dniNumber'],
+            "shippingAddress": user_data['shippingAddress']
+        }
+        order["buyer"] = buyer
+        transaction = self._transaction("PSE", client_data, order)
+        transaction["payer"] = {
+            "fullName": buyer["fullName"],
+            "emailAddress": buyer["emailAddress"],
+            "contactPhone": buyer["contactPhone"],
+            "dniNumber": buyer["dniNumber"],
+            "dniType": user_data.get('dniType', 'CC'),
+            "billingAddress": buyer["shippingAddress"] # Misma dirección para facturación PSE
+        }
+        transaction["extraParameters"] = {
+            "RESPONSE_URL": order_data['responseUrl'], # Obligatorio para redirección PSE
+            "FINANCIAL_INSTITUTION_CODE": pse_data['bankCode'],
+            "USER_TYPE": pse_data['userType'] # N o J
+        }
+        return self._prefix + dumps(transaction) + self._suffix
+
+    def _order(self, order_data, reference_code, description):
+        values = calculate_tax_values(order_data['amount'])
+        tx_value = values['TX_VALUE']
+        currency = self.currency
+        return {
+            "accountId": self.account_id,
+            "referenceCode": reference_code,
+            "description": description,
+            "language": "es",
+            "signature": generate_payu_signature(
+                self.merchant_id, tx_value, currency, reference_code, self.md5_key
+            ),
+            "additionalValues": {
+                "TX_VALUE": {"value": tx_value, "currency": currency},
+                "TX_TAX": {"value": values['TX_TAX'], "currency": currency},
+                "TX_TAX_RETURN_BASE": {"value": values['TX_TAX_RETURN_BASE'], "currency": currency}
+            }
+        }
+
+    @staticmethod
+    def _transaction(payment_method, client_data, order):
+        return {
+            "type": "AUTHORIZATION_AND_CAPTURE",
+            "paymentMethod": payment_method,
+            "paymentCountry": "CO",
+            "deviceSessionId": client_data.get('deviceSessionId', 'SIMULATED_SESSION_ID'),
+            "ipAddress": client_data.get('ipAddress', '127.0.0.1'),
+            "cookie": client_data.get('cookie', 'SIMULATED_COOKIE'),
+            "userAgent": client_data.get('userAgent', 'SIMULATED_USER_AGENT'),
+            "order": order
+        }
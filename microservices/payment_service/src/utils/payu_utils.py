@@ -14,6 +14,20 @@ def generate_payu_signature(merchant_id, tx_value, currency, reference_code, md5
     signature = hashlib.md5(signature_base.encode('utf-8')).hexdigest()
     return signature
 
+def format_confirmation_value(value):
+    # En la confirmación PayU firma el valor con un decimal si el segundo es cero
+    # (150.00 -> 150.0, 150.50 -> 150.5) y con dos en otro caso (150.25)
+    value_str = format_tx_value(value)
+    return value_str[:-1] if value_str.endswith('0') else value_str
+
+def generate_confirmation_signature(merchant_id, reference_code, tx_value, currency, state_pol, md5_key):
+    
+    #Firma MD5 de la página de confirmación: la de la transacción más el estado (state_pol).
+    signature_base = (
+        f"{md5_key}~{merchant_id}~{reference_code}~{format_confirmation_value(tx_value)}~{currency}~{state_pol}"
+    )
+    return hashlib.md5(signature_base.encode('utf-8')).hexdigest()
+
 def calculate_tax_values(amount, tax_rate=0.19):
     try:
         if tax_rate > 0:
@@ -40,4 +54,97 @@ def calculate_tax_values(amount, tax_rate=0.19):
             "TX_VALUE": amount,
             "TX_TAX": 0.00,
             "TX_TAX_RETURN_BASE": amount
-        }
\ No newline at end of file
+        }
+
+# --- Variantes por lote (conciliación / liquidación) ---
+# Reproducen exactamente la aritmética de las funciones escalares: misma división
+# en float y el mismo round() de Python, que redondea el valor binario exacto a
+# centavos. Por eso no se usa numpy (np.round escala por 100 y puede diferir en el
+# último centavo); la ganancia viene de sacar del ciclo todo lo invariante.
+
+def calculate_tax_values_batch(amounts, tax_rate=0.19):
+    """
+    Calcula los valores de impuestos para muchos montos.
+    Retorna columnas: {"TX_VALUE": [...], "TX_TAX": [...], "TX_TAX_RETURN_BASE": [...]}
+    con resultados idénticos a calculate_tax_values(amount) elemento a elemento.
+    """
+    tx_values = []
+    taxes = []
+    bases = []
+    add_value = tx_values.append
+    add_tax = taxes.append
+    add_base = bases.append
+    _round = round
+
+    if tax_rate > 0:
+        divisor = 1 + tax_rate
+        for amount in amounts:
+            try:
+                base = amount / divisor
+                base_rounded = _round(base, 2)
+                tax_rounded = _round(amount - base, 2)
+            except Exception:
+                # Valor no numérico: mismo manejo de errores que la versión escalar
+                single = calculate_tax_values(amount, tax_rate)
+                add_value(single["TX_VALUE"])
+                add_tax(single["TX_TAX"])
+                add_base(single["TX_TAX_RETURN_BASE"])
+                continue
+            add_value(_round(base_rounded + tax_rounded, 2))
+            add_tax(tax_rounded)
+            add_base(base_rounded)
+    else:
+        for amount in amounts:
+            single = calculate_tax_values(amount, tax_rate)
+            add_value(single["TX_VALUE"])
+            add_tax(single["TX_TAX"])
+            add_base(single["TX_TAX_RETURN_BASE"])
+
+    return {"TX_VALUE": tx_values, "TX_TAX": taxes, "TX_TAX_RETURN_BASE": bases}
+
+
+def _signatures_chunk(merchant_id, tx_values, currency, reference_codes, md5_key):
+    # El prefijo "md5_key~merchant_id~" es igual para todas las firmas: se hashea
+    # una vez y cada firma parte de una copia del estado MD5
+    prefix = hashlib.md5(f"{md5_key}~{merchant_id}~".encode('utf-8'))
+    suffix = f"~{currency}"
+    signatures = []
+    add = signatures.append
+    for reference_code, tx_value in zip(reference_codes, tx_values):
+        digest = prefix.copy()
+        digest.update(f"{reference_code}~{float(tx_value):.2f}{suffix}".encode('utf-8'))
+        add(digest.hexdigest())
+    return signatures
+
+
+def generate_payu_signatures_batch(merchant_id, tx_values, currency, reference_codes, md5_key,
+                                   workers=None, chunk_size=50000):
+    """
+    Genera firmas PayU para listas paralelas de valores y referencias.
+    Con workers > 1 los lotes grandes se reparten en un pool de procesos.
+    Cada firma es idéntica a generate_payu_signature(...) con los mismos datos.
+    """
+    tx_values = list(tx_values)
+    reference_codes = list(reference_codes)
+    if len(tx_values) != len(reference_codes):
+        raise ValueError("tx_values y reference_codes deben tener la misma longitud")
+
+    total = len(tx_values)
+    if not workers or workers <= 1 or total <= chunk_size:
+        return _signatures_chunk(merchant_id, tx_values, currency, reference_codes, md5_key)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    starts = range(0, total, chunk_size)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _signatures_chunk, merchant_id, tx_values[start:start + chunk_size], currency,
+                reference_codes[start:start + chunk_size], md5_key
+            )
+            for start in starts
+        ]
+        signatures = []
+        for future in futures:
+            signatures.extend(future.result())
+    return signatures
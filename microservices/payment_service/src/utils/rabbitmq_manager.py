@@ -0,0 +1,382 @@
+import logging
+import os
+import random
+import copy
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import partial
+import pika
+from utils.constants import LogMessages
+from utils.payu_payloads import dumps
+from utils.resilience_decorators import remaining
+
+# Conexión de publicación a RabbitMQ compartida por todos los hilos del proceso.
+# Un hilo de I/O es dueño de una SelectConnection con un pool de canales en modo
+# confirm; los demás hilos nunca tocan pika directamente: publish_message encola la
+# publicación para el ioloop (add_callback_threadsafe) y espera el confirm del broker
+# con un Future. Así no se abre una conexión por mensaje y las publicaciones de
+# muchos hilos comparten los confirms múltiples (multiple=True) del broker.
+
+logger = logging.getLogger(__name__)
+
+# Número de secuencia de una publicación mandatory: identifica el mensaje que el
+# broker devuelve con basic.return (ese frame no trae el delivery tag del confirm)
+PUBLISH_SEQ_HEADER = 'x-publish-seq'
+
+
+class _PublishChannel:
+    """Canal en modo confirm y sus publicaciones pendientes de confirmación."""
+
+    __slots__ = ('channel', 'seq', 'pending')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.seq = 0
+        # número de secuencia de publicación -> Future
+        self.pending = {}
+
+
+class RabbitMQManager:
+    """Conexión de larga duración con pool de canales confirm y reconexión con backoff."""
+
+    def __init__(self, config, channels=None, confirm_timeout=None, max_pending=None):
+        self.config = config
+        self.channel_count = max(1, channels or config.RABBITMQ_PUBLISH_CHANNELS)
+        self.confirm_timeout = confirm_timeout or config.RABBITMQ_PUBLISH_CONFIRM_TIMEOUT
+        # Publicaciones sin confirmar por proceso (contrapresión para publish sin espera)
+        self._slots = threading.BoundedSemaphore(max_pending or config.RABBITMQ_PUBLISH_MAX_PENDING)
+
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._closing = False
+        self._thread = None
+        self._pid = None
+
+        # Estado del hilo de I/O (solo se modifica desde ese hilo)
+        self._connection = None
+        self._channels = []
+        self._next_channel = 0
+        self._declared = set()
+        self._declaring = {}
+
+        # Publicaciones de otros hilos a la espera del ioloop
+        self._outbox = deque()
+        self._outbox_lock = threading.Lock()
+        self._drain_scheduled = False
+
+        self._published = 0
+        self._confirmed = 0
+        self._nacked = 0
+        self._returned = 0
+        self._failed = 0
+        self._reconnects = 0
+
+    # --- Ciclo de vida ---
+
+    def connect(self, timeout=10):
+        """Arranca el hilo de I/O (si no corre) y espera a tener canales listos."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Tras un fork el hilo y la conexión del padre no existen en el hijo
+                self._thread = None
+                self._ready.clear()
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='rabbitmq-publisher', daemon=True)
+                self._thread.start()
+        return self._ready.wait(timeout)
+
+    def reconnect(self, timeout=10):
+        """Espera a que el hilo de I/O recupere la conexión (la reconexión es automática)."""
+        return self.connect(timeout)
+
+    def is_connected(self):
+        return self._pid == os.getpid() and self._ready.is_set()
+
+    def close(self, timeout=10):
+        """Cierra la conexión esperando los confirms pendientes."""
+        with self._lock:
+            self._closing = True
+            connection, thread = self._connection, self._thread
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close_connection)
+            except Exception:
+                pass
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self):
+        delay = 1
+        while not self._closing:
+            opened_at = time.monotonic()
+            try:
+                connection = pika.SelectConnection(
+                    self._parameters(),
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_open_error,
+                    on_close_callback=self._on_connection_closed
+                )
+                with self._lock:
+                    self._connection = connection
+                connection.ioloop.start()
+            except Exception as e:
+                logger.error(f"RabbitMQ publisher I/O loop failed: {str(e)}")
+            with self._lock:
+                self._connection = None
+            if self._closing:
+                break
+            # Una conexión que duró lo suficiente reinicia el backoff
+            if time.monotonic() - opened_at > 30:
+                delay = 1
+            self._reconnects += 1
+            wait = delay * random.uniform(0.5, 1.5)
+            logger.warning(LogMessages.RABBITMQ_RECONNECTING.format(delay=wait))
+            time.sleep(wait)
+            delay = min(delay * 2, self.config.RABBITMQ_RECONNECT_MAX_DELAY)
+
+    def _parameters(self):
+        credentials = pika.PlainCredentials(self.config.RABBITMQ_USER, self.config.RABBITMQ_PASS)
+        return pika.ConnectionParameters(
+            host=self.config.RABBITMQ_HOST,
+            port=self.config.RABBITMQ_PORT,
+            virtual_host=self.config.RABBITMQ_VHOST,
+            credentials=credentials,
+            heartbeat=60,
+            blocked_connection_timeout=300
+        )
+
+    # --- Callbacks del hilo de I/O ---
+
+    def _on_connection_open(self, connection):
+        logger.info(f"RabbitMQ publisher connected, opening {self.channel_count} channel(s)")
+        for _ in range(self.channel_count):
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error(f"Error connecting to RabbitMQ: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self._ready.clear()
+        for slot in self._channels:
+            self._fail_pending(slot)
+        self._channels = []
+        # Las declaraciones se repiten en la nueva conexión (el broker pudo reiniciarse)
+        self._declared.clear()
+        for waiting in self._declaring.values():
+            for future, _ in waiting:
+                self._resolve(future, False)
+        self._declaring.clear()
+        # Lo encolado para este ioloop ya no se publicará
+        self._drain_outbox(failed=True)
+        if not self._closing:
+            logger.error(f"RabbitMQ publisher connection closed: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        slot = _PublishChannel(channel)
+        channel.add_on_close_callback(partial(self._on_channel_closed, slot))
+        channel.add_on_return_callback(partial(self._on_return, slot))
+        channel.confirm_delivery(
+            ack_nack_callback=partial(self._on_delivery_confirmation, slot),
+            callback=lambda frame: self._on_confirm_selected(slot)
+        )
+
+    def _on_confirm_selected(self, slot):
+        self._channels.append(slot)
+        self._ready.set()
+
+    def _on_channel_closed(self, slot, channel, reason):
+        if slot in self._channels:
+            self._channels.remove(slot)
+        self._fail_pending(slot)
+        # Una declaración en curso pudo perderse con el canal: sus publicaciones fallan
+        for waiting in self._declaring.values():
+            for future, _ in waiting:
+                self._resolve(future, False)
+        self._declaring.clear()
+        if not self._channels:
+            self._ready.clear()
+        connection = self._connection
+        if not self._closing and connection is not None and connection.is_open:
+            # Un canal cerrado por el broker (p. ej. exchange inexistente) se reemplaza
+            logger.warning(f"RabbitMQ publisher channel closed: {reason}; reopening")
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _fail_pending(self, slot):
+        pending, slot.pending = slot.pending, {}
+        for future in pending.values():
+            self._resolve(future, False)
+
+    def _close_connection(self):
+        connection = self._connection
+        if connection is None or connection.is_closing or connection.is_closed:
+            return
+        if any(slot.pending for slot in self._channels):
+            # Espera breve a los confirms en vuelo antes de cerrar
+            connection.ioloop.call_later(0.05, self._close_connection)
+            return
+        connection.close()
+
+    # --- Publicación ---
+
+    def publish_message(self, exchange, routing_key, message, persistent=True, wait=True, properties=None,
+                        mandatory=False):
+        """Publica un mensaje JSON desde cualquier hilo.
+
+        Con wait=True retorna True cuando el broker confirma el mensaje y False si lo
+        rechaza, la conexión no está disponible o vence el timeout (acotado por el
+        plazo de utils.resilience_decorators). Con wait=False retorna un Future con
+        ese mismo resultado, para publicar en ráfaga y esperar los confirms juntos.
+        Con mandatory=True un mensaje que no llega a ninguna cola (basic.return)
+        también cuenta como publicación fallida.
+        """
+        future = Future()
+        connection = self._connection
+        if not self.is_connected() or connection is None:
+            self._resolve(future, False)
+            return future.result() if wait else future
+
+        if not self._slots.acquire(timeout=self._wait_timeout()):
+            logger.warning("Too many unconfirmed RabbitMQ publishes; message rejected")
+            self._resolve(future, False)
+            return future.result() if wait else future
+        future.add_done_callback(lambda f: self._slots.release())
+
+        body = message if isinstance(message, bytes) else dumps(message)
+        props = properties or pika.BasicProperties(
+            content_type='application/json',
+            delivery_mode=2 if persistent else 1,
+            timestamp=int(time.time())
+        )
+        # Las publicaciones se encolan y el ioloop se despierta una sola vez por ráfaga
+        with self._outbox_lock:
+            self._outbox.append((exchange, routing_key, body, props, mandatory, future))
+            wake = not self._drain_scheduled
+            self._drain_scheduled = True
+        if wake:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._drain_outbox)
+            except Exception as e:
+                logger.error(f"Cannot schedule RabbitMQ publish: {str(e)}")
+                self._drain_outbox(failed=True)
+
+        if not wait:
+            return future
+        try:
+            return future.result(timeout=self._wait_timeout())
+        except FutureTimeoutError:
+            logger.error(f"Timed out waiting for broker confirm on {exchange}/{routing_key}")
+            return False
+
+    def _drain_outbox(self, failed=False):
+        with self._outbox_lock:
+            batch, self._outbox = self._outbox, deque()
+            self._drain_scheduled = False
+        for exchange, routing_key, body, props, mandatory, future in batch:
+            if failed:
+                self._resolve(future, False)
+            else:
+                self._publish(exchange, routing_key, body, props, mandatory, future)
+
+    def _wait_timeout(self):
+        left = remaining()
+        return self.confirm_timeout if left is None else max(0.0, min(self.confirm_timeout, left))
+
+    def _publish(self, exchange, routing_key, body, properties, mandatory, future):
+        if future.done():
+            return
+        if not self._channels:
+            self._resolve(future, False)
+            return
+        if exchange and exchange not in self._declared:
+            self._declare_then(
+                exchange, future, partial(self._publish, exchange, routing_key, body, properties, mandatory, future)
+            )
+            return
+        slot = self._channels[self._next_channel % len(self._channels)]
+        self._next_channel += 1
+        seq = slot.seq + 1
+        if mandatory:
+            # Copia: el llamador puede reutilizar las mismas propiedades en varias publicaciones
+            properties = copy.copy(properties)
+            properties.headers = dict(properties.headers or {}, **{PUBLISH_SEQ_HEADER: seq})
+        try:
+            slot.channel.basic_publish(
+                exchange=exchange, routing_key=routing_key, body=body, properties=properties, mandatory=mandatory
+            )
+        except Exception as e:
+            logger.error(f"Error publishing to {exchange}/{routing_key}: {str(e)}")
+            self._resolve(future, False)
+            return
+        slot.seq = seq
+        slot.pending[seq] = future
+        self._published += 1
+
+    def _declare_then(self, exchange, future, publish):
+        """Declara el exchange una vez por conexión; las publicaciones esperan la declaración."""
+        waiting = self._declaring.get(exchange)
+        if waiting is not None:
+            waiting.append((future, publish))
+            return
+        self._declaring[exchange] = [(future, publish)]
+
+        def on_declared(frame):
+            self._declared.add(exchange)
+            for _, resume in self._declaring.pop(exchange, []):
+                resume()
+
+        self._channels[0].channel.exchange_declare(
+            exchange=exchange,
+            exchange_type='topic',
+            durable=True,
+            callback=on_declared
+        )
+
+    def _on_delivery_confirmation(self, slot, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            seqs = [seq for seq in slot.pending if seq <= method.delivery_tag]
+        else:
+            seqs = [method.delivery_tag] if method.delivery_tag in slot.pending else []
+        for seq in seqs:
+            self._resolve(slot.pending.pop(seq), acked)
+        if acked:
+            self._confirmed += len(seqs)
+        else:
+            self._nacked += len(seqs)
+
+    def _on_return(self, slot, channel, method, properties, body):
+        # El broker envía basic.return antes del confirm del mismo mensaje: la
+        # publicación falla aquí y el ack posterior ya no la encuentra pendiente
+        logger.error(
+            f"RabbitMQ returned unroutable message on {method.exchange}/{method.routing_key}: {method.reply_text}"
+        )
+        future = slot.pending.pop((properties.headers or {}).get(PUBLISH_SEQ_HEADER), None)
+        if future is not None:
+            self._returned += 1
+            self._resolve(future, False)
+
+    def _resolve(self, future, result):
+        if not future.done():
+            if not result:
+                self._failed += 1
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            "connected": self.is_connected(),
+            "channels": len(self._channels),
+            "unconfirmed": sum(len(slot.pending) for slot in list(self._channels)),
+            "published": self._published,
+            "confirmed": self._confirmed,
+            "nacked": self._nacked,
+            "returned": self._returned,
+            "failed": self._failed,
+            "reconnects": self._reconnects
+        }
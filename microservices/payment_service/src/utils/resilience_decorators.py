@@ -0,0 +1,496 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# Patrones de resiliencia para llamadas a dependencias externas (PayU, RabbitMQ).
+# - CircuitBreaker: tras N fallos seguidos deja de llamar durante recovery_timeout
+#   y luego deja pasar unas pocas llamadas de prueba (half-open) antes de cerrar.
+# - Bulkhead: limita las llamadas concurrentes a una dependencia por proceso, para
+#   que un gateway lento no ocupe todos los hilos del worker.
+# - deadline/timeout: plazo absoluto por hilo; los clientes lo consultan con
+#   remaining() para acotar sus timeouts de red al tiempo que realmente queda.
+# - hedged: para operaciones idempotentes lanza un segundo intento si el primero
+#   tarda más de hedge_delay (o falla) y se queda con la primera respuesta.
+# El modo asyncio usa CircuitBreaker.call_async, AsyncBulkhead y hedged_call_async;
+# ahí el plazo total lo da asyncio.timeout en vez de deadline().
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreakerOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin tocar la dependencia."""
+
+
+class BulkheadFullError(Exception):
+    """No hay cupo de concurrencia para la dependencia."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """El plazo de la operación ya venció."""
+
+
+# --- Deadlines ---
+
+_deadline_local = threading.local()
+
+
+def current_deadline():
+    """Plazo absoluto (time.monotonic) del hilo actual, o None."""
+    return getattr(_deadline_local, 'deadline', None)
+
+
+def remaining(default=None):
+    """Segundos que quedan del plazo actual (default si no hay plazo)."""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    return deadline - time.monotonic()
+
+
+def check_deadline():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Plazo de la operación vencido")
+
+
+@contextmanager
+def deadline(seconds):
+    """Fija un plazo para el bloque; un plazo externo más corto se respeta."""
+    previous = current_deadline()
+    new = time.monotonic() + seconds
+    _deadline_local.deadline = new if previous is None else min(previous, new)
+    try:
+        yield
+    finally:
+        _deadline_local.deadline = previous
+
+
+def timeout(seconds):
+    """Decorador: ejecuta la función con un plazo de `seconds` segundos.
+
+    Python no puede interrumpir un hilo: el plazo lo aplican las operaciones de
+    red que consultan remaining(). Si la función termina después del plazo se
+    lanza DeadlineExceeded para que el llamador no confunda el resultado con uno
+    a tiempo.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with deadline(seconds):
+                check_deadline()
+                result = fn(*args, **kwargs)
+                check_deadline()
+                return result
+        return wrapper
+    return decorator
+
+
+# --- Circuit breaker ---
+
+class CircuitBreaker:
+    """Circuit breaker de tres estados con pruebas half-open."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0,
+                 half_open_max_calls=1, failure_exceptions=(Exception,)):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failure_exceptions = failure_exceptions
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+
+        self._calls = 0
+        self._rejected = 0
+        self._failures_total = 0
+        self._opened_total = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+
+    def allow(self):
+        """Reserva una llamada; lanza CircuitBreakerOpenError si el circuito no la admite.
+
+        Retorna True si la llamada ocupa una prueba half-open (ver release()).
+        """
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.OPEN or (
+                self._state == self.HALF_OPEN and self._probes >= self.half_open_max_calls
+            ):
+                self._rejected += 1
+                raise CircuitBreakerOpenError(f"Circuito '{self.name}' abierto")
+            self._calls += 1
+            if self._state == self.HALF_OPEN:
+                self._probes += 1
+                return True
+            return False
+
+    def release(self, probe):
+        """Libera la prueba half-open de una llamada interrumpida sin registrar resultado."""
+        if not probe:
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures_total += 1
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._opened_total += 1
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} failure(s)")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        probe = self.allow()
+        try:
+            result = fn(*args, **kwargs)
+        except self.failure_exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            # Errores que no indican una dependencia enferma: la dependencia respondió
+            self.record_success()
+            raise
+        except BaseException:
+            # CancelledError, KeyboardInterrupt, SystemExit: no dicen nada de la
+            # dependencia; el estado no cambia y la prueba queda libre
+            self.release(probe)
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """Igual que call() para una corrutina (el estado es compartido con call)."""
+        probe = self.allow()
+        try:
+            result = await fn(*args, **kwargs)
+        except self.failure_exceptions:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        self.record_success()
+        return result
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            self._refresh_state()
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutiveFailures": self._failures,
+                "calls": self._calls,
+                "rejected": self._rejected,
+                "failures": self._failures_total,
+                "timesOpened": self._opened_total
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name, **options):
+    """Circuit breaker compartido del proceso para `name` (se crea con options la primera vez)."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **options)
+        return breaker
+
+
+def circuit_breaker_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.stats() for breaker in breakers]
+
+
+# --- Bulkhead ---
+
+class Bulkhead:
+    """Límite de llamadas concurrentes con espera máxima para obtener cupo."""
+
+    def __init__(self, name, max_concurrent, max_wait=0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._max_active = 0
+        self._rejected = 0
+
+    def __enter__(self):
+        # Nunca esperar cupo más allá del plazo de la operación
+        wait_for = self.max_wait
+        left = remaining()
+        if left is not None:
+            wait_for = max(0.0, min(wait_for, left))
+        if not self._semaphore.acquire(timeout=wait_for):
+            with self._lock:
+                self._rejected += 1
+            raise BulkheadFullError(f"Bulkhead '{self.name}' lleno ({self.max_concurrent} llamadas en curso)")
+        with self._lock:
+            self._active += 1
+            self._max_active = max(self._max_active, self._active)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._lock:
+            self._active -= 1
+        self._semaphore.release()
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self:
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "maxConcurrent": self.max_concurrent,
+                "active": self._active,
+                "maxActive": self._max_active,
+                "rejected": self._rejected
+            }
+
+
+class AsyncBulkhead:
+    """Bulkhead para corrutinas de un event loop (async with)."""
+
+    def __init__(self, name, max_concurrent, max_wait=0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._active = 0
+        self._max_active = 0
+        self._rejected = 0
+
+    async def __aenter__(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        elif not self.max_wait:
+            self._fail()
+        else:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._fail()
+        self._active += 1
+        self._max_active = max(self._max_active, self._active)
+        return self
+
+    def _fail(self):
+        self._rejected += 1
+        raise BulkheadFullError(f"Bulkhead '{self.name}' lleno ({self.max_concurrent} llamadas en curso)")
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._active -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "maxConcurrent": self.max_concurrent,
+            "active": self._active,
+            "maxActive": self._max_active,
+            "rejected": self._rejected
+        }
+
+
+# --- Hedged retries ---
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+        return _hedge_executor
+
+
+def _with_deadline(fn, deadline_at):
+    def run(*args, **kwargs):
+        _deadline_local.deadline = deadline_at
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _deadline_local.deadline = None
+    return run
+
+
+def hedged_call(fn, *args, hedge_delay=1.0, max_attempts=2, retry_on=(Exception,), **kwargs):
+    """Ejecuta fn (idempotente) con intentos de respaldo.
+
+    Si un intento no responde en hedge_delay segundos, o falla con retry_on, se
+    lanza otro (hasta max_attempts en total). Retorna el primer resultado exitoso;
+    si todos fallan relanza el último error. Los intentos heredan el plazo actual.
+    """
+    executor = _get_hedge_executor()
+    target = _with_deadline(fn, current_deadline())
+    pending = set()
+    attempts = 0
+    last_error = None
+
+    def launch():
+        nonlocal attempts
+        attempts += 1
+        pending.add(executor.submit(target, *args, **kwargs))
+
+    launch()
+    while pending:
+        left = remaining()
+        wait_for = hedge_delay if attempts < max_attempts else left
+        if left is not None:
+            wait_for = max(0.0, min(wait_for if wait_for is not None else left, left))
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            error = future.exception()
+            if error is None:
+                return future.result()
+            if not isinstance(error, retry_on):
+                raise error
+            last_error = error
+        if remaining(1) <= 0:
+            raise DeadlineExceeded("Plazo vencido esperando los intentos") from last_error
+        if attempts < max_attempts:
+            # Sin respuesta a tiempo (hedge) o un intento falló (retry)
+            launch()
+    raise last_error
+
+
+async def hedged_call_async(fn, *args, hedge_delay=1.0, max_attempts=2, retry_on=(Exception,), **kwargs):
+    """Versión asyncio de hedged_call: los intentos son tareas del mismo loop y
+    los que quedan en curso se cancelan al llegar la primera respuesta exitosa."""
+    pending = set()
+    attempts = 0
+    last_error = None
+    try:
+        while True:
+            if attempts < max_attempts:
+                attempts += 1
+                pending.add(asyncio.ensure_future(fn(*args, **kwargs)))
+            if not pending:
+                raise last_error
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=hedge_delay if attempts < max_attempts else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    return task.result()
+                if not isinstance(error, retry_on):
+                    raise error
+                last_error = error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def hedged(hedge_delay=1.0, max_attempts=2, retry_on=(Exception,)):
+    """Decorador de hedged_call para funciones idempotentes."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return hedged_call(fn, *args, hedge_delay=hedge_delay, max_attempts=max_attempts,
+                               retry_on=retry_on, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Mensajería ---
+
+def resilient_message_queue(name, attempts=3, backoff=0.2, failure_threshold=5, recovery_timeout=15.0):
+    """Decorador para publicaciones en RabbitMQ que retornan True/False.
+
+    Reintenta con backoff exponencial y jitter mientras quede plazo, y comparte un
+    circuit breaker por `name`: con el circuito abierto la publicación se rechaza
+    de inmediato retornando False en vez de bloquear al llamador.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            breaker = get_circuit_breaker(
+                name, failure_threshold=failure_threshold, recovery_timeout=recovery_timeout
+            )
+            for attempt in range(1, attempts + 1):
+                try:
+                    probe = breaker.allow()
+                except CircuitBreakerOpenError as e:
+                    logger.warning(f"Message not published: {e}")
+                    return False
+                try:
+                    if fn(*args, **kwargs):
+                        breaker.record_success()
+                        return True
+                    breaker.record_failure()
+                except Exception as e:
+                    breaker.record_failure()
+                    logger.warning(f"Publish attempt {attempt}/{attempts} on '{name}' failed: {e}")
+                except BaseException:
+                    breaker.release(probe)
+                    raise
+                if attempt < attempts:
+                    delay = backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                    left = remaining()
+                    if left is not None and left <= delay:
+                        break
+                    time.sleep(delay)
+            return False
+        return wrapper
+    return decorator
@@ -0,0 +1,141 @@
+import threading
+import time
+
+# Cache de un solo valor con semántica stale-while-revalidate.
+# - Dentro del TTL el valor se sirve directamente (hit).
+# - Vencido el TTL pero dentro de max_stale se sirve el valor viejo y se
+#   refresca en segundo plano (stale hit).
+# - Sin valor utilizable, el primer llamador carga y los concurrentes esperan
+#   ese mismo resultado (single-flight), así N misses generan una sola llamada.
+# - Si la carga falla y existe un valor anterior, se sirve aunque esté vencido.
+
+
+class StaleWhileRevalidateCache:
+    """Cache TTL con refresco en segundo plano y coalescencia de cargas."""
+
+    def __init__(self, loader, ttl, max_stale=0, name='cache'):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = None
+        self._inflight = None  # threading.Event de la carga en curso
+        self._inflight_error = None
+        self._refreshing = False
+
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._loads = 0
+        self._load_errors = 0
+        self._stale_on_error = 0
+        self._last_error = None
+
+    def get(self):
+        """Retorna el valor cacheado, cargándolo si es necesario."""
+        with self._lock:
+            age = self._age()
+            if age is not None and age < self.ttl:
+                self._hits += 1
+                return self._value
+            if age is not None and age < self.ttl + self.max_stale:
+                self._stale_hits += 1
+                self._start_background_refresh()
+                return self._value
+
+            self._misses += 1
+            event = self._inflight
+            leader = event is None
+            if leader:
+                event = self._inflight = threading.Event()
+
+        if leader:
+            return self._load_as_leader(event)
+
+        event.wait()
+        with self._lock:
+            # Éxito del líder, o valor anterior servido porque la carga falló
+            if self._value is not None:
+                return self._value
+            error = self._inflight_error
+        raise error or RuntimeError(f"{self.name}: carga fallida")
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+
+    def stats(self):
+        with self._lock:
+            age = self._age()
+            lookups = self._hits + self._stale_hits + self._misses
+            return {
+                "name": self.name,
+                "hits": self._hits,
+                "staleHits": self._stale_hits,
+                "misses": self._misses,
+                "hitRatio": round((self._hits + self._stale_hits) / lookups, 4) if lookups else None,
+                "loads": self._loads,
+                "loadErrors": self._load_errors,
+                "staleServedOnError": self._stale_on_error,
+                "ageSeconds": round(age, 3) if age is not None else None,
+                "ttlSeconds": self.ttl,
+                "refreshing": self._refreshing,
+                "lastError": self._last_error
+            }
+
+    # --- Internos ---
+
+    def _age(self):
+        if self._loaded_at is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    def _load(self):
+        """Ejecuta el loader y guarda el resultado. Retorna (valor, error)."""
+        try:
+            value = self.loader()
+        except Exception as e:
+            with self._lock:
+                self._loads += 1
+                self._load_errors += 1
+                self._last_error = str(e)
+            return None, e
+        with self._lock:
+            self._loads += 1
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self._last_error = None
+        return value, None
+
+    def _load_as_leader(self, event):
+        value, error = self._load()
+        with self._lock:
+            self._inflight = None
+            self._inflight_error = error
+            if error is not None and self._value is not None:
+                # Servir el último valor conocido mientras el origen falla
+                self._stale_on_error += 1
+                value, error = self._value, None
+        event.set()
+        if error is not None:
+            raise error
+        return value
+
+    def _start_background_refresh(self):
+        # Se llama con self._lock tomado
+        if self._refreshing or self._inflight is not None:
+            return
+        self._refreshing = True
+        thread = threading.Thread(target=self._background_refresh, name=f"{self.name}-refresh", daemon=True)
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self._load()
+        finally:
+            with self._lock:
+                self._refreshing = False
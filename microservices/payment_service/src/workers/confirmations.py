@@ -0,0 +1,205 @@
+"""
+Applier for queued PayU confirmations
+Reads due confirmations from payment_confirmations (written by the confirmation
+webhook), matches them to payments by referenceCode and applies every resulting
+status change of a batch with one bulk write through PaymentRepository. The queue
+documents are then checkpointed with a single bulk write as well:
+
+    applied    the payment moved from PENDING to the confirmed status
+    ignored    nothing to do (PENDING notification, payment already final)
+    retry      payment not found yet or its checkout still PROCESSING; tried again
+               after PAYMENT_CONFIRMATION_RETRY_SECONDS (doubling per attempt)
+    unmatched  still unresolved after PAYMENT_CONFIRMATION_MAX_ATTEMPTS
+
+Run from src/ (a single instance; payment updates are guarded by the pre-image status):
+    python -m workers.confirmations
+"""
+import logging
+import signal
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from config.config import Config
+from repository.confirmations import CONFIRMATION_COLLECTION
+from repository.payment_repository import PaymentRepository, STATUS_CHANGE_FIELDS, build_projection
+from utils.metrics import CONFIRMATIONS_APPLIED, CONFIRMATION_APPLY_LAG_SECONDS, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUS = 'PENDING'
+# Checkout still waiting on PayU's answer: the confirmation must not overtake it
+PROCESSING_STATUS = 'PROCESSING'
+MATCH_FIELDS = STATUS_CHANGE_FIELDS + ('payment_id', 'created_at', 'checkout_response.details.transactionId')
+
+
+def pick_payment(candidates, transaction_id):
+    """Payment a confirmation belongs to among the payments sharing its referenceCode"""
+    for payment in candidates:
+        details = (payment.get('checkout_response') or {}).get('details') or {}
+        if details.get('transactionId') == transaction_id:
+            return payment
+    open_payments = [p for p in candidates if p.get('status') in (PENDING_STATUS, PROCESSING_STATUS)]
+    pool = open_payments or candidates
+    return max(pool, key=lambda p: p.get('created_at') or datetime.min) if pool else None
+
+
+class ConfirmationApplier:
+    """Batched application of payment_confirmations to the payments collection"""
+
+    def __init__(self, batch_size=None, poll_interval=None, retry_delay=None, max_attempts=None, repository=None):
+        """
+        Args:
+            batch_size: Confirmations per batch (PAYMENT_CONFIRMATION_BATCH_SIZE)
+            poll_interval: Seconds to sleep when no confirmation is due (PAYMENT_CONFIRMATION_POLL_INTERVAL_MS)
+            retry_delay: Base delay before retrying an unresolved confirmation (PAYMENT_CONFIRMATION_RETRY_SECONDS)
+            max_attempts: Attempts before a confirmation is marked unmatched (PAYMENT_CONFIRMATION_MAX_ATTEMPTS)
+            repository: PaymentRepository to apply the status changes with
+        """
+        self.config = Config()
+        self.batch_size = batch_size or self.config.PAYMENT_CONFIRMATION_BATCH_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            self.config.PAYMENT_CONFIRMATION_POLL_INTERVAL_MS / 1000
+        self.retry_delay = self.config.PAYMENT_CONFIRMATION_RETRY_SECONDS if retry_delay is None else retry_delay
+        self.max_attempts = max_attempts or self.config.PAYMENT_CONFIRMATION_MAX_ATTEMPTS
+
+        self.repository = repository or PaymentRepository(buffered=False)
+        self.payments = self.repository.payments
+        self.confirmations = self.repository.db[CONFIRMATION_COLLECTION]
+
+        self._stop = threading.Event()
+        self.counts = defaultdict(int)
+        self.batches = 0
+
+    def _classify(self, confirmation, payment, claimed):
+        """Outcome for one confirmation before the bulk write ('change' means apply it)"""
+        status = confirmation.get('status')
+        if status is None or status == PENDING_STATUS:
+            return 'ignored'
+        if payment is None or payment.get('status') == PROCESSING_STATUS:
+            return 'retry'
+        if payment['payment_id'] in claimed or payment.get('status') != PENDING_STATUS:
+            if payment.get('status') not in (PENDING_STATUS, status):
+                logger.warning(
+                    f"Confirmation {confirmation['_id']} reports {status} but payment "
+                    f"{payment['payment_id']} is already {payment.get('status')}"
+                )
+            return 'ignored'
+        return 'change'
+
+    def apply_batch(self):
+        """
+        Apply the due confirmations
+
+        Returns:
+            Number of confirmations read (a full batch means more may be waiting)
+        """
+        now = datetime.utcnow()
+        confirmations = list(
+            self.confirmations.find({'pending': True, 'next_attempt_at': {'$lte': now}})
+            .sort('next_attempt_at', 1)
+            .limit(self.batch_size)
+        )
+        if not confirmations:
+            return 0
+
+        candidates = defaultdict(list)
+        references = list({confirmation['reference_code'] for confirmation in confirmations})
+        for payment in self.payments.find({'reference_code': {'$in': references}}, build_projection(MATCH_FIELDS)):
+            candidates[payment['reference_code']].append(payment)
+
+        outcomes = {}
+        changes = []
+        routing = []
+        claimed = set()
+        for confirmation in sorted(confirmations, key=lambda c: c['received_at']):
+            payment = pick_payment(candidates[confirmation['reference_code']], confirmation['transaction_id'])
+            outcome = self._classify(confirmation, payment, claimed)
+            if outcome == 'change':
+                claimed.add(payment['payment_id'])
+                notification = confirmation.get('notification') or {}
+                changes.append((payment, confirmation['status'], {
+                    'confirmed_at': now,
+                    'payu_transaction_id': confirmation['transaction_id'],
+                    'payu_response_code': notification.get('response_message_pol') or notification.get('response_code_pol')
+                }))
+                routing.append(confirmation['_id'])
+                # A change that loses a race with another writer is retried
+                outcome = 'retry'
+            outcomes[confirmation['_id']] = outcome
+
+        applied = self.repository.apply_status_changes(changes)
+        applied_ids = {id(change) for change in applied}
+        for change, confirmation_id in zip(changes, routing):
+            if id(change) in applied_ids:
+                outcomes[confirmation_id] = 'applied'
+
+        self._checkpoint(confirmations, outcomes, now)
+        self.batches += 1
+        return len(confirmations)
+
+    def _checkpoint(self, confirmations, outcomes, now):
+        """Record every confirmation's outcome with one bulk write"""
+        requests = []
+        for confirmation in confirmations:
+            outcome = outcomes[confirmation['_id']]
+            attempts = confirmation.get('attempts', 0) + 1
+            if outcome == 'retry' and attempts >= self.max_attempts:
+                outcome = 'unmatched'
+                logger.warning(
+                    f"Confirmation {confirmation['_id']} for {confirmation['reference_code']} "
+                    f"unmatched after {attempts} attempts"
+                )
+            if outcome == 'retry':
+                update = {'$set': {
+                    'attempts': attempts,
+                    'next_attempt_at': now + timedelta(seconds=self.retry_delay * 2 ** (attempts - 1))
+                }}
+            else:
+                update = {
+                    '$set': {'outcome': outcome, 'attempts': attempts, 'applied_at': now},
+                    '$unset': {'pending': ''}
+                }
+                CONFIRMATION_APPLY_LAG_SECONDS.observe((now - confirmation['received_at']).total_seconds())
+            requests.append(UpdateOne({'_id': confirmation['_id']}, update))
+            CONFIRMATIONS_APPLIED.labels(outcome).inc()
+            self.counts[outcome] += 1
+        self.confirmations.bulk_write(requests, ordered=False)
+
+    def run(self):
+        """Apply confirmations until stop() is called"""
+        logger.info(f"Confirmation applier started (batch={self.batch_size})")
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self.apply_batch() < self.batch_size:
+                        self._stop.wait(self.poll_interval)
+                except Exception as e:
+                    logger.error(f"Confirmation applier error: {str(e)}")
+                    self._stop.wait(max(self.poll_interval, 1))
+        finally:
+            logger.info(f"Confirmation applier stopped: {dict(self.counts)} in {self.batches} batch(es)")
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.repository.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    if config.PAYMENT_CONFIRMATION_METRICS_PORT:
+        start_metrics_server(config.PAYMENT_CONFIRMATION_METRICS_PORT)
+    applier = ConfirmationApplier()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: applier.stop())
+    try:
+        applier.run()
+    finally:
+        applier.close()
+
+
+if __name__ == '__main__':
+    main()
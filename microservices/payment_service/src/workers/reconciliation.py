@@ -0,0 +1,334 @@
+"""
+Reconciliation worker for PENDING payments
+PSE payments (and any checkout PayU left pending) stay PENDING until someone asks
+PayU for their outcome. This worker sweeps them oldest first with keyset pages over
+the (status, created_at, payment_id) index, queries PayU's reports API with bounded
+concurrency and a per-second rate cap, and applies every settled payment of a batch
+with a single bulk write. The sweep position is checkpointed after each batch, so a
+restarted worker resumes where it stopped instead of re-querying the whole backlog.
+
+Run from src/ (a single instance; updates are guarded by the PENDING status, so an
+accidental second one only wastes PayU queries):
+    python -m workers.reconciliation [--once]
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config.config import Config
+from repository.payment_repository import PaymentRepository, STATUS_CHANGE_FIELDS, build_projection
+from services.payment_service import (
+    PAYU_BULKHEAD_MAX_CONCURRENT, query_order, query_order_by_reference, query_transaction
+)
+from utils.metrics import (
+    RECONCILIATION_BATCH_SECONDS, RECONCILIATION_OLDEST_PENDING_SECONDS, RECONCILIATION_QUERIES,
+    RECONCILIATION_UPDATES, start_metrics_server
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = 'payment_reconciliation'
+CHECKPOINT_ID = 'pending-sweep'
+PENDING_STATUS = 'PENDING'
+SWEEP_SORT = [('status', 1), ('created_at', 1), ('payment_id', 1)]
+
+# Pre-image for the status change plus the identifiers PayU can be queried by
+RECONCILE_FIELDS = STATUS_CHANGE_FIELDS + (
+    'payment_id', 'created_at', 'checkout_response.details.transactionId', 'checkout_response.details.orderId'
+)
+
+
+class RateLimiter:
+    """Token bucket shared by the query threads: at most `rate` acquisitions per second"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def settled_transaction(command, response):
+    """
+    Transaction response reported by a PayU query
+
+    Args:
+        command: Query command that produced the response
+        response: Parsed reports API response
+
+    Returns:
+        The transactionResponse dict (with 'state'), or None if PayU reported none
+    """
+    if response.get('code') != 'SUCCESS':
+        return None
+    payload = (response.get('result') or {}).get('payload')
+    if command == 'TRANSACTION_RESPONSE_DETAIL':
+        return payload if isinstance(payload, dict) and payload.get('state') else None
+
+    orders = payload if isinstance(payload, list) else [payload] if payload else []
+    transactions = [
+        transaction.get('transactionResponse') or {}
+        for order in orders
+        for transaction in (order or {}).get('transactions') or []
+    ]
+    transactions = [transaction for transaction in transactions if transaction.get('state')]
+    if not transactions:
+        return None
+    # A retried reference can have several transactions: any approval wins, then a pending one
+    for state in ('APPROVED', PENDING_STATUS):
+        for transaction in transactions:
+            if transaction['state'] == state:
+                return transaction
+    return transactions[-1]
+
+
+class PaymentReconciler:
+    """Checkpointed sweep of PENDING payments against PayU"""
+
+    def __init__(self, batch_size=None, concurrency=None, rate_limit=None, min_age=None,
+                 interval=None, repository=None):
+        """
+        Args:
+            batch_size: Payments read, queried and written per batch (RECONCILIATION_BATCH_SIZE)
+            concurrency: PayU queries in flight (RECONCILIATION_CONCURRENCY, capped by the PayU bulkhead)
+            rate_limit: PayU queries per second (RECONCILIATION_RATE_LIMIT, 0 disables the cap)
+            min_age: Seconds a payment stays PENDING before it is queried (RECONCILIATION_MIN_AGE_SECONDS)
+            interval: Seconds between sweeps once the backlog is drained (RECONCILIATION_INTERVAL_SECONDS)
+            repository: PaymentRepository to read and write payments with
+        """
+        self.config = Config()
+        self.batch_size = batch_size or self.config.RECONCILIATION_BATCH_SIZE
+        concurrency = concurrency or self.config.RECONCILIATION_CONCURRENCY
+        if concurrency > PAYU_BULKHEAD_MAX_CONCURRENT:
+            # Extra threads would only be turned away by the bulkhead
+            logger.warning(
+                f"Reconciliation concurrency {concurrency} capped to PAYU_BULKHEAD_MAX_CONCURRENT "
+                f"({PAYU_BULKHEAD_MAX_CONCURRENT})"
+            )
+            concurrency = PAYU_BULKHEAD_MAX_CONCURRENT
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(
+            self.config.RECONCILIATION_RATE_LIMIT if rate_limit is None else rate_limit
+        )
+        self.min_age = self.config.RECONCILIATION_MIN_AGE_SECONDS if min_age is None else min_age
+        self.interval = self.config.RECONCILIATION_INTERVAL_SECONDS if interval is None else interval
+
+        self.repository = repository or PaymentRepository(buffered=False)
+        self.payments = self.repository.payments
+        self.checkpoints = self.repository.db[CHECKPOINT_COLLECTION]
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='reconcile')
+
+        self._stop = threading.Event()
+        self.scanned = 0
+        self.queried = 0
+        self.settled = 0
+        self.errors = 0
+        self.batches = 0
+
+    # --- Checkpoints ---
+
+    def load_checkpoint(self):
+        """(created_at, payment_id) of the last reconciled payment of the current sweep, or None"""
+        doc = self.checkpoints.find_one({'_id': CHECKPOINT_ID})
+        if not doc or doc.get('created_at') is None:
+            return None
+        return doc['created_at'], doc['payment_id']
+
+    def save_checkpoint(self, position):
+        """Record the sweep position; None starts the next sweep from the oldest payment"""
+        created_at, payment_id = position or (None, None)
+        self.checkpoints.update_one(
+            {'_id': CHECKPOINT_ID},
+            {'$set': {'created_at': created_at, 'payment_id': payment_id, 'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    # --- Sweep ---
+
+    def next_batch(self, position, cutoff):
+        """Next page of PENDING payments created before cutoff, after position"""
+        query = {'status': PENDING_STATUS, 'created_at': {'$lte': cutoff}}
+        if position is not None:
+            created_at, payment_id = position
+            query = {
+                '$and': [
+                    query,
+                    {'$or': [
+                        {'created_at': {'$gt': created_at}},
+                        {'created_at': created_at, 'payment_id': {'$gt': payment_id}}
+                    ]}
+                ]
+            }
+        return list(
+            self.payments.find(query, build_projection(RECONCILE_FIELDS))
+            .sort(SWEEP_SORT)
+            .limit(self.batch_size)
+        )
+
+    def query_payment(self, payment):
+        """
+        Ask PayU for a payment's current state
+
+        Returns:
+            (command, transactionResponse or None); None means unknown or still unreachable
+        """
+        details = (payment.get('checkout_response') or {}).get('details') or {}
+        self.rate_limiter.acquire()
+        if details.get('transactionId'):
+            command, response = 'TRANSACTION_RESPONSE_DETAIL', query_transaction(details['transactionId'])
+        elif details.get('orderId'):
+            command, response = 'ORDER_DETAIL', query_order(details['orderId'])
+        elif payment.get('reference_code'):
+            command, response = 'ORDER_DETAIL_BY_REFERENCE_CODE', query_order_by_reference(payment['reference_code'])
+        else:
+            return None, None
+        transaction = settled_transaction(command, response)
+        outcome = transaction['state'].lower() if transaction else 'error'
+        RECONCILIATION_QUERIES.labels(command, outcome).inc()
+        return command, transaction
+
+    def reconcile_batch(self, payments):
+        """
+        Query a batch of PENDING payments and apply the settled ones in one bulk write
+
+        Returns:
+            Number of payments moved out of PENDING
+        """
+        started = time.perf_counter()
+        changes = []
+        now = datetime.utcnow()
+        for payment, (command, transaction) in zip(payments, self.executor.map(self.query_payment, payments)):
+            if command is None:
+                logger.warning(f"Payment {payment['payment_id']} has no PayU identifier to reconcile with")
+                continue
+            self.queried += 1
+            if transaction is None:
+                self.errors += 1
+                continue
+            state = transaction['state']
+            if state == PENDING_STATUS:
+                continue
+            changes.append((payment, state, {
+                'reconciled_at': now,
+                'payu_response_code': transaction.get('responseCode')
+            }))
+
+        applied = self.repository.apply_status_changes(changes)
+        for _, status, _ in applied:
+            RECONCILIATION_UPDATES.labels(status).inc()
+        RECONCILIATION_BATCH_SECONDS.observe(time.perf_counter() - started)
+        RECONCILIATION_OLDEST_PENDING_SECONDS.set((now - payments[0]['created_at']).total_seconds())
+
+        self.batches += 1
+        self.scanned += len(payments)
+        self.settled += len(applied)
+        return len(applied)
+
+    def sweep(self):
+        """
+        Reconcile every PENDING payment older than min_age, resuming from the checkpoint
+
+        Returns:
+            True if the sweep finished, False if it was stopped
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.min_age)
+        position = self.load_checkpoint()
+        if position is not None:
+            logger.info(f"Resuming reconciliation after {position[1]} ({position[0].isoformat()})")
+        started, scanned = time.monotonic(), self.scanned
+        while True:
+            if self._stop.is_set():
+                return False
+            payments = self.next_batch(position, cutoff)
+            if not payments:
+                break
+            settled = self.reconcile_batch(payments)
+            position = (payments[-1]['created_at'], payments[-1]['payment_id'])
+            self.save_checkpoint(position)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            logger.info(
+                f"Reconciled batch of {len(payments)}: {settled} settled, "
+                f"{(self.scanned - scanned) / elapsed:.1f} payments/s this sweep"
+            )
+            if len(payments) < self.batch_size:
+                break
+        self.save_checkpoint(None)
+        logger.info(
+            f"Reconciliation sweep done: {self.scanned - scanned} payment(s) in {time.monotonic() - started:.1f}s"
+        )
+        return True
+
+    def run(self, once=False):
+        """Sweep until stop() is called (or a single sweep when once is True)"""
+        logger.info(
+            f"Reconciliation worker started (batch={self.batch_size}, concurrency={self.concurrency}, "
+            f"rate={self.rate_limiter.rate}/s)"
+        )
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Reconciliation error: {str(e)}")
+                if once:
+                    break
+                self._stop.wait(self.interval)
+        finally:
+            logger.info(f"Reconciliation worker stopped: {self.stats()}")
+
+    def stats(self):
+        return {
+            'scanned': self.scanned,
+            'queried': self.queried,
+            'settled': self.settled,
+            'errors': self.errors,
+            'batches': self.batches
+        }
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.repository.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile PENDING payments with PayU")
+    parser.add_argument('--once', action='store_true', help='Run a single sweep and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = Config()
+    if config.RECONCILIATION_METRICS_PORT:
+        start_metrics_server(config.RECONCILIATION_METRICS_PORT)
+    reconciler = PaymentReconciler()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: reconciler.stop())
+    try:
+        reconciler.run(once=args.once)
+    finally:
+        reconciler.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# El código del servicio usa imports relativos a src/ (como en la imagen, WORKDIR /app)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
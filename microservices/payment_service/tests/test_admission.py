@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from services.admission import AdmissionController
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'admission.db')
+
+
+def controller(db_path, **limits):
+    settings = dict(user_rate=1, user_burst=2, ip_rate=1, ip_burst=3, max_in_flight=0)
+    settings.update(limits)
+    return AdmissionController(path=db_path, **settings)
+
+
+def test_user_bucket_limits_a_burst(db_path):
+    admission = controller(db_path)
+    assert admission.admit('buyer@example.com', '203.0.113.1').admitted
+    assert admission.admit('buyer@example.com', '203.0.113.2').admitted
+
+    rejected = admission.admit('buyer@example.com', '203.0.113.3')
+    assert not rejected.admitted
+    assert rejected.reason == 'rate_limited'
+    assert rejected.retry_after == 1
+    # Other users are not affected
+    assert admission.admit('other@example.com', '203.0.113.3').admitted
+
+
+def test_ip_bucket_limits_rotating_users(db_path):
+    admission = controller(db_path)
+    for n in range(3):
+        assert admission.admit(f'bot{n}@example.com', '203.0.113.9').admitted
+    assert admission.admit('bot3@example.com', '203.0.113.9').reason == 'rate_limited'
+
+
+def test_rejected_checkout_does_not_spend_other_tokens(db_path):
+    admission = controller(db_path, ip_burst=1)
+    assert admission.admit('a@example.com', '203.0.113.9').admitted
+    # Rejected by its IP: the user keeps both tokens for other IPs
+    assert not admission.admit('b@example.com', '203.0.113.9').admitted
+    assert admission.admit('b@example.com', '203.0.113.10').admitted
+    assert admission.admit('b@example.com', '203.0.113.11').admitted
+
+
+def test_buckets_are_shared_between_controllers(db_path):
+    # Two controllers on the same file stand in for two gunicorn workers
+    first, second = controller(db_path), controller(db_path)
+    assert first.admit('buyer@example.com').admitted
+    assert second.admit('buyer@example.com').admitted
+    assert not first.admit('buyer@example.com').admitted
+
+
+def test_in_flight_limit_answers_busy_until_a_slot_is_released(db_path):
+    admission = controller(db_path, user_rate=0, ip_rate=0, max_in_flight=2)
+    slots = [admission.admit('buyer@example.com').slot for _ in range(2)]
+    assert all(slots)
+
+    busy = admission.admit('buyer@example.com')
+    assert not busy.admitted
+    assert busy.reason == 'busy'
+    assert admission.in_flight() == 2
+
+    admission.release(slots[0])
+    assert admission.admit('buyer@example.com').admitted
+
+
+def test_expired_slots_are_freed(db_path):
+    admission = controller(db_path, user_rate=0, ip_rate=0, max_in_flight=1, slot_ttl=-1)
+    assert admission.admit().admitted
+    assert admission.admit().admitted
+
+
+def test_database_errors_admit_the_checkout(db_path, monkeypatch):
+    admission = controller(db_path, max_in_flight=1)
+
+    def broken(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(admission, '_admit', broken)
+    result = admission.admit('buyer@example.com', '203.0.113.1')
+    assert result.admitted
+    assert result.slot is None
+    assert admission.stats()['decisions'] == {'error': 1}
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import pytest
+
+from repository.checkout_jobs import CheckoutJobStore
+from services.checkout_queue import DONE, PROCESSING, AsyncCheckoutQueue, CheckoutQueue
+
+
+class FakeCollection:
+    """checkout_jobs shared by every queue of the test"""
+
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.Lock()
+
+    def insert_one(self, doc):
+        with self.lock:
+            self.docs[doc['_id']] = dict(doc)
+
+    def update_one(self, query, update):
+        with self.lock:
+            self.docs[query['_id']].update(update['$set'])
+
+    def find_one(self, query):
+        with self.lock:
+            doc = self.docs.get(query['_id'])
+            return dict(doc) if doc else None
+
+
+@pytest.fixture
+def job_store():
+    return CheckoutJobStore(FakeCollection())
+
+
+def wait_done(queue, checkout_id):
+    for _ in range(200):
+        job = queue.get(checkout_id)
+        if job['status'] == DONE:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError('checkout did not finish')
+
+
+def test_other_worker_sees_processing_then_result(job_store):
+    # Two queues sharing the store stand in for two gunicorn workers
+    owner = CheckoutQueue(max_workers=1, max_pending=0, job_store=job_store)
+    other = CheckoutQueue(max_workers=1, max_pending=0, job_store=job_store)
+    release = threading.Event()
+
+    def checkout():
+        release.wait(2)
+        return {'status': 'APPROVED'}, 200
+
+    checkout_id = owner.submit(checkout)
+    assert other.get(checkout_id)['status'] == PROCESSING
+
+    release.set()
+    job = wait_done(other, checkout_id)
+    assert job['result'] == ({'status': 'APPROVED'}, 200)
+    owner.shutdown()
+    other.shutdown()
+
+
+def test_unknown_checkout_is_none(job_store):
+    queue = CheckoutQueue(job_store=job_store)
+    assert queue.get('missing') is None
+    queue.shutdown()
+
+
+def test_store_outage_keeps_the_job_local():
+    class DownStore:
+        def __getattr__(self, name):
+            def fail(*args):
+                raise ConnectionError('mongo down')
+            return fail
+
+    queue = CheckoutQueue(max_workers=1, max_pending=0, job_store=DownStore())
+    checkout_id = queue.submit(lambda: ({'status': 'APPROVED'}, 200))
+    assert wait_done(queue, checkout_id)['result'] == ({'status': 'APPROVED'}, 200)
+    assert queue.get('missing') is None
+    queue.shutdown()
+
+
+def test_async_queue_shares_the_result(job_store):
+    async def scenario():
+        owner = AsyncCheckoutQueue(job_store=job_store)
+        other = AsyncCheckoutQueue(job_store=job_store)
+
+        async def checkout():
+            return {'status': 'APPROVED'}, 200
+
+        checkout_id = await owner.submit(checkout)
+        assert (await other.get(checkout_id))['status'] == PROCESSING
+        for _ in range(100):
+            job = await other.get(checkout_id)
+            if job['status'] == DONE:
+                return job
+            await asyncio.sleep(0.01)
+
+    job = asyncio.run(scenario())
+    assert job['result'] == ({'status': 'APPROVED'}, 200)
@@ -0,0 +1,52 @@
+import pytest
+
+from services.confirmations import verify_confirmation
+from services.payment_service import PAYU_MD5_KEY, PAYU_MERCHANT_ID
+from utils.payu_utils import generate_confirmation_signature
+
+
+def signed(**overrides):
+    # Overrides are applied after signing
+    form = {
+        'merchant_id': PAYU_MERCHANT_ID,
+        'reference_sale': 'ORDER-CC-42',
+        'value': '10000.00',
+        'currency': 'COP',
+        'state_pol': '4',
+        'transaction_id': 't-1'
+    }
+    form['sign'] = generate_confirmation_signature(
+        form['merchant_id'], form['reference_sale'], form['value'], form['currency'],
+        form['state_pol'], PAYU_MD5_KEY
+    )
+    form.update(overrides)
+    return form
+
+
+def test_authentic_confirmation_is_accepted():
+    assert verify_confirmation(signed()) is None
+
+
+def test_signature_is_compared_case_insensitively():
+    form = signed()
+    assert verify_confirmation(dict(form, sign=form['sign'].upper())) is None
+
+
+@pytest.mark.parametrize('field', ['merchant_id', 'reference_sale', 'value', 'sign', 'transaction_id'])
+def test_missing_field_is_rejected(field):
+    form = signed()
+    del form[field]
+    assert verify_confirmation(form) == f"Faltan campos: {field}"
+
+
+def test_unknown_merchant_is_rejected():
+    assert verify_confirmation(signed(merchant_id='1')) == "merchant_id desconocido"
+
+
+def test_tampered_state_is_rejected():
+    # Signed as approved (4), delivered as declined (6)
+    assert verify_confirmation(signed(state_pol='6')) == "Firma inválida"
+
+
+def test_unparseable_value_is_rejected():
+    assert verify_confirmation(signed(value='diez mil')) == "value inválido"
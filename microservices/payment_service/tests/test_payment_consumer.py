@@ -0,0 +1,248 @@
+import json
+
+import pika
+import pytest
+import requests
+
+import services.payment_service as payment_service
+from events.payment_consumer import PaymentConsumer
+from services.checkout import InvalidPaymentRequest, PaymentGatewayUnavailable
+from services.idempotency import IdempotencyStore
+
+CHECKOUT = {
+    'paymentMethod': 'CC',
+    'order': {'orderId': 42, 'amount': 10000},
+    'user': {
+        'email': 'buyer@example.com', 'fullName': 'Ana Pérez', 'contactPhone': '3001234567',
+        'dniNumber': '123456789', 'shippingAddress': {'street1': 'Calle 1', 'city': 'Bogotá'}
+    },
+    'card': {
+        'number': '4111111111111111', 'securityCode': '123', 'expirationDate': '2030/12',
+        'cardHolderName': 'ANA PEREZ'
+    }
+}
+
+APPROVED = {
+    'code': 'SUCCESS',
+    'transactionResponse': {'state': 'APPROVED', 'transactionId': 't-1', 'responseMessage': 'ok'}
+}
+
+
+class FakeLoop:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.append(callback)
+
+    def call_later(self, delay, callback):
+        pass
+
+    def run_pending(self):
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+
+class FakeConnection:
+    is_open = True
+
+    def __init__(self):
+        self.ioloop = FakeLoop()
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self):
+        self.published = []
+        self.headers = []
+        self.acks = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((exchange, routing_key, json.loads(body)))
+        self.headers.append(properties.headers or {})
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+
+class AckFrame:
+    def __init__(self, delivery_tag):
+        self.method = type('Method', (), {'NAME': 'Basic.Ack', 'delivery_tag': delivery_tag, 'multiple': True})()
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    calls = []
+
+    def build_cc_payload(order_data, user_data, card_data, client_data):
+        calls.append(order_data['orderId'])
+        return APPROVED
+
+    monkeypatch.setattr(payment_service, 'build_cc_payload', build_cc_payload)
+    return calls
+
+
+@pytest.fixture
+def gateway_down(monkeypatch):
+    calls = []
+
+    def post(payload, command, api_url=None):
+        calls.append(command)
+        raise requests.exceptions.ConnectionError('connection refused')
+
+    monkeypatch.setattr(payment_service, '_post', post)
+    return calls
+
+
+def test_process_payment_unwraps_producer_envelope(submitted):
+    service = payment_service.PaymentService(IdempotencyStore())
+    result = service.process_payment({'event_type': 'request', 'data': CHECKOUT})
+
+    assert result['order_id'] == 42
+    assert result['payment_id'] == 'ORDER-CC-42'
+    assert result['status'] == 'APPROVED'
+
+
+def test_process_payment_submits_an_order_once(submitted):
+    service = payment_service.PaymentService(IdempotencyStore())
+    service.process_payment(CHECKOUT)
+    service.process_payment(CHECKOUT)
+
+    assert submitted == [42]
+
+
+def test_process_payment_rejects_invalid_request():
+    with pytest.raises(InvalidPaymentRequest):
+        payment_service.PaymentService(IdempotencyStore()).process_payment({'order_id': 1})
+
+
+def test_process_payment_raises_when_payu_is_unreachable(gateway_down):
+    service = payment_service.PaymentService(IdempotencyStore())
+    with pytest.raises(PaymentGatewayUnavailable):
+        service.process_payment(CHECKOUT)
+
+    # The failed attempt is not cached: the retry reaches PayU again
+    with pytest.raises(PaymentGatewayUnavailable):
+        service.process_payment(CHECKOUT)
+    assert gateway_down == ['SUBMIT_TRANSACTION', 'SUBMIT_TRANSACTION']
+
+
+def test_consumer_acks_request_after_response_is_confirmed(submitted):
+    consumer = PaymentConsumer(workers=0)
+    consumer.payment_service = payment_service.PaymentService(IdempotencyStore())
+    consumer.connection = FakeConnection()
+    channel = consumer.channel = FakeChannel()
+
+    method = type('Method', (), {'delivery_tag': 1})()
+    consumer.callback(channel, method, pika.BasicProperties(correlation_id='c-1'), json.dumps(CHECKOUT).encode())
+    consumer.connection.ioloop.run_pending()
+
+    (exchange, routing_key, response), = channel.published
+    assert (exchange, routing_key) == ('payment_exchange', 'payment.response')
+    assert response['order_id'] == 42
+    assert response['payment_id'] == 'ORDER-CC-42'
+    assert response['status'] == 'APPROVED'
+    assert channel.acks == []
+
+    consumer._on_delivery_confirmation(AckFrame(consumer._publish_seq))
+    assert channel.acks == [(1, True)]
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+
+def test_closed_channel_frees_dispatch_slots(submitted):
+    consumer = PaymentConsumer(workers=1)
+    consumer.payment_service = payment_service.PaymentService(IdempotencyStore())
+    consumer.connection = FakeConnection()
+    consumer.channel = FakeChannel()
+    consumer.executor = FakeExecutor()
+
+    for tag in (1, 2):
+        method = type('Method', (), {'delivery_tag': tag})()
+        consumer.callback(consumer.channel, method, pika.BasicProperties(), json.dumps(CHECKOUT).encode())
+    assert consumer._running == 1 and len(consumer.executor.jobs) == 1
+
+    consumer._on_channel_closed(consumer.channel, 'connection reset')
+    assert consumer._running == 0
+    assert consumer.stats.snapshot()['in_flight'] == 1
+
+    # The worker result of the lost channel is counted but not published
+    fn, args = consumer.executor.jobs.pop()
+    fn(*args)
+    assert consumer.stats.snapshot()['in_flight'] == 0
+    assert consumer.connection.ioloop.callbacks == []
+
+    # The reopened channel dispatches again
+    consumer.channel = FakeChannel()
+    method = type('Method', (), {'delivery_tag': 1})()
+    consumer.callback(consumer.channel, method, pika.BasicProperties(), json.dumps(CHECKOUT).encode())
+    assert consumer._running == 1 and len(consumer.executor.jobs) == 1
+
+
+def test_consumer_reconnects_until_stopped(monkeypatch):
+    consumer = PaymentConsumer(workers=0)
+    attempts = []
+
+    class DroppedLoop(FakeLoop):
+        def start(self):
+            attempts.append(1)
+            if len(attempts) == 3:
+                consumer.stop()
+
+    def connect():
+        consumer.connection = FakeConnection()
+        consumer.connection.ioloop = DroppedLoop()
+
+    monkeypatch.setattr(consumer, 'connect', connect)
+    monkeypatch.setattr('events.payment_consumer.random.uniform', lambda low, high: 0.001)
+    consumer.start_consuming()
+
+    assert len(attempts) == 3
+    assert consumer.reconnects == 2
+
+
+def test_consumer_moves_request_to_retry_tier_when_payu_is_unreachable(gateway_down):
+    consumer = PaymentConsumer(workers=0)
+    consumer.payment_service = payment_service.PaymentService(IdempotencyStore())
+    consumer.connection = FakeConnection()
+    channel = consumer.channel = FakeChannel()
+
+    method = type('Method', (), {'delivery_tag': 1})()
+    consumer.callback(channel, method, pika.BasicProperties(), json.dumps(CHECKOUT).encode())
+    consumer.connection.ioloop.run_pending()
+
+    # No ERROR response: the request goes to the first delay tier of its queue
+    (exchange, routing_key, request), = channel.published
+    assert (exchange, routing_key) == ('payment_retry', 'payment_requests.retry.5000ms')
+    assert request == CHECKOUT
+    assert channel.headers[0]['x-payment-attempts'] == 1
+    assert channel.headers[0]['x-payment-error'].startswith('PaymentGatewayUnavailable')
+    assert channel.acks == []
+
+    # The delivery is acked only once the retry copy is confirmed
+    consumer._on_delivery_confirmation(AckFrame(consumer._publish_seq))
+    assert channel.acks == [(1, True)]
+
+
+def test_consumer_dead_letters_invalid_request_at_once():
+    consumer = PaymentConsumer(workers=0)
+    consumer.payment_service = payment_service.PaymentService(IdempotencyStore())
+    consumer.connection = FakeConnection()
+    channel = consumer.channel = FakeChannel()
+
+    method = type('Method', (), {'delivery_tag': 1})()
+    consumer.callback(channel, method, pika.BasicProperties(), json.dumps({'order_id': 1}).encode())
+    consumer.connection.ioloop.run_pending()
+
+    (exchange, routing_key, _), = channel.published
+    assert (exchange, routing_key) == ('payment_retry', 'dlq')
@@ -0,0 +1,50 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from events.retry_lanes import DEAD_LETTER_ROUTING_KEY, retry_route
+from services.checkout import InvalidPaymentRequest, PaymentGatewayUnavailable
+
+CONFIG = SimpleNamespace(
+    PAYMENT_QUEUE='payment_requests',
+    PAYMENT_RETRY_DELAYS_MS=[5000, 30000, 120000],
+    PAYMENT_RETRY_MAX_ATTEMPTS=5
+)
+
+
+@pytest.mark.parametrize('attempts, expected', [
+    (1, ('payment_requests.retry.5000ms', '5000ms')),
+    (2, ('payment_requests.retry.30000ms', '30000ms')),
+    (3, ('payment_requests.retry.120000ms', '120000ms')),
+    # Beyond the last tier the longest delay is reused
+    (4, ('payment_requests.retry.120000ms', '120000ms')),
+])
+def test_retryable_errors_move_up_the_delay_tiers(attempts, expected):
+    assert retry_route(CONFIG, attempts, PaymentGatewayUnavailable('down')) == expected
+
+
+def test_retry_stays_in_the_lane_it_came_from():
+    assert retry_route(CONFIG, 1, requests.ConnectionError(), queue='payment_requests.high') == (
+        'payment_requests.high.retry.5000ms', '5000ms'
+    )
+
+
+def test_exhausted_attempts_go_to_the_dead_letter_queue():
+    route = retry_route(CONFIG, CONFIG.PAYMENT_RETRY_MAX_ATTEMPTS, PaymentGatewayUnavailable('down'))
+    assert route == (DEAD_LETTER_ROUTING_KEY, DEAD_LETTER_ROUTING_KEY)
+
+
+@pytest.mark.parametrize('error', [
+    json.JSONDecodeError('Expecting value', '', 0),
+    UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte'),
+    InvalidPaymentRequest('paymentMethod debe ser CC o PSE'),
+])
+def test_non_retryable_errors_go_to_the_dead_letter_queue_at_once(error):
+    assert retry_route(CONFIG, 1, error) == (DEAD_LETTER_ROUTING_KEY, DEAD_LETTER_ROUTING_KEY)
+
+
+def test_without_delay_tiers_failures_are_dead_lettered():
+    config = SimpleNamespace(**dict(vars(CONFIG), PAYMENT_RETRY_DELAYS_MS=[]))
+    assert retry_route(config, 1, PaymentGatewayUnavailable('down'))[0] == DEAD_LETTER_ROUTING_KEY
@@ -0,0 +1,111 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+from repository.write_buffer import PaymentWriteBuffer
+
+
+class BulkResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class FakeCollection:
+    """Applies bulk writes to a dict; find can be made to fail"""
+
+    def __init__(self, docs=()):
+        self.docs = {doc['payment_id']: dict(doc) for doc in docs}
+        self.find_error = None
+        self.batch_lookup_error = None
+        self.concurrent_status = None
+
+    def bulk_write(self, requests, ordered=False):
+        if self.concurrent_status is not None:
+            # Another writer changes p1 between the pre-image read and the batch
+            self.docs['p1']['status'], self.concurrent_status = self.concurrent_status, None
+        matched = 0
+        for request in requests:
+            if hasattr(request, '_filter'):
+                doc = self.docs.get(request._filter['payment_id'])
+                if doc is not None and all(doc.get(k) == v for k, v in request._filter.items()):
+                    doc.update(request._doc['$set'])
+                    matched += 1
+            else:
+                self.docs[request._doc['payment_id']] = dict(request._doc)
+        return BulkResult(matched)
+
+    def find(self, query, projection=None):
+        if self.find_error is not None:
+            raise self.find_error
+        if self.batch_lookup_error is not None and 'status_batch_id' in query:
+            raise self.batch_lookup_error
+        ids = query['payment_id']['$in']
+        return [
+            dict(doc) for payment_id, doc in self.docs.items()
+            if payment_id in ids and all(doc.get(k) == v for k, v in query.items() if k != 'payment_id')
+        ]
+
+
+@pytest.fixture
+def collection():
+    return FakeCollection([{'payment_id': 'p1', 'status': 'PROCESSING', 'amount': 5}])
+
+
+def test_failed_lookup_fails_the_batch_and_keeps_the_flusher(collection):
+    buffer = PaymentWriteBuffer(collection, max_delay=0.001)
+    collection.find_error = AutoReconnect('connection reset')
+
+    # Matches nothing, so the buffer looks up which payments exist
+    with pytest.raises(AutoReconnect):
+        buffer.update_status('missing', {'status': 'APPROVED'}).result(timeout=2)
+
+    collection.find_error = None
+    assert buffer.update_status('p1', {'status': 'APPROVED'}).result(timeout=2) is True
+    assert buffer.stats()['errors'] == 1
+    buffer.close()
+
+
+def test_failed_pre_image_read_fails_only_its_batch(collection):
+    changes = []
+    buffer = PaymentWriteBuffer(collection, max_delay=0.001, on_updated=changes.extend)
+    collection.find_error = AutoReconnect('connection reset')
+
+    with pytest.raises(AutoReconnect):
+        buffer.update_status('p1', {'status': 'APPROVED'}).result(timeout=2)
+    assert collection.docs['p1']['status'] == 'PROCESSING'
+
+    collection.find_error = None
+    assert buffer.update_status('p1', {'status': 'APPROVED'}).result(timeout=2) is True
+    assert [(before['status'], after['status']) for before, after in changes] == [('PROCESSING', 'APPROVED')]
+    buffer.close()
+
+
+def test_update_of_unknown_payment_resolves_false(collection):
+    buffer = PaymentWriteBuffer(collection, max_delay=0.001)
+    assert buffer.update_status('missing', {'status': 'APPROVED'}).result(timeout=2) is False
+    buffer.close()
+
+
+def test_raced_update_is_rewritten_against_a_fresh_pre_image(collection):
+    changes = []
+    buffer = PaymentWriteBuffer(collection, max_delay=0.001, on_updated=changes.extend)
+    collection.concurrent_status = 'DECLINED'
+
+    assert buffer.update_status('p1', {'status': 'APPROVED'}).result(timeout=2) is True
+    assert [(before['status'], after['status']) for before, after in changes] == [('DECLINED', 'APPROVED')]
+    assert buffer.stats()['requeuedUpdates'] == 1
+    buffer.close()
+
+
+def test_failed_race_lookup_fails_the_batch_and_keeps_the_flusher(collection):
+    changes = []
+    buffer = PaymentWriteBuffer(collection, max_delay=0.001, on_updated=changes.extend)
+    collection.concurrent_status = 'DECLINED'
+    collection.batch_lookup_error = AutoReconnect('connection reset')
+
+    with pytest.raises(AutoReconnect):
+        buffer.update_status('p1', {'status': 'APPROVED'}).result(timeout=2)
+
+    collection.batch_lookup_error = None
+    assert buffer.update_status('p1', {'status': 'APPROVED'}).result(timeout=2) is True
+    assert [(before['status'], after['status']) for before, after in changes] == [('DECLINED', 'APPROVED')]
+    buffer.close()